@@ -1,61 +1,185 @@
+import bisect
+import os
 import numpy as np
 import soundfile as sf
-from scipy import signal
-from pydub import AudioSegment
+import resampler
+from metrics import RunMetrics
+from noise_bank import mix_at_snr
+from placement import StreamedClip
 
 class AudioProcessor:
-    def __init__(self, config_manager):
+    def __init__(self, config_manager, metrics=None):
         self.config = config_manager
+        self.metrics = metrics if metrics is not None else RunMetrics()
         self.sample_rate = self.config.get_int('AudioProperties', 'sample_rate')
+        # Sample type that recordings are decoded to and clips are mixed in
+        self.dtype = np.dtype(self.config.get('AudioProperties', 'processing_dtype', fallback='float64'))
+        self.output_subtype = self.config.get('Output', 'output_subtype', fallback='PCM_16')
+        self.resample_chunk_seconds = self.config.get_float('Performance', 'resample_chunk_seconds', fallback=60.0)
+        self.region_reads = self.config.get_bool('Performance', 'region_reads', fallback=False)
+        self.region_padding_seconds = self.config.get_int('Performance', 'region_padding_ms', fallback=50) / 1000
+        self.region_merge_gap_seconds = self.config.get_int('Performance', 'region_merge_gap_ms', fallback=1000) / 1000
 
     def read_wav(self, file_path):
-        audio_data, sample_rate = sf.read(file_path)
+        self.metrics.add_bytes_read(os.path.getsize(file_path))
+        with sf.SoundFile(file_path) as sound_file:
+            sample_rate = sound_file.samplerate
+            chunk_frames = int(self.resample_chunk_seconds * sample_rate)
+            if sample_rate != self.sample_rate and sound_file.frames > chunk_frames:
+                # Long recordings are resampled block by block into one output buffer,
+                # so reading them is timed as part of resampling
+                with self.metrics.stage('resample'):
+                    return self.read_resampled_chunked(sound_file, chunk_frames), self.sample_rate
+            with self.metrics.stage('read'):
+                audio_data = sound_file.read(dtype=self.dtype.name)
         if sample_rate != self.sample_rate:
-            audio_data = self.resample(audio_data, sample_rate, self.sample_rate)
+            with self.metrics.stage('resample'):
+                audio_data = self.resample(audio_data, sample_rate, self.sample_rate)
         return audio_data, self.sample_rate
 
+    def read_labeled_audio(self, file_path, annotations, labels):
+        """Read the audio of a recording that segments with the given labels can be cut from.
+
+        With ``region_reads`` only the intervals with those labels (compared case-insensitively)
+        are read, see ``read_regions``. Otherwise the whole recording is decoded.
+        """
+        if not self.region_reads:
+            return self.read_wav(file_path)
+        labels = {label.lower() for label in labels}
+        wanted = np.array([label.lower() in labels for label in annotations.label_names], dtype=bool)
+        wanted = wanted[annotations.label_codes] if len(annotations) else np.zeros(0, dtype=bool)
+        return self.read_regions(file_path, annotations.starts[wanted], annotations.ends[wanted])
+
+    def read_regions(self, file_path, starts, ends):
+        """Read only the spans [starts[i], ends[i]) seconds of a recording, at the target sample rate.
+
+        Spans are padded by ``region_padding_ms`` and merged when less than
+        ``region_merge_gap_ms`` apart, so each merged region costs one seek and one read.
+        Returns a RegionAudio that is sliced with sample positions of the whole
+        recording, like the array ``read_wav`` returns.
+        """
+        with sf.SoundFile(file_path) as sound_file:
+            sample_rate = sound_file.samplerate
+            up, down, _ = resampler.design_filter(sample_rate, self.sample_rate)
+            # Padding also covers the resampling filter, so region samples equal whole-file samples
+            padding = max(int(self.region_padding_seconds * sample_rate), resampler.filter_context(sample_rate, self.sample_rate))
+            merge_gap = int(self.region_merge_gap_seconds * sample_rate)
+
+            regions = []
+            order = np.argsort(starts, kind='stable')
+            region_starts = np.maximum(np.floor(np.asarray(starts)[order] * sample_rate).astype(np.int64) - padding, 0)
+            region_ends = np.minimum(np.ceil(np.asarray(ends)[order] * sample_rate).astype(np.int64) + padding, sound_file.frames)
+            # Region starts are aligned to the resampling ratio so they map to whole output samples
+            region_starts -= region_starts % down
+            for start, end in zip(region_starts.tolist(), region_ends.tolist()):
+                if regions and start - regions[-1][1] <= merge_gap:
+                    regions[-1][1] = max(regions[-1][1], end)
+                elif end > start:
+                    regions.append([start, end])
+
+            offsets, blocks = [], []
+            for start, end in regions:
+                with self.metrics.stage('read'):
+                    sound_file.seek(start)
+                    block = sound_file.read(end - start, dtype=self.dtype.name)
+                self.metrics.add_bytes_read(block.size * _bytes_per_sample(sound_file.subtype))
+                if sample_rate != self.sample_rate:
+                    with self.metrics.stage('resample'):
+                        block = self.resample(block, sample_rate, self.sample_rate)
+                offsets.append(start * up // down)
+                blocks.append(block)
+            num_samples = resampler.output_length(sound_file.frames, sample_rate, self.sample_rate)
+            return RegionAudio(offsets, blocks, num_samples, sound_file.channels), self.sample_rate
+
+    def read_resampled_chunked(self, sound_file, chunk_frames):
+        num_samples = resampler.output_length(sound_file.frames, sound_file.samplerate, self.sample_rate)
+        shape = (num_samples,) if sound_file.channels == 1 else (num_samples, sound_file.channels)
+        audio_data = np.empty(shape, dtype=self.dtype)
+        position = 0
+        for block in resampler.resample_blocks(sound_file.blocks(blocksize=chunk_frames, dtype=self.dtype.name), sound_file.samplerate,
+                                               self.sample_rate, chunk_size=chunk_frames):
+            audio_data[position:position + len(block)] = block
+            position += len(block)
+        return audio_data
+
     def write_wav(self, file_path, audio_data, sample_rate):
-        sf.write(file_path, audio_data, sample_rate)
+        """Write a clip with the configured output subtype.
+
+        A StreamedClip is rendered and written block by block, so memory does not grow
+        with the clip length.
+        """
+        with self.metrics.stage('write'):
+            if isinstance(audio_data, StreamedClip):
+                with sf.SoundFile(file_path, 'w', sample_rate, audio_data.channels, self.output_subtype) as sound_file:
+                    for block in audio_data.blocks():
+                        sound_file.write(block)
+            else:
+                sf.write(file_path, audio_data, sample_rate, subtype=self.output_subtype)
+        self.metrics.add_bytes_written(os.path.getsize(file_path))
 
     def resample(self, audio_data, orig_sr, target_sr):
-        return signal.resample(audio_data, int(len(audio_data) * target_sr / orig_sr))
-
-    def normalize_audio(self, audio_data):
-        return audio_data / np.max(np.abs(audio_data))
-
-    def apply_pitch_shift(self, audio_data, semitones):
-        # Convert numpy array to AudioSegment
-        audio_segment = AudioSegment(
-            audio_data.tobytes(),
-            frame_rate=self.sample_rate,
-            sample_width=audio_data.dtype.itemsize,
-            channels=1
-        )
-        
-        # Apply pitch shift
-        shifted = audio_segment.pitch_shift(semitones)
-        
-        # Convert back to numpy array
-        shifted_array = np.array(shifted.get_array_of_samples())
-        
-        # Ensure the output has the same length as the input
-        if len(shifted_array) > len(audio_data):
-            shifted_array = shifted_array[:len(audio_data)]
-        elif len(shifted_array) < len(audio_data):
-            shifted_array = np.pad(shifted_array, (0, len(audio_data) - len(shifted_array)))
-        
-        return shifted_array
-
-    def apply_time_stretch(self, audio_data, stretch_factor):
-        return signal.resample(audio_data, int(len(audio_data) * stretch_factor))
-
-    def apply_amplitude_modulation(self, audio_data, mod_freq, mod_depth):
-        t = np.arange(len(audio_data)) / self.sample_rate
-        modulation = 1 + mod_depth * np.sin(2 * np.pi * mod_freq * t)
-        return (audio_data * modulation).astype(audio_data.dtype)
-
-    def add_background_noise(self, audio_data, snr_db):
-        signal_power = np.mean(audio_data ** 2)
-        noise_power = signal_power / (10 ** (snr_db / 10))
-        noise = np.random.normal(0, np.sqrt(noise_power), len(audio_data))
-        return audio_data + noise
\ No newline at end of file
+        return resampler.resample(audio_data, orig_sr, target_sr)
+
+    def normalize_audio(self, audio_data, in_place=False):
+        with self.metrics.stage('normalize'):
+            peak = np.max(np.abs(audio_data))
+            if peak == 0:
+                return audio_data
+            if in_place:
+                return np.divide(audio_data, peak, out=audio_data)
+            return audio_data / peak
+
+    def add_background_noise(self, audio_data, snr_db, rng=None, noise=None):
+        """Return audio_data with noise added at snr_db.
+
+        noise defaults to white noise from rng (seed it for reproducible output) and must
+        have the shape of audio_data, which may be mono or multichannel.
+        """
+        if noise is None:
+            rng = rng if rng is not None else np.random.default_rng()
+            noise = rng.standard_normal(audio_data.shape, dtype=np.float32)
+        return mix_at_snr(np.array(audio_data, dtype=np.result_type(audio_data, np.float32))[None], noise[None], [snr_db])[0]
+
+class RegionAudio:
+    """Regions of a recording, sliced with sample positions of the whole recording.
+
+    ``audio[start:end]`` returns the same samples as the fully decoded recording as long as
+    the range lies inside one region. Only the regions are held in memory.
+    """
+
+    def __init__(self, offsets, regions, num_samples, channels):
+        self.offsets = offsets
+        self.regions = regions
+        self.num_samples = num_samples
+        self.channels = channels
+
+    @property
+    def shape(self):
+        return (self.num_samples,) if self.channels == 1 else (self.num_samples, self.channels)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def nbytes(self):
+        return sum(region.nbytes for region in self.regions)
+
+    def __len__(self):
+        return self.num_samples
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("RegionAudio only supports contiguous slices")
+        start, end, _ = key.indices(self.num_samples)
+        end = max(start, end)
+        position = bisect.bisect_right(self.offsets, start) - 1
+        if position >= 0:
+            offset = self.offsets[position]
+            region = self.regions[position]
+            if end <= offset + len(region):
+                return region[start - offset:end - offset]
+        raise IndexError(f"Samples {start}-{end} were not read")
+
+def _bytes_per_sample(subtype):
+    return {'PCM_S8': 1, 'PCM_U8': 1, 'PCM_16': 2, 'PCM_24': 3, 'PCM_32': 4, 'FLOAT': 4, 'DOUBLE': 8}.get(subtype, 2)
@@ -0,0 +1,298 @@
+import argparse
+import configparser
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+import soundfile as sf
+from utils import ensure_dir
+
+# Corpus matrix covered by default: every combination is one benchmark scenario
+DEFAULT_SAMPLE_RATES = [44100, 48000, 96000]
+DEFAULT_CHANNELS = [1, 2]
+DEFAULT_LENGTHS = {'short': 20.0, 'long': 300.0}
+CORPUS_LABELS = ['PC', 'NC', 'MC', 'N']
+CORPUS_MANIFEST = 'corpus.json'
+
+# Pipeline methods timed by the benchmark, as (component, method, stage)
+TIMED_METHODS = [
+    ('audio_processor', 'read_wav', 'read_wav'),
+    ('audio_processor', 'read_labeled_audio', 'read_wav'),
+    ('audio_processor', 'read_regions', 'read_wav'),
+    ('audio_processor', 'resample', 'resample'),
+    ('audio_processor', 'read_resampled_chunked', 'resample'),
+    ('textgrid_handler', 'read_textgrid', 'read_textgrid'),
+    ('synthesis_engine', 'extract_segments', 'extract_segments'),
+    ('synthesis_engine', 'plan_placements', 'plan'),
+    ('synthesis_engine', 'render_plan', 'mix'),
+    ('audio_processor', 'normalize_audio', 'normalize'),
+    ('audio_processor', 'write_wav', 'write_wav'),
+    ('textgrid_handler', 'write_tiers', 'write_textgrid'),
+]
+
+class StageTimer:
+    """Accumulates the time spent in instrumented methods, per stage.
+
+    Times are exclusive: time spent in a nested timed call (e.g. ``resample`` inside
+    ``read_wav``) is counted for the inner stage only, so the stages add up to at most
+    the wall time.
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self._nested = []
+
+    def wrap(self, obj, method_name, stage):
+        method = getattr(obj, method_name)
+
+        def timed(*args, **kwargs):
+            self._nested.append(0.0)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.totals[stage] += elapsed - self._nested.pop()
+                self.calls[stage] += 1
+                if self._nested:
+                    self._nested[-1] += elapsed
+
+        setattr(obj, method_name, timed)
+
+    def summary(self):
+        return {stage: {'seconds': round(self.totals[stage], 6), 'calls': self.calls[stage],
+                        'mean_ms': round(1000 * self.totals[stage] / self.calls[stage], 3)}
+                for stage in self.totals}
+
+def scenario_name(sample_rate, channels, length_name):
+    return f"{'stereo' if channels == 2 else 'mono'}-{sample_rate / 1000:g}k-{length_name}"
+
+def generate_corpus(corpus_dir, num_files, sample_rate, channels, duration_seconds, seed=0, labels=CORPUS_LABELS):
+    """Write num_files synthetic recordings with matching single-tier TextGrids.
+
+    Every recording is covered by back-to-back labeled intervals of 0.1-2.5 s, each holding
+    a harmonic chirp over low background noise. Audio is written block by block, so long,
+    high-rate corpora do not have to fit in memory.
+    """
+    from praatio import textgrid
+
+    manifest = {'num_files': num_files, 'sample_rate': sample_rate, 'channels': channels,
+                'duration_seconds': duration_seconds, 'seed': seed, 'labels': list(labels)}
+    manifest_path = os.path.join(corpus_dir, CORPUS_MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if json.load(f) == manifest:
+                return
+    wav_dir = os.path.join(corpus_dir, 'input_wav')
+    textgrid_dir = os.path.join(corpus_dir, 'input_textgrid')
+    ensure_dir(wav_dir)
+    ensure_dir(textgrid_dir)
+
+    rng = np.random.default_rng(seed)
+    for file_number in range(1, num_files + 1):
+        bounds = [0.0]
+        while bounds[-1] < duration_seconds:
+            bounds.append(bounds[-1] + rng.uniform(0.1, 2.5))
+        bounds[-1] = duration_seconds
+        interval_labels = rng.choice(labels, len(bounds) - 1).tolist()
+
+        with sf.SoundFile(os.path.join(wav_dir, f"{file_number}.wav"), 'w', sample_rate, channels, 'PCM_16') as sound_file:
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                sound_file.write(_chirp(rng, int(round(end * sample_rate)) - int(round(start * sample_rate)),
+                                        sample_rate, channels))
+
+        tier = textgrid.IntervalTier('vocalizations', [(start, end, label) for start, end, label in
+                                                       zip(bounds[:-1], bounds[1:], interval_labels)], 0, duration_seconds)
+        tg = textgrid.Textgrid()
+        tg.addTier(tier)
+        tg.save(os.path.join(textgrid_dir, f"{file_number}.TextGrid"), format="long_textgrid", includeBlankSpaces=True)
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+
+def _chirp(rng, num_samples, sample_rate, channels):
+    t = np.arange(num_samples) / sample_rate
+    f0 = rng.uniform(300, 3000)
+    phase = 2 * np.pi * (f0 * t + rng.uniform(-0.5, 0.5) * f0 * t ** 2)
+    envelope = np.sin(np.pi * np.arange(num_samples) / max(num_samples, 1))
+    tone = envelope * (0.5 * np.sin(phase) + 0.2 * np.sin(2 * phase))
+    audio = tone[:, None] * rng.uniform(0.3, 1.0, channels) + 0.01 * rng.standard_normal((num_samples, channels))
+    return audio.astype(np.float32)
+
+def write_benchmark_config(base_config_path, corpus_dir, work_dir, num_clips, use_segment_bank):
+    """Copy the base config with paths pointing into the corpus and a scratch directory."""
+    parser = configparser.ConfigParser()
+    parser.read(base_config_path)
+    paths = {
+        'input_wav_dir': os.path.join(corpus_dir, 'input_wav'),
+        'input_textgrid_dir': os.path.join(corpus_dir, 'input_textgrid'),
+        'output_wav_dir': os.path.join(work_dir, 'output_wav'),
+        'output_textgrid_dir': os.path.join(work_dir, 'output_textgrid'),
+        'log_dir': os.path.join(work_dir, 'logs'),
+        'segment_bank_dir': os.path.join(work_dir, 'segment_bank'),
+    }
+    for key, path in paths.items():
+        parser['Paths'][key] = path
+    for key in ['output_wav_dir', 'output_textgrid_dir', 'log_dir']:
+        ensure_dir(paths[key])
+    parser['Synthesis']['num_synthetic_files'] = str(num_clips)
+    parser['Synthesis']['use_segment_bank'] = str(use_segment_bank).lower()
+    parser['Output']['output_format'] = 'files'
+    parser['Logging']['verbosity_level'] = '0'
+    config_path = os.path.join(work_dir, 'config.ini')
+    with open(config_path, 'w') as f:
+        parser.write(f)
+    return config_path
+
+def run_scenario(base_config_path, corpus_dir, num_clips, use_segment_bank=False):
+    """Synthesize num_clips files from one corpus in this process and time every stage."""
+    from config import ConfigManager
+    from logger import Logger
+    from segment_bank import SegmentBank
+    from dataset import SyntheticDataset
+    from main import create_synthetic_file
+    from utils import get_files_with_extension
+
+    with tempfile.TemporaryDirectory(prefix='benchmark_') as work_dir:
+        config_manager = ConfigManager(write_benchmark_config(base_config_path, corpus_dir, work_dir, num_clips,
+                                                              use_segment_bank)).snapshot()
+        logger = Logger(0, config_manager.get('Paths', 'log_dir'))
+        wav_files = sorted(get_files_with_extension(config_manager.get('Paths', 'input_wav_dir'), '.wav'))
+        dataset = SyntheticDataset(config_manager, logger, wav_files=wav_files)
+
+        timer = StageTimer()
+        for component, method_name, stage in TIMED_METHODS:
+            timer.wrap(getattr(dataset, component), method_name, stage)
+
+        start = time.perf_counter()
+        if use_segment_bank:
+            # The wrapper replaces the classmethod on the class itself, so put the original back
+            load_or_build = SegmentBank.__dict__['load_or_build']
+            timer.wrap(SegmentBank, 'load_or_build', 'build_bank')
+            try:
+                dataset.segment_bank = SegmentBank.load_or_build(
+                    config_manager.get('Paths', 'segment_bank_dir'), wav_files, config_manager.get('Paths', 'input_wav_dir'),
+                    config_manager.get('Paths', 'input_textgrid_dir'), dataset.audio_processor, dataset.textgrid_handler,
+                    config_manager.get_vocalization_labels(), logger)
+            finally:
+                SegmentBank.load_or_build = load_or_build
+        clips_start = time.perf_counter()
+        created = sum(create_synthetic_file(index, config_manager, logger, dataset) for index in range(num_clips))
+        end = time.perf_counter()
+
+        output_bytes = sum(os.path.getsize(entry.path) for key in ['output_wav_dir', 'output_textgrid_dir']
+                           for entry in os.scandir(config_manager.get('Paths', key)))
+
+    stages = timer.summary()
+    stages['other'] = {'seconds': round(max(0.0, end - start - sum(timer.totals.values())), 6)}
+    return {
+        'clips': created,
+        'wall_seconds': round(end - start, 6),
+        'clips_per_second': round(created / (end - clips_start), 3) if end > clips_start else None,
+        'output_bytes': output_bytes,
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1),
+        'stages': stages,
+    }
+
+def run_benchmarks(corpus_root, base_config_path, num_clips, num_files, sample_rates, channel_counts, lengths,
+                   use_segment_bank=False, seed=0):
+    """Generate any missing corpora and benchmark every scenario in a fresh process.
+
+    A fresh process per scenario keeps peak RSS and warm caches from leaking between
+    scenarios.
+    """
+    results = []
+    for sample_rate in sample_rates:
+        for channels in channel_counts:
+            for length_name, duration_seconds in lengths.items():
+                name = scenario_name(sample_rate, channels, length_name)
+                corpus_dir = os.path.join(corpus_root, name)
+                generate_corpus(corpus_dir, num_files, sample_rate, channels, duration_seconds, seed)
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                    result = executor.submit(run_scenario, base_config_path, corpus_dir, num_clips, use_segment_bank).result()
+                result.update(name=name, sample_rate=sample_rate, channels=channels,
+                              duration_seconds=duration_seconds, num_files=num_files)
+                print(f"{name}: {result['clips_per_second']} clips/s, peak RSS {result['peak_rss_mb']} MB")
+                results.append(result)
+    return {'environment': _environment(), 'num_clips': num_clips, 'use_segment_bank': use_segment_bank,
+            'scenarios': results}
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+def compare_results(baseline, candidate):
+    """Print the speedup of candidate over baseline for every scenario both contain."""
+    baseline_scenarios = {scenario['name']: scenario for scenario in baseline['scenarios']}
+    for scenario in candidate['scenarios']:
+        before = baseline_scenarios.get(scenario['name'])
+        if before is None or not before['clips_per_second'] or not scenario['clips_per_second']:
+            continue
+        print(f"{scenario['name']}: {before['clips_per_second']} -> {scenario['clips_per_second']} clips/s "
+              f"({scenario['clips_per_second'] / before['clips_per_second']:.2f}x), "
+              f"peak RSS {before['peak_rss_mb']} -> {scenario['peak_rss_mb']} MB")
+        for stage, timing in scenario['stages'].items():
+            old_seconds = before['stages'].get(stage, {}).get('seconds')
+            if old_seconds:
+                print(f"  {stage}: {old_seconds:.3f}s -> {timing['seconds']:.3f}s ({old_seconds / max(timing['seconds'], 1e-9):.2f}x)")
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Benchmark the synthesis pipeline on generated corpora.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for command in ['generate', 'run']:
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument('corpus_dir', help="directory holding one generated corpus per scenario")
+        subparser.add_argument('--files', type=int, default=5, help="recordings per corpus")
+        subparser.add_argument('--sample-rates', type=int, nargs='+', default=DEFAULT_SAMPLE_RATES)
+        subparser.add_argument('--channels', type=int, nargs='+', choices=[1, 2], default=DEFAULT_CHANNELS)
+        subparser.add_argument('--lengths', nargs='+', choices=list(DEFAULT_LENGTHS), default=list(DEFAULT_LENGTHS))
+        subparser.add_argument('--short-seconds', type=float, default=DEFAULT_LENGTHS['short'])
+        subparser.add_argument('--long-seconds', type=float, default=DEFAULT_LENGTHS['long'])
+        subparser.add_argument('--seed', type=int, default=0)
+    run_parser = subparsers.choices['run']
+    run_parser.add_argument('--clips', type=int, default=20, help="synthetic clips per scenario")
+    run_parser.add_argument('--config', default=os.path.join(script_dir, 'config.ini'),
+                            help="base config; paths are redirected to the corpus and a scratch directory")
+    run_parser.add_argument('--use-segment-bank', action='store_true')
+    run_parser.add_argument('--output', help="write results as JSON to this file")
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.baseline) as f, open(args.candidate) as g:
+            compare_results(json.load(f), json.load(g))
+        sys.exit(0)
+
+    lengths = {'short': args.short_seconds, 'long': args.long_seconds}
+    lengths = {name: lengths[name] for name in args.lengths}
+    if args.command == 'generate':
+        for sample_rate in args.sample_rates:
+            for channels in args.channels:
+                for length_name, duration_seconds in lengths.items():
+                    generate_corpus(os.path.join(args.corpus_dir, scenario_name(sample_rate, channels, length_name)),
+                                    args.files, sample_rate, channels, duration_seconds, args.seed)
+    else:
+        results = run_benchmarks(args.corpus_dir, args.config, args.clips, args.files, args.sample_rates,
+                                 args.channels, lengths, args.use_segment_bank, args.seed)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
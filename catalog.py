@@ -0,0 +1,188 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import soundfile as sf
+from utils import ensure_dir
+
+WAV_EXTENSION = '.wav'
+TEXTGRID_EXTENSION = '.TextGrid'
+
+class CorpusCatalog:
+    """The paired input recordings of a corpus with their audio properties and label statistics.
+
+    ``entries`` maps the path of every recording, relative to the input WAV directory, to
+    the path of its TextGrid relative to the input TextGrid directory, their file sizes and
+    modification times, the properties read from the WAV header
+    (frames, sample_rate, channels, subtype, duration) and per-label [count, seconds] of
+    its TextGrid. Recordings are found by a recursive walk, and a recording is paired with
+    the TextGrid at the same relative path. Recordings without a TextGrid, TextGrids
+    without a recording and files that cannot be read are left out of the catalog.
+    """
+
+    VERSION = 2
+
+    def __init__(self, input_wav_dir, input_textgrid_dir, entries, unpaired=(), unreadable=()):
+        self.input_wav_dir = input_wav_dir
+        self.input_textgrid_dir = input_textgrid_dir
+        self.entries = entries
+        self.unpaired = list(unpaired)
+        self.unreadable = list(unreadable)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def wav_files(self):
+        return sorted(self.entries)
+
+    def textgrid_files(self):
+        """Map every recording to the TextGrid it is paired with, both as relative paths."""
+        return {wav_path: entry['textgrid_path'] for wav_path, entry in self.entries.items()}
+
+    def summary(self):
+        """Totals over the catalog: recordings, hours, sample rates, channel counts and labels."""
+        labels = {}
+        for entry in self.entries.values():
+            for label, (count, seconds) in entry['labels'].items():
+                totals = labels.setdefault(label, [0, 0.0])
+                totals[0] += count
+                totals[1] += seconds
+        return {
+            'recordings': len(self.entries),
+            'hours': round(sum(entry['duration'] for entry in self.entries.values()) / 3600, 3),
+            'sample_rates': _value_counts(entry['sample_rate'] for entry in self.entries.values()),
+            'channels': _value_counts(entry['channels'] for entry in self.entries.values()),
+            'labels': {label: {'count': count, 'seconds': round(seconds, 3)} for label, (count, seconds) in sorted(labels.items())},
+        }
+
+    def save(self, catalog_path):
+        ensure_dir(os.path.dirname(os.path.abspath(catalog_path)))
+        catalog = {'version': self.VERSION, 'input_wav_dir': os.path.abspath(self.input_wav_dir),
+                   'input_textgrid_dir': os.path.abspath(self.input_textgrid_dir), 'entries': self.entries}
+        # Publish atomically, so an interrupted save leaves the previous catalog intact
+        temp_path = f"{catalog_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(catalog, f)
+        os.replace(temp_path, catalog_path)
+
+    @classmethod
+    def load(cls, catalog_path, input_wav_dir, input_textgrid_dir):
+        """Load a saved catalog, or return None if it is missing or describes other directories."""
+        if not os.path.exists(catalog_path):
+            return None
+        with open(catalog_path) as f:
+            catalog = json.load(f)
+        if (catalog.get('version') != cls.VERSION or catalog['input_wav_dir'] != os.path.abspath(input_wav_dir)
+                or catalog['input_textgrid_dir'] != os.path.abspath(input_textgrid_dir)):
+            return None
+        return cls(input_wav_dir, input_textgrid_dir, catalog['entries'])
+
+    @classmethod
+    def build(cls, input_wav_dir, input_textgrid_dir, textgrid_handler, logger, previous=None, num_threads=8):
+        """Walk the input directories and catalog every pair.
+
+        Entries of ``previous`` whose recording and TextGrid still have the same size and
+        modification time are reused; only new and changed pairs are probed, in
+        ``num_threads`` threads. Probing reads the WAV header and parses the TextGrid.
+        """
+        wav_stats = _scan(input_wav_dir, WAV_EXTENSION)
+        textgrid_stats = _scan(input_textgrid_dir, TEXTGRID_EXTENSION)
+        textgrid_paths = {path[:-len(TEXTGRID_EXTENSION)]: path for path in textgrid_stats}
+        wav_stems = {path[:-len(WAV_EXTENSION)] for path in wav_stats}
+        unpaired = sorted([path for path in wav_stats if path[:-len(WAV_EXTENSION)] not in textgrid_paths] +
+                          [path for stem, path in textgrid_paths.items() if stem not in wav_stems])
+
+        previous_entries = previous.entries if previous is not None else {}
+        entries, to_probe = {}, []
+        for wav_path, wav_stat in wav_stats.items():
+            textgrid_path = textgrid_paths.get(wav_path[:-len(WAV_EXTENSION)])
+            if textgrid_path is None:
+                continue
+            textgrid_stat = textgrid_stats[textgrid_path]
+            versions = {'textgrid_path': textgrid_path, 'wav_size': wav_stat.st_size, 'wav_mtime_ns': wav_stat.st_mtime_ns,
+                        'textgrid_size': textgrid_stat.st_size, 'textgrid_mtime_ns': textgrid_stat.st_mtime_ns}
+            entry = previous_entries.get(wav_path)
+            if entry is not None and all(entry[key] == value for key, value in versions.items()):
+                entries[wav_path] = entry
+            else:
+                to_probe.append((wav_path, textgrid_path, versions))
+
+        def probe(item):
+            wav_path, textgrid_path, versions = item
+            try:
+                return wav_path, dict(versions, **_probe_pair(os.path.join(input_wav_dir, wav_path),
+                                                             os.path.join(input_textgrid_dir, textgrid_path),
+                                                             textgrid_handler))
+            except Exception as e:
+                logger.warning(f"Skipping unreadable input pair {wav_path}: {e}")
+                return wav_path, None
+
+        num_unchanged = len(entries)
+        unreadable = []
+        # Header reads wait on storage rather than the CPU, so threads overlap them well
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            for wav_path, entry in executor.map(probe, to_probe):
+                if entry is None:
+                    unreadable.append(wav_path)
+                else:
+                    entries[wav_path] = entry
+
+        logger.info(f"Cataloged {len(entries)} input pairs ({num_unchanged} unchanged, {len(entries) - num_unchanged} probed)")
+        if unpaired:
+            logger.warning(f"Skipping {len(unpaired)} unpaired input files: {', '.join(unpaired[:10])}"
+                           f"{' ...' if len(unpaired) > 10 else ''}")
+        return cls(input_wav_dir, input_textgrid_dir, entries, unpaired, unreadable)
+
+    @classmethod
+    def load_or_build(cls, catalog_path, input_wav_dir, input_textgrid_dir, textgrid_handler, logger, num_threads=8):
+        """Refresh the catalog saved at catalog_path, or build it if there is none.
+
+        With catalog_path empty the catalog is built in memory and not saved.
+        """
+        previous = cls.load(catalog_path, input_wav_dir, input_textgrid_dir) if catalog_path else None
+        catalog = cls.build(input_wav_dir, input_textgrid_dir, textgrid_handler, logger, previous, num_threads)
+        if catalog_path:
+            catalog.save(catalog_path)
+        return catalog
+
+def textgrid_file(wav_file, textgrid_files=None):
+    """Relative path of the TextGrid paired with the recording wav_file.
+
+    textgrid_files is a mapping such as ``CorpusCatalog.textgrid_files()``; without one,
+    the TextGrid is the one at the same relative path, as the catalog pairs them.
+    """
+    if textgrid_files is not None:
+        return textgrid_files[wav_file]
+    return wav_file[:-len(WAV_EXTENSION)] + TEXTGRID_EXTENSION
+
+def _scan(directory, extension):
+    """Return {path relative to directory: stat} for the files with extension under directory."""
+    files = {}
+    pending = ['']
+    while pending:
+        relative_dir = pending.pop()
+        with os.scandir(os.path.join(directory, relative_dir)) as entries:
+            for entry in entries:
+                relative_path = os.path.join(relative_dir, entry.name)
+                if entry.is_dir():
+                    pending.append(relative_path)
+                elif entry.name.endswith(extension):
+                    files[relative_path] = entry.stat()
+    return files
+
+def _probe_pair(wav_path, textgrid_path, textgrid_handler):
+    info = sf.info(wav_path)
+    annotations = textgrid_handler.read_textgrid(textgrid_path)
+    counts = np.bincount(annotations.label_codes, minlength=len(annotations.label_names))
+    seconds = np.bincount(annotations.label_codes, weights=annotations.ends - annotations.starts,
+                          minlength=len(annotations.label_names))
+    labels = {label: [int(counts[code]), round(float(seconds[code]), 6)]
+              for code, label in enumerate(annotations.label_names) if label and counts[code]}
+    return {'frames': info.frames, 'sample_rate': info.samplerate, 'channels': info.channels,
+            'subtype': info.subtype, 'duration': info.frames / info.samplerate, 'labels': labels}
+
+def _value_counts(values):
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return dict(sorted(counts.items()))
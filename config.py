@@ -1,7 +1,42 @@
 import configparser
 import os
 
-class ConfigManager:
+class _Settings:
+    """Settings derived from the raw options, shared by ConfigManager and ConfigSnapshot."""
+
+    def get_vocalization_labels(self):
+        return {label.lower(): float(prob) for label, prob in self.as_dict()['VocalizationLabels'].items()}
+
+    def get_audio_effects(self):
+        effects = {}
+        if self.get_bool('AudioEffects', 'apply_effects'):
+            if self.get_bool('AudioEffects', 'pitch_shift'):
+                effects['pitch_shift'] = self.get_float('AudioEffects', 'pitch_shift_semitones')
+            if self.get_bool('AudioEffects', 'time_stretch'):
+                effects['time_stretch'] = self.get_float('AudioEffects', 'time_stretch_factor')
+            if self.get_bool('AudioEffects', 'amplitude_modulation'):
+                effects['amplitude_modulation'] = {
+                    'frequency': self.get_float('AudioEffects', 'amplitude_modulation_frequency'),
+                    'depth': self.get_float('AudioEffects', 'amplitude_modulation_depth')
+                }
+            if self.get_bool('AudioEffects', 'noise', fallback=False):
+                effects['noise'] = self.get_float('AudioEffects', 'noise_snr_db', fallback=30.0)
+        return effects
+
+    def get_background_noise(self):
+        """Settings of the background noise stage, or None when it is disabled."""
+        if not (self.get_bool('AudioEffects', 'apply_effects') and
+                self.get_bool('AudioEffects', 'background_noise', fallback=False)):
+            return None
+        return {
+            'noise_dir': self.get('AudioEffects', 'background_noise_dir', fallback=''),
+            'color': self.get('AudioEffects', 'background_noise_color', fallback='pink'),
+            'seconds': self.get_float('AudioEffects', 'background_noise_seconds', fallback=300.0),
+            'snr_db': (self.get_float('AudioEffects', 'background_noise_snr_db_min', fallback=10.0),
+                       self.get_float('AudioEffects', 'background_noise_snr_db_max', fallback=30.0)),
+        }
+
+class ConfigManager(_Settings):
     def __init__(self, config_file):
         self.config = configparser.ConfigParser()
         if not os.path.exists(config_file):
@@ -28,21 +63,38 @@ class ConfigManager:
         self._validate_float('Synthesis', 'amplitude_scaling', min_value=0, max_value=1)
         self._validate_bool('Synthesis', 'normalize_output')
         self._validate_int('Synthesis', 'silence_duration_ms', min_value=0)
+        self._validate_bool('Synthesis', 'use_segment_bank', required=False)
+        if self.get_bool('Synthesis', 'use_segment_bank', fallback=False):
+            self._validate_string('Paths', 'segment_bank_dir')
 
         # Validate AudioEffects parameters
         self._validate_bool('AudioEffects', 'apply_effects')
         self._validate_bool('AudioEffects', 'pitch_shift')
         self._validate_float('AudioEffects', 'pitch_shift_semitones')
         self._validate_bool('AudioEffects', 'time_stretch')
-        self._validate_float('AudioEffects', 'time_stretch_factor', min_value=0)
+        # Zero would divide by zero in the phase vocoder and shrink every segment to nothing
+        self._validate_float('AudioEffects', 'time_stretch_factor', greater_than=0)
         self._validate_bool('AudioEffects', 'amplitude_modulation')
         self._validate_float('AudioEffects', 'amplitude_modulation_frequency', min_value=0)
         self._validate_float('AudioEffects', 'amplitude_modulation_depth', min_value=0, max_value=1)
+        self._validate_bool('AudioEffects', 'noise', required=False)
+        self._validate_float('AudioEffects', 'noise_snr_db', required=False)
+        self._validate_bool('AudioEffects', 'background_noise', required=False)
+        if self.get_bool('AudioEffects', 'background_noise', fallback=False):
+            self._validate_string('Paths', 'noise_bank_dir')
+            self._validate_choice('AudioEffects', 'background_noise_color', ['white', 'pink', 'brown'], required=False)
+            self._validate_float('AudioEffects', 'background_noise_seconds', min_value=1, required=False)
+            self._validate_float('AudioEffects', 'background_noise_snr_db_min', required=False)
+            self._validate_float('AudioEffects', 'background_noise_snr_db_max', required=False)
+            if (self.get_float('AudioEffects', 'background_noise_snr_db_min', fallback=10.0) >
+                    self.get_float('AudioEffects', 'background_noise_snr_db_max', fallback=30.0)):
+                raise ValueError("'background_noise_snr_db_min' in section 'AudioEffects' must not exceed 'background_noise_snr_db_max'")
 
         # Validate AudioProperties
         self._validate_int('AudioProperties', 'sample_rate', min_value=1)
         self._validate_int('AudioProperties', 'min_segment_length_ms', min_value=1)
         self._validate_int('AudioProperties', 'max_segment_length_ms', min_value=1)
+        self._validate_choice('AudioProperties', 'processing_dtype', ['float32', 'float64'], required=False)
 
         # Validate VocalizationLabels
         for label, prob in self.config['VocalizationLabels'].items():
@@ -55,19 +107,50 @@ class ConfigManager:
 
         # Validate Output
         self._validate_string('Output', 'file_prefix')
+        self._validate_choice('Output', 'output_subtype', ['PCM_16', 'PCM_24', 'PCM_32', 'FLOAT'], required=False)
+        self._validate_float('Output', 'stream_chunk_seconds', min_value=0, required=False)
+        self._validate_bool('Output', 'source_tiers', required=False)
+        self._validate_choice('Output', 'output_format', ['files', 'shards'], required=False)
+        if self.get('Output', 'output_format', fallback='files') == 'shards':
+            self._validate_string('Paths', 'output_shard_dir')
+            self._validate_choice('Output', 'shard_dtype', ['float64', 'float32', 'int16'], required=False)
+            self._validate_int('Output', 'shard_size_mb', min_value=1, required=False)
 
         # Validate Logging
         self._validate_int('Logging', 'verbosity_level', min_value=0, max_value=2)
+        self._validate_bool('Logging', 'collect_metrics', required=False)
+        self._validate_int('Logging', 'profile_clip_index', min_value=-1, required=False)
 
         # Validate Performance
         self._validate_int('Performance', 'thread_count', min_value=1)
+        self._validate_float('Performance', 'resample_chunk_seconds', min_value=1, required=False)
+        self._validate_int('Performance', 'effect_cache_mb', min_value=0, required=False)
+        self._validate_int('Performance', 'effect_cache_disk_mb', min_value=0, required=False)
+        self._validate_bool('Performance', 'region_reads', required=False)
+        self._validate_int('Performance', 'region_padding_ms', min_value=0, required=False)
+        self._validate_int('Performance', 'region_merge_gap_ms', min_value=0, required=False)
+        self._validate_bool('Performance', 'pipeline', required=False)
+        self._validate_int('Performance', 'reader_threads', min_value=1, required=False)
+        self._validate_int('Performance', 'prefetch_depth', min_value=1, required=False)
+        self._validate_int('Performance', 'write_queue_size', min_value=1, required=False)
+        self._validate_int('Performance', 'catalog_threads', min_value=1, required=False)
+        self._validate_int('Performance', 'memory_budget_mb', min_value=0, required=False)
 
     def _validate_path(self, key):
         path = self.config['Paths'][key]
         if not os.path.exists(path):
             raise ValueError(f"Path '{path}' specified for '{key}' does not exist")
 
-    def _validate_int(self, section, key, min_value=None, max_value=None):
+    def _is_missing(self, section, key, required):
+        if self.config.has_option(section, key):
+            return False
+        if required:
+            raise ValueError(f"Missing required option '{key}' in section '{section}'")
+        return True
+
+    def _validate_int(self, section, key, min_value=None, max_value=None, required=True):
+        if self._is_missing(section, key, required):
+            return
         try:
             value = self.config[section].getint(key)
             if min_value is not None and value < min_value:
@@ -77,53 +160,133 @@ class ConfigManager:
         except ValueError:
             raise ValueError(f"Invalid integer value for '{key}' in section '{section}'")
 
-    def _validate_float(self, section, key, min_value=None, max_value=None):
+    def _validate_float(self, section, key, min_value=None, max_value=None, required=True, greater_than=None):
+        if self._is_missing(section, key, required):
+            return
         try:
             value = self.config[section].getfloat(key)
-            if min_value is not None and value < min_value:
-                raise ValueError(f"'{key}' in section '{section}' must be at least {min_value}")
-            if max_value is not None and value > max_value:
-                raise ValueError(f"'{key}' in section '{section}' must be at most {max_value}")
         except ValueError:
             raise ValueError(f"Invalid float value for '{key}' in section '{section}'")
+        if min_value is not None and value < min_value:
+            raise ValueError(f"'{key}' in section '{section}' must be at least {min_value}")
+        if greater_than is not None and value <= greater_than:
+            raise ValueError(f"'{key}' in section '{section}' must be greater than {greater_than}")
+        if max_value is not None and value > max_value:
+            raise ValueError(f"'{key}' in section '{section}' must be at most {max_value}")
 
-    def _validate_bool(self, section, key):
+    def _validate_bool(self, section, key, required=True):
+        if self._is_missing(section, key, required):
+            return
         try:
             self.config[section].getboolean(key)
         except ValueError:
             raise ValueError(f"Invalid boolean value for '{key}' in section '{section}'")
 
-    def _validate_string(self, section, key):
+    def _validate_string(self, section, key, required=True):
+        if self._is_missing(section, key, required):
+            return
         if not self.config[section][key]:
             raise ValueError(f"'{key}' in section '{section}' cannot be empty")
 
-    def get(self, section, key):
+    def _validate_choice(self, section, key, choices, required=True):
+        if self._is_missing(section, key, required):
+            return
+        if self.config[section][key] not in choices:
+            raise ValueError(f"'{key}' in section '{section}' must be one of: {', '.join(choices)}")
+
+    def get(self, section, key, fallback=None):
+        if fallback is not None:
+            return self.config[section].get(key, fallback)
         return self.config[section][key]
 
-    def get_int(self, section, key):
-        return self.config[section].getint(key)
+    def get_int(self, section, key, fallback=None):
+        return self.config[section].getint(key, fallback)
+
+    def get_float(self, section, key, fallback=None):
+        return self.config[section].getfloat(key, fallback)
+
+    def get_bool(self, section, key, fallback=None):
+        return self.config[section].getboolean(key, fallback)
+
+    def as_dict(self):
+        """Every option as {section: {key: value}}, with values as written in the config file."""
+        return {section: dict(self.config[section].items()) for section in self.config.sections()}
 
-    def get_float(self, section, key):
-        return self.config[section].getfloat(key)
+    def snapshot(self):
+        """Freeze the validated configuration into a ConfigSnapshot."""
+        return ConfigSnapshot(self.as_dict())
 
-    def get_bool(self, section, key):
-        return self.config[section].getboolean(key)
+class ConfigSnapshot(_Settings):
+    """Immutable, picklable copy of a validated configuration.
+
+    It answers the same getters as ConfigManager from plain dicts, and every value is
+    parsed once and then remembered, so lookups on the per-clip path cost one dict
+    access. Worker processes receive the snapshot instead of reading and validating the
+    config file again. Derived settings such as ``get_audio_effects()`` are computed once
+    too; callers must not modify what they return.
+    """
+
+    __slots__ = ('_values', '_parsed')
+
+    def __init__(self, values):
+        object.__setattr__(self, '_values', {section: dict(options) for section, options in values.items()})
+        object.__setattr__(self, '_parsed', {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ConfigSnapshot is immutable")
+
+    def __getstate__(self):
+        # Parsed values are cheap to rebuild, so only the options are pickled
+        return self._values
+
+    def __setstate__(self, values):
+        object.__setattr__(self, '_values', values)
+        object.__setattr__(self, '_parsed', {})
+
+    def _lookup(self, section, key, convert, fallback):
+        parsed_key = (section, key, convert)
+        if parsed_key in self._parsed:
+            return self._parsed[parsed_key]
+        value = self._values[section].get(key)
+        if value is None:
+            return fallback
+        value = self._parsed[parsed_key] = convert(value)
+        return value
+
+    def get(self, section, key, fallback=None):
+        if fallback is not None:
+            return self._values[section].get(key, fallback)
+        return self._values[section][key]
+
+    def get_int(self, section, key, fallback=None):
+        return self._lookup(section, key, int, fallback)
+
+    def get_float(self, section, key, fallback=None):
+        return self._lookup(section, key, float, fallback)
+
+    def get_bool(self, section, key, fallback=None):
+        return self._lookup(section, key, _to_bool, fallback)
+
+    def as_dict(self):
+        return {section: dict(options) for section, options in self._values.items()}
 
     def get_vocalization_labels(self):
-        labels = {label.lower(): float(prob) for label, prob in self.config['VocalizationLabels'].items()}
-        print(f"Loaded vocalization labels: {labels}")  # Temporary print statement for debugging
-        return labels
+        return self._derived('vocalization_labels', super().get_vocalization_labels)
 
     def get_audio_effects(self):
-        effects = {}
-        if self.get_bool('AudioEffects', 'apply_effects'):
-            if self.get_bool('AudioEffects', 'pitch_shift'):
-                effects['pitch_shift'] = self.get_float('AudioEffects', 'pitch_shift_semitones')
-            if self.get_bool('AudioEffects', 'time_stretch'):
-                effects['time_stretch'] = self.get_float('AudioEffects', 'time_stretch_factor')
-            if self.get_bool('AudioEffects', 'amplitude_modulation'):
-                effects['amplitude_modulation'] = {
-                    'frequency': self.get_float('AudioEffects', 'amplitude_modulation_frequency'),
-                    'depth': self.get_float('AudioEffects', 'amplitude_modulation_depth')
-                }
-        return effects
\ No newline at end of file
+        return self._derived('audio_effects', super().get_audio_effects)
+
+    def get_background_noise(self):
+        return self._derived('background_noise', super().get_background_noise)
+
+    def _derived(self, name, compute):
+        if name not in self._parsed:
+            self._parsed[name] = compute()
+        return self._parsed[name]
+
+def _to_bool(value):
+    # The same spellings configparser accepts
+    state = configparser.ConfigParser.BOOLEAN_STATES.get(value.lower())
+    if state is None:
+        raise ValueError(f"Not a boolean: {value}")
+    return state
@@ -0,0 +1,132 @@
+import itertools
+import os
+import random
+from audio_processor import AudioProcessor
+from catalog import textgrid_file
+from textgrid_handler import TextGridHandler
+from synthesis_engine import SynthesisEngine
+from metrics import RunMetrics
+from utils import derive_seed, get_files_with_extension
+
+class SyntheticDataset:
+    """Iterable of synthetic clips generated in memory, for feeding training loops directly.
+
+    Clip ``index`` is seeded from ``[Synthesis] random_seed`` and the index alone, so it is
+    identical to the ``synthetic_<index+1>`` file that ``main.py`` writes. With
+    ``num_workers`` > 1, worker ``worker_id`` yields indices worker_id, worker_id +
+    num_workers, ..., which gives every worker a disjoint, reproducible stream of clips.
+    Iteration is endless unless ``num_items`` is given. Stage timings and counters go to
+    ``metrics`` when one is given. With ``stream_outputs`` set (for writing files of
+    ``[Output] stream_chunk_seconds`` > 0), audio is a StreamedClip rendered as it is written.
+    ``textgrid_files`` maps recordings to their TextGrids, as ``CorpusCatalog.textgrid_files()``
+    does; without it every recording is paired with the TextGrid at the same relative path.
+    """
+
+    def __init__(self, config_manager, logger, num_items=None, worker_id=0, num_workers=1, segment_bank=None, wav_files=None,
+                 metrics=None, stream_outputs=False, textgrid_files=None):
+        if not 0 <= worker_id < num_workers:
+            raise ValueError(f"worker_id must be in [0, {num_workers}), got {worker_id}")
+        self.config = config_manager
+        self.logger = logger
+        self.num_items = num_items
+        self.worker_id = worker_id
+        self.num_workers = num_workers
+        self.segment_bank = segment_bank
+        self.random_seed = self.config.get_int('Synthesis', 'random_seed')
+        self.input_wav_dir = self.config.get('Paths', 'input_wav_dir')
+        self.input_textgrid_dir = self.config.get('Paths', 'input_textgrid_dir')
+        if wav_files is None and segment_bank is None:
+            wav_files = sorted(get_files_with_extension(self.input_wav_dir, '.wav'))
+        self.wav_files = wav_files
+        self.textgrid_files = textgrid_files
+        # Intervals of labels that are never drawn need not be read
+        self.read_labels = {label for label, probability in self.config.get_vocalization_labels().items() if probability > 0}
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.stream_outputs = stream_outputs
+
+        self.audio_processor = AudioProcessor(self.config, self.metrics)
+        self.textgrid_handler = TextGridHandler(self.metrics, self.config.get('Paths', 'textgrid_cache_dir', fallback='') or None)
+        self.synthesis_engine = SynthesisEngine(self.config, self.logger, self.audio_processor, self.metrics)
+
+    def shard(self, worker_id, num_workers):
+        """Return a copy of this dataset restricted to one worker's share of the indices."""
+        return SyntheticDataset(self.config, self.logger, self.num_items, worker_id, num_workers,
+                                self.segment_bank, self.wav_files, self.metrics, self.stream_outputs, self.textgrid_files)
+
+    def indices(self):
+        if self.num_items is None:
+            return itertools.count(self.worker_id, self.num_workers)
+        return range(self.worker_id, self.num_items, self.num_workers)
+
+    def __len__(self):
+        if self.num_items is None:
+            raise TypeError("An endless SyntheticDataset has no length")
+        return len(self.indices())
+
+    def __iter__(self):
+        for index in self.indices():
+            try:
+                synthetic_audio, synthetic_intervals, metadata = self.generate(index)
+            except Exception as e:
+                self.logger.error(f"Error generating synthetic clip {index}: {e}")
+                continue
+            if synthetic_audio is not None:
+                yield synthetic_audio, synthetic_intervals, metadata
+
+    def generate(self, index):
+        """Synthesize clip number index, returning (audio, intervals, metadata).
+
+        audio and intervals are None when no usable segments were found.
+        """
+        return self.synthesize(self.prepare(index))
+
+    def prepare(self, index):
+        """Read the inputs clip number index is synthesized from.
+
+        This is the I/O half of ``generate`` and may run ahead of ``synthesize`` in other
+        threads; the source recording is chosen exactly as ``synthesize`` will choose it.
+        """
+        seed = derive_seed(self.random_seed, index)
+        if self.segment_bank is not None:
+            return {'index': index, 'seed': seed, 'source': None}
+
+        # Randomly select an input file
+        source = random.Random(seed).choice(self.wav_files)
+        wav_path = os.path.join(self.input_wav_dir, source)
+        textgrid_path = os.path.join(self.input_textgrid_dir, textgrid_file(source, self.textgrid_files))
+
+        # Read input files; the annotations decide which parts of the recording are needed
+        annotations = self.textgrid_handler.read_textgrid(textgrid_path)
+        audio_data, sample_rate = self.audio_processor.read_labeled_audio(wav_path, annotations, self.read_labels)
+        return {'index': index, 'seed': seed, 'source': source, 'audio_data': audio_data,
+                'sample_rate': sample_rate, 'annotations': annotations}
+
+    def synthesize(self, prepared):
+        """Synthesize a clip from the output of ``prepare``, returning (audio, intervals, metadata)."""
+        self.synthesis_engine.reseed(prepared['seed'])
+
+        if self.segment_bank is not None:
+            # Draw segments from the pre-extracted bank, across all source recordings
+            synthetic_audio, synthetic_intervals = self.synthesis_engine.generate_from_bank(self.segment_bank, self.stream_outputs)
+        else:
+            # Repeat the source draw so the engine's random state continues from it
+            self.synthesis_engine.select_random_file(self.wav_files)
+            synthetic_audio, synthetic_intervals = self.synthesis_engine.generate_single(
+                prepared['audio_data'], prepared['annotations'], prepared['sample_rate'], self.stream_outputs)
+
+        metadata = {
+            'index': prepared['index'],
+            'seed': prepared['seed'],
+            'source': prepared['source'],
+            'sample_rate': self.audio_processor.sample_rate,
+            'worker_id': self.worker_id,
+        }
+        if synthetic_audio is not None:
+            # [source, label, source_start, source_end, offset, gain] of every placed segment
+            metadata['segments'] = self.synthesis_engine.placement_origins()
+            if prepared['source'] is not None:
+                for segment in metadata['segments']:
+                    segment[0] = prepared['source']
+            # Per-source intervals, one tier per position within the overlap groups
+            metadata['source_tiers'] = self.synthesis_engine.source_tiers()
+        return synthetic_audio, synthetic_intervals, metadata
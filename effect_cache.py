@@ -0,0 +1,150 @@
+import fcntl
+import hashlib
+import os
+from collections import OrderedDict
+import numpy as np
+from utils import ensure_dir
+
+class EffectCache:
+    """LRU cache of effect-processed segments with a byte budget and an optional disk tier.
+
+    Entries are keyed by a hashable tuple, normally (segment bank fingerprint, segment id,
+    effect chain parameters). When ``spill_dir`` is set, entries evicted from memory are
+    written there as ``.npy`` instead of being dropped, and ``flush`` writes the entries
+    still in memory at the end of a run, so later runs over the same bank and effect
+    settings start warm. The directory may be shared by several processes and holds at
+    most ``max_spill_bytes`` in total. After spilling, a process takes a lock on the
+    directory and deletes the files used least recently (by modification time, which disk
+    hits refresh) until the directory is within the bound.
+    """
+
+    LOCK_FILE = '.lock'
+
+    def __init__(self, max_bytes, spill_dir=None, max_spill_bytes=0):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir if max_spill_bytes > 0 else None
+        self.max_spill_bytes = max_spill_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        # Bytes in the spill directory when it was last bounded
+        self.spill_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.spill_dir:
+            ensure_dir(self.spill_dir)
+
+    def get(self, key):
+        audio_data = self.entries.get(key)
+        if audio_data is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return audio_data
+        if self.spill_dir:
+            path = self._spill_path(key)
+            try:
+                audio_data = np.load(path)
+                # Mark the file as recently used for bounding the directory
+                os.utime(path)
+            except (FileNotFoundError, ValueError):
+                # Missing, or deleted or cut short by another process bounding the directory
+                audio_data = None
+            if audio_data is not None:
+                audio_data.setflags(write=False)
+                self._insert(key, audio_data)
+                self.disk_hits += 1
+                return audio_data
+        self.misses += 1
+        return None
+
+    def put(self, key, audio_data):
+        audio_data.setflags(write=False)
+        self._insert(key, audio_data)
+
+    def evict(self, num_bytes):
+        """Drop least recently used entries until num_bytes are freed or the cache is empty.
+
+        With a disk tier, dropped entries are spilled to it.
+        """
+        freed = 0
+        spilled = False
+        while self.entries and freed < num_bytes:
+            key, audio_data = self.entries.popitem(last=False)
+            self.current_bytes -= audio_data.nbytes
+            freed += audio_data.nbytes
+            self.evictions += 1
+            spilled = self._spill(key, audio_data) or spilled
+        if spilled:
+            self._bound_spill_dir()
+        return freed
+
+    def flush(self):
+        """Spill every entry still in memory, so the next run finds it on disk."""
+        spilled = False
+        for key, audio_data in self.entries.items():
+            spilled = self._spill(key, audio_data) or spilled
+        if spilled:
+            self._bound_spill_dir()
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'evictions': self.evictions, 'bytes': self.current_bytes, 'entries': len(self.entries),
+                'spill_bytes': self.spill_bytes}
+
+    def _insert(self, key, audio_data):
+        if audio_data.nbytes > self.max_bytes:
+            return
+        if key in self.entries:
+            self.current_bytes -= self.entries.pop(key).nbytes
+        self.entries[key] = audio_data
+        self.current_bytes += audio_data.nbytes
+        if self.current_bytes > self.max_bytes:
+            self.evict(self.current_bytes - self.max_bytes)
+
+    def _spill(self, key, audio_data):
+        """Write an entry to the spill directory, returning whether a file was added."""
+        if not self.spill_dir:
+            return False
+        path = self._spill_path(key)
+        if os.path.exists(path):
+            return False
+        # Processes may write the same entry concurrently; publish it atomically
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.save(f, audio_data)
+        os.replace(temp_path, path)
+        return True
+
+    def _bound_spill_dir(self):
+        # One process at a time sums the directory and deletes its least recently used files
+        with open(os.path.join(self.spill_dir, self.LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            files = []
+            with os.scandir(self.spill_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.npy'):
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        files.append((stat.st_mtime_ns, entry.path, stat.st_size))
+            total = sum(size for _, _, size in files)
+            for _, path, size in sorted(files):
+                if total <= self.max_spill_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self.spill_bytes = total
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.npy')
+
+def format_stats(stats):
+    lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+    hit_rate = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+    return (f"{stats['hits']} memory hits, {stats['disk_hits']} disk hits, {stats['misses']} misses "
+            f"({hit_rate:.1%} hit rate), {stats['evictions']} evictions")
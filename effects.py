@@ -0,0 +1,182 @@
+import numpy as np
+
+class EffectChain:
+    """Vectorized augmentation effects driven by ``ConfigManager.get_audio_effects()``.
+
+    Time stretch and pitch shift share one STFT phase-vocoder pass: the signal is stretched
+    by ``time_stretch * 2 ** (semitones / 12)`` and then resampled by the pitch ratio.
+    Amplitude modulation and noise follow. ``apply_batch`` zero-pads a list of segments into
+    one (rows, samples) float32 array, with one row per channel, so a whole clip's segments
+    go through a single STFT call. Noise is the only random effect and is kept separate
+    (``add_noise_batch``) so the deterministic part can be cached.
+    """
+
+    def __init__(self, effects, sample_rate, n_fft=1024, hop_length=256):
+        self.effects = effects
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.stretch = float(effects.get('time_stretch', 1.0))
+        self.pitch_ratio = 2.0 ** (float(effects.get('pitch_shift', 0.0)) / 12)
+        self.modulation = effects.get('amplitude_modulation')
+        self.noise_snr_db = effects.get('noise')
+        self.window = np.hanning(n_fft + 1)[:-1].astype(np.float32)
+
+    def __bool__(self):
+        return bool(self.effects)
+
+    def output_length(self, length):
+        """Length in samples of a segment of the given length after the chain."""
+        return np.rint(np.asarray(length) * self.stretch).astype(np.int64)
+
+    def cache_key(self):
+        """Parameters that determine the output of the deterministic effects."""
+        modulation = tuple(sorted(self.modulation.items())) if self.modulation else None
+        return (self.sample_rate, self.n_fft, self.hop_length, self.stretch, self.pitch_ratio, modulation)
+
+    @property
+    def is_deterministic(self):
+        return self.stretch != 1.0 or self.pitch_ratio != 1.0 or bool(self.modulation)
+
+    def apply(self, audio_data, rng=None):
+        return self.apply_batch([audio_data], rng)[0]
+
+    def apply_batch(self, segments, rng=None):
+        return self.add_noise_batch(self.transform_batch(segments), rng)
+
+    def transform_batch(self, segments):
+        """Apply the deterministic effects (stretch, pitch, modulation) to a list of segments."""
+        if not segments or not self.is_deterministic:
+            return list(segments)
+        rows, row_lengths = _pack(segments, margin=self.n_fft)
+        if self.stretch != 1.0 or self.pitch_ratio != 1.0:
+            rows = time_stretch(rows, self.stretch * self.pitch_ratio, self.window, self.hop_length)
+            if self.pitch_ratio != 1.0:
+                rows = resample_linear(rows, int(round(rows.shape[1] / self.pitch_ratio)), self.pitch_ratio)
+        if self.modulation:
+            rows = amplitude_modulation(rows, self.sample_rate, self.modulation['frequency'], self.modulation['depth'])
+        return _unpack(rows, segments, self.output_length([len(segment) for segment in segments]))
+
+    def add_noise_batch(self, segments, rng=None):
+        if not segments or self.noise_snr_db is None:
+            return list(segments)
+        rows, row_lengths = _pack(segments)
+        rows = add_noise(rows, row_lengths, self.noise_snr_db, rng if rng is not None else np.random.default_rng())
+        return _unpack(rows, segments, [len(segment) for segment in segments])
+
+def _pack(segments, margin=0):
+    """Zero-pad segments into one (rows, samples) float32 array with one row per channel.
+
+    ``margin`` extra zeros after the longest segment keep every segment's tail away from
+    the array edge, so results do not depend on which other segments share the batch.
+    """
+    channels = [1 if segment.ndim == 1 else segment.shape[1] for segment in segments]
+    lengths = np.array([len(segment) for segment in segments], dtype=np.int64)
+    rows = np.zeros((sum(channels), int(lengths.max()) + margin), dtype=np.float32)
+    row = 0
+    for segment, count in zip(segments, channels):
+        rows[row:row + count, :len(segment)] = segment.reshape(len(segment), count).T
+        row += count
+    return rows, np.repeat(lengths, channels)
+
+def _unpack(rows, segments, out_lengths):
+    processed = []
+    row = 0
+    for segment, out_length in zip(segments, out_lengths):
+        count = 1 if segment.ndim == 1 else segment.shape[1]
+        segment_rows = rows[row:row + count, :out_length]
+        processed.append(segment_rows[0].copy() if segment.ndim == 1 else np.ascontiguousarray(segment_rows.T))
+        row += count
+    return processed
+
+def stft(rows, window, hop_length):
+    # scipy.fft is imported on first use, so runs without spectral effects never load it
+    from scipy import fft
+    n_fft = len(window)
+    # Generous end padding keeps the stretched tail of every row independent of the
+    # batch it was padded into, so a segment's result never depends on its neighbours
+    padded = np.pad(rows, ((0, 0), (n_fft // 2, 2 * n_fft + hop_length)))
+    num_frames = 1 + (padded.shape[1] - n_fft) // hop_length
+    frames = np.lib.stride_tricks.sliding_window_view(padded, n_fft, axis=1)[:, ::hop_length][:, :num_frames]
+    return fft.rfft(frames * window, axis=2)
+
+def istft(spectrum, window, hop_length, length):
+    from scipy import fft
+    n_fft = len(window)
+    frames = fft.irfft(spectrum, n=n_fft, axis=2).astype(np.float32) * window
+    num_rows, num_frames, _ = frames.shape
+    overlap = n_fft // hop_length
+
+    # Overlap-add by summing hop-sized slices of every frame, one shifted copy per slice
+    out = np.zeros((num_rows, num_frames + overlap - 1, hop_length), dtype=np.float32)
+    norm = np.zeros((num_frames + overlap - 1, hop_length), dtype=np.float32)
+    squared = (window ** 2).reshape(overlap, hop_length)
+    for part in range(overlap):
+        out[:, part:part + num_frames] += frames[:, :, part * hop_length:(part + 1) * hop_length]
+        norm[part:part + num_frames] += squared[part]
+    out = out.reshape(num_rows, -1)
+    norm = norm.reshape(-1)
+    out /= np.where(norm > 1e-8, norm, 1.0)
+    return out[:, n_fft // 2:n_fft // 2 + length]
+
+def phase_vocoder(spectrum, rate, hop_length, n_fft):
+    """Resample STFT frames in time by ``rate`` with phase propagation, vectorized over rows."""
+    num_frames = spectrum.shape[1]
+    time_steps = np.arange(0, num_frames - 1, rate)
+    base = np.floor(time_steps).astype(np.int64)
+    alpha = (time_steps - base).astype(np.float32)[None, :, None]
+
+    left = spectrum[:, base]
+    right = spectrum[:, base + 1]
+    magnitude = np.abs(left)
+    magnitude *= 1 - alpha
+    magnitude += alpha * np.abs(right)
+
+    expected = (2 * np.pi * hop_length * np.arange(spectrum.shape[2]) / n_fft).astype(np.float32)
+    advance = np.angle(right)
+    advance -= np.angle(left)
+    advance -= expected
+    advance -= np.float32(2 * np.pi) * np.round(advance / np.float32(2 * np.pi))
+    advance += expected
+
+    # Accumulate phase along time, starting from the phase of the first frame
+    phase = np.empty_like(advance)
+    phase[:, :1] = np.angle(spectrum[:, :1])
+    np.cumsum(advance[:, :-1], axis=1, out=phase[:, 1:])
+    phase[:, 1:] += phase[:, :1]
+
+    out = np.empty(magnitude.shape, dtype=np.complex64)
+    out.real = magnitude * np.cos(phase)
+    out.imag = magnitude * np.sin(phase)
+    return out
+
+def time_stretch(rows, factor, window, hop_length):
+    """Stretch rows to factor times their length without changing pitch."""
+    out_length = int(round(rows.shape[1] * factor))
+    spectrum = stft(rows, window, hop_length)
+    stretched = phase_vocoder(spectrum, 1.0 / factor, hop_length, len(window))
+    out = istft(stretched, window, hop_length, out_length)
+    if out.shape[1] < out_length:
+        out = np.pad(out, ((0, 0), (0, out_length - out.shape[1])))
+    return out
+
+def resample_linear(rows, out_length, step):
+    positions = np.arange(out_length, dtype=np.float64) * step
+    base = np.minimum(positions.astype(np.int64), rows.shape[1] - 1)
+    following = np.minimum(base + 1, rows.shape[1] - 1)
+    fraction = (positions - base).astype(np.float32)
+    return rows[:, base] * (1 - fraction) + rows[:, following] * fraction
+
+def amplitude_modulation(rows, sample_rate, frequency, depth):
+    t = np.arange(rows.shape[1], dtype=np.float32) / sample_rate
+    return rows * (1 + depth * np.sin(2 * np.pi * frequency * t, dtype=np.float32))
+
+def add_noise(rows, row_lengths, snr_db, rng):
+    """Add white noise at snr_db relative to each row's own power over its valid samples."""
+    row_lengths = np.maximum(np.asarray(row_lengths), 1)
+    signal_power = np.einsum('ij,ij->i', rows, rows) / row_lengths
+    noise_scale = np.sqrt(signal_power / (10 ** (snr_db / 10))).astype(np.float32)
+    noise = rng.standard_normal(rows.shape, dtype=np.float32)
+    noise *= noise_scale[:, None]
+    noise[np.arange(rows.shape[1])[None, :] >= row_lengths[:, None]] = 0
+    return rows + noise
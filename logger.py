@@ -3,14 +3,16 @@ import logging
 from datetime import datetime
 
 class Logger:
-    def __init__(self, verbosity_level, log_dir):
+    def __init__(self, verbosity_level, log_dir, log_file=None):
         self.verbosity_level = int(verbosity_level)
         self.log_dir = log_dir
 
         if not os.path.exists(self.log_dir):
             os.makedirs(self.log_dir)
 
-        log_file = os.path.join(self.log_dir, f"synthesis_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+        if log_file is None:
+            log_file = os.path.join(self.log_dir, f"synthesis_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+        self.log_file = log_file
 
         logging.basicConfig(
             level=self._get_log_level(),
@@ -31,6 +33,10 @@ class Logger:
         else:
             return logging.DEBUG
 
+    @property
+    def debug_enabled(self):
+        return self.logger.isEnabledFor(logging.DEBUG)
+
     def debug(self, message):
         self.logger.debug(message)
 
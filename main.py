@@ -1,22 +1,206 @@
+import argparse
+import multiprocessing.util
 import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from config import ConfigManager
 from logger import Logger
 from audio_processor import AudioProcessor
 from textgrid_handler import TextGridHandler
-from synthesis_engine import SynthesisEngine
-from utils import ensure_dir, get_files_with_extension, validate_file_pairs
+from segment_bank import SegmentBank
+from catalog import CorpusCatalog
+from dataset import SyntheticDataset
+from shards import ShardWriter, consolidate_index
+from effect_cache import format_stats
+from metrics import RunMetrics, profile_call
+from pipeline import Pipeline
+from manifest import RunManifest, completed_indices, config_hash, file_checksum
+from memory_budget import MemoryBudget, format_report, nbytes
+from utils import ensure_dir
+
+# Per-process components, populated by _init_worker in pool workers
+_worker_state = {}
+
+def create_synthetic_file(index, config_manager, logger, dataset, shard_writer=None, manifest=None, budget=None):
+    """Create synthetic file number index+1, seeded from the run seed and the index alone."""
+    if index == config_manager.get_int('Logging', 'profile_clip_index', fallback=-1):
+        profile_path = os.path.join(config_manager.get('Paths', 'log_dir'), f"profile_clip_{index+1}.prof")
+        logger.info(f"Profiling synthetic file {index+1} to {profile_path}")
+        return profile_call(profile_path, _create_synthetic_file, index, config_manager, logger, dataset, shard_writer, manifest,
+                            budget)
+    return _create_synthetic_file(index, config_manager, logger, dataset, shard_writer, manifest, budget)
+
+def _create_synthetic_file(index, config_manager, logger, dataset, shard_writer=None, manifest=None, budget=None):
+    output_bytes = 0
+    try:
+        # Perform synthesis for a single file
+        if budget is None:
+            synthetic_audio, synthetic_intervals, metadata = dataset.generate(index)
+        else:
+            # Files are created one at a time here, so the budget can only evict cached data
+            budget.has_room()
+            prepared = dataset.prepare(index)
+            source_bytes = nbytes(prepared)
+            budget.add('sources', source_bytes)
+            try:
+                synthetic_audio, synthetic_intervals, metadata = dataset.synthesize(prepared)
+                output_bytes = nbytes(synthetic_audio)
+                budget.add('outputs', output_bytes)
+            finally:
+                prepared = None
+                budget.release('sources', source_bytes)
+        if synthetic_audio is None:
+            logger.warning(f"Skipped synthetic file {index+1}: no usable segments")
+            return False
+
+        write_synthetic_file(index, synthetic_audio, synthetic_intervals, metadata, config_manager, dataset, shard_writer,
+                             manifest)
+        return True
+
+    except Exception as e:
+        logger.error(f"Error creating synthetic file {index+1}: {e}")
+        return False
+    finally:
+        if output_bytes:
+            budget.release('outputs', output_bytes)
+
+def write_synthetic_file(index, synthetic_audio, synthetic_intervals, metadata, config_manager, dataset, shard_writer=None,
+                         manifest=None):
+    source_tiers = []
+    if config_manager.get_bool('Output', 'source_tiers', fallback=False):
+        source_tiers = [(f"source_{rank+1}", intervals) for rank, intervals in enumerate(metadata['source_tiers'])]
+    duration = config_manager.get_float('Synthesis', 'file_length_seconds')
+    if shard_writer is not None:
+        with dataset.metrics.stage('write'):
+            num_bytes, checksum = shard_writer.append(index, synthetic_audio, synthetic_intervals, duration, source_tiers)
+            dataset.metrics.add_bytes_written(num_bytes)
+        if manifest is not None:
+            manifest.record(metadata, {shard_writer.shard_file: checksum})
+        return
+
+    output_wav_dir = config_manager.get('Paths', 'output_wav_dir')
+    output_textgrid_dir = config_manager.get('Paths', 'output_textgrid_dir')
+
+    # Save output files
+    output_prefix = config_manager.get('Output', 'file_prefix')
+    output_wav_path = os.path.join(output_wav_dir, f"{output_prefix}{index+1}.wav")
+    output_textgrid_path = os.path.join(output_textgrid_dir, f"{output_prefix}{index+1}.TextGrid")
+
+    dataset.audio_processor.write_wav(output_wav_path, synthetic_audio, config_manager.get_int('AudioProperties', 'sample_rate'))
+    dataset.textgrid_handler.write_tiers(output_textgrid_path, [('vocalizations', synthetic_intervals)] + source_tiers, duration)
+    if manifest is not None:
+        # Checksums are taken from the files as written, after both are complete
+        manifest.record(metadata, {os.path.basename(path): file_checksum(path)
+                                   for path in (output_wav_path, output_textgrid_path)})
+
+def run_pipeline(indices, num_synthetic_files, config_manager, logger, dataset, shard_writer=None, manifest=None,
+                 budget=None):
+    """Create the synthetic files of indices with reads, synthesis and writes overlapped."""
+    profile_index = config_manager.get_int('Logging', 'profile_clip_index', fallback=-1)
+
+    def process(prepared):
+        index = prepared['index']
+        if index == profile_index:
+            profile_path = os.path.join(config_manager.get('Paths', 'log_dir'), f"profile_clip_{index+1}.prof")
+            logger.info(f"Profiling synthesis of file {index+1} to {profile_path}")
+            return profile_call(profile_path, dataset.synthesize, prepared)
+        return dataset.synthesize(prepared)
+
+    def write(index, synthetic_audio, synthetic_intervals, metadata):
+        write_synthetic_file(index, synthetic_audio, synthetic_intervals, metadata, config_manager, dataset, shard_writer,
+                             manifest)
+        logger.info(f"Created synthetic file {index+1}/{num_synthetic_files}")
+
+    pipeline = Pipeline(dataset.prepare, process, write, logger, dataset.metrics,
+                        config_manager.get_int('Performance', 'reader_threads', fallback=2),
+                        config_manager.get_int('Performance', 'prefetch_depth', fallback=4),
+                        config_manager.get_int('Performance', 'write_queue_size', fallback=4), budget)
+    return pipeline.run(indices)
+
+def create_shard_writer(config_manager, name):
+    if config_manager.get('Output', 'output_format', fallback='files') != 'shards':
+        return None
+    return ShardWriter(config_manager.get('Paths', 'output_shard_dir'), name,
+                       config_manager.get_int('AudioProperties', 'sample_rate'),
+                       config_manager.get('Output', 'shard_dtype',
+                                          fallback=config_manager.get('AudioProperties', 'processing_dtype', fallback='float64')),
+                       config_manager.get_int('Output', 'shard_size_mb', fallback=1024),
+                       config_manager.get('Output', 'output_subtype', fallback='PCM_16'))
+
+def create_memory_budget(config_manager, dataset):
+    """The memory budget of one process: [Performance] memory_budget_mb, split evenly over the worker processes."""
+    limit_bytes = config_manager.get_int('Performance', 'memory_budget_mb', fallback=0) * 1024 * 1024
+    return MemoryBudget(limit_bytes // config_manager.get_int('Performance', 'thread_count'),
+                        [dataset.synthesis_engine.effect_cache])
+
+def stream_outputs(config_manager):
+    # Long clips are streamed to their WAV files; shards and in-memory use need whole arrays
+    return (config_manager.get_float('Output', 'stream_chunk_seconds', fallback=0) > 0 and
+            config_manager.get('Output', 'output_format', fallback='files') == 'files')
+
+def _init_worker(config_manager, log_file, wav_files, textgrid_files, use_segment_bank, manifest_dir, run_hash, name_prefix):
+    # config_manager is the parent's ConfigSnapshot, so workers skip reading and validating config.ini
+    logger = Logger(config_manager.get_int('Logging', 'verbosity_level'), config_manager.get('Paths', 'log_dir'), log_file=log_file)
+    segment_bank = SegmentBank.load(config_manager.get('Paths', 'segment_bank_dir')) if use_segment_bank else None
+    metrics = RunMetrics(config_manager.get_bool('Logging', 'collect_metrics', fallback=False))
+    dataset = SyntheticDataset(config_manager, logger, segment_bank=segment_bank, wav_files=wav_files, metrics=metrics,
+                               stream_outputs=stream_outputs(config_manager), textgrid_files=textgrid_files)
+    _worker_state.update(
+        config_manager=config_manager,
+        logger=logger,
+        dataset=dataset,
+        shard_writer=create_shard_writer(config_manager, f"part-{name_prefix}{os.getpid()}"),
+        manifest=RunManifest(manifest_dir, f"{name_prefix}{os.getpid()}", run_hash),
+        budget=create_memory_budget(config_manager, dataset),
+    )
+    effect_cache = dataset.synthesis_engine.effect_cache
+    if effect_cache is not None and effect_cache.spill_dir:
+        # Spill what is still cached when the worker exits, so the next run starts warm
+        multiprocessing.util.Finalize(None, effect_cache.flush, exitpriority=10)
+
+def _create_in_worker(index):
+    created = create_synthetic_file(index, **_worker_state)
+    dataset = _worker_state['dataset']
+    effect_cache = dataset.synthesis_engine.effect_cache
+    # The parent merges every worker's measurements into the run summary
+    return (created, os.getpid(), effect_cache.stats() if effect_cache is not None else None, dataset.metrics.drain(),
+            _worker_state['budget'].report())
+
+def _run_pipeline_in_worker(indices, num_synthetic_files):
+    num_created = run_pipeline(indices, num_synthetic_files, **_worker_state)
+    dataset = _worker_state['dataset']
+    effect_cache = dataset.synthesis_engine.effect_cache
+    return (num_created, os.getpid(), effect_cache.stats() if effect_cache is not None else None, dataset.metrics.drain(),
+            _worker_state['budget'].report())
+
+def parse_shard(spec):
+    """Parse a --shard value 'i/N' into (i, N), with 0 <= i < N."""
+    try:
+        shard_index, num_shards = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got '{spec}'")
+    if not 0 <= shard_index < num_shards:
+        raise argparse.ArgumentTypeError(f"shard index must be in [0, {num_shards}), got {shard_index}")
+    return shard_index, num_shards
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic vocalization files as configured in config.ini.")
+    parser.add_argument('--resume', action='store_true',
+                        help="skip indices the run manifest lists as written with the current settings")
+    parser.add_argument('--shard', type=parse_shard, default=(0, 1), metavar='i/N',
+                        help="create only indices i, i+N, i+2N, ... (zero-based i), to split a run across machines")
+    args = parser.parse_args()
+
     # Get the directory of the script
     script_dir = os.path.dirname(os.path.abspath(__file__))
     
     # Construct the full path to config.ini
     config_path = os.path.join(script_dir, 'config.ini')
 
-    # Initialize configuration
+    # Initialize configuration, frozen once validated
     try:
-        config_manager = ConfigManager(config_path)
+        config_manager = ConfigManager(config_path).snapshot()
     except FileNotFoundError:
         print(f"Error: config.ini file not found at {config_path}")
         sys.exit(1)
@@ -31,11 +215,6 @@ def main():
 
     logger.info("Starting vocalization synthesis program")
 
-    # Initialize components
-    audio_processor = AudioProcessor(config_manager)
-    textgrid_handler = TextGridHandler()
-    synthesis_engine = SynthesisEngine(config_manager, logger, audio_processor)
-
     # Ensure output directories exist
     output_wav_dir = config_manager.get('Paths', 'output_wav_dir')
     output_textgrid_dir = config_manager.get('Paths', 'output_textgrid_dir')
@@ -45,17 +224,45 @@ def main():
     # Get input files
     input_wav_dir = config_manager.get('Paths', 'input_wav_dir')
     input_textgrid_dir = config_manager.get('Paths', 'input_textgrid_dir')
-    wav_files = get_files_with_extension(input_wav_dir, '.wav')
-    textgrid_files = get_files_with_extension(input_textgrid_dir, '.TextGrid')
-
-    # Validate input files
-    if not validate_file_pairs(wav_files, textgrid_files):
-        logger.error("Mismatched input files. Please ensure each WAV file has a corresponding TextGrid file.")
+    catalog = CorpusCatalog.load_or_build(
+        config_manager.get('Paths', 'catalog_file', fallback=''), input_wav_dir, input_textgrid_dir,
+        TextGridHandler(cache_dir=config_manager.get('Paths', 'textgrid_cache_dir', fallback='') or None), logger,
+        config_manager.get_int('Performance', 'catalog_threads', fallback=8))
+    wav_files = catalog.wav_files()
+    textgrid_files = catalog.textgrid_files()
+    if not wav_files:
+        logger.error("No input WAV files with a corresponding TextGrid file found.")
         sys.exit(1)
+    corpus = catalog.summary()
+    logger.info(f"Input corpus: {corpus['recordings']} recordings, {corpus['hours']} hours, "
+                f"sample rates {corpus['sample_rates']}, channels {corpus['channels']}")
 
     # Get the number of synthetic files to create
     num_synthetic_files = config_manager.get_int('Synthesis', 'num_synthetic_files')
 
+    # Every clip depends only on its index, so shards and resumed runs need no coordination
+    shard_index, num_shards = args.shard
+    indices = list(range(shard_index, num_synthetic_files, num_shards))
+    name_prefix = f"shard{shard_index}of{num_shards}-" if num_shards > 1 else ""
+    output_format = config_manager.get('Output', 'output_format', fallback='files')
+    output_shard_dir = config_manager.get('Paths', 'output_shard_dir', fallback='')
+    # By default next to the output directory, so listing the outputs does not list the manifest
+    manifest_dir = config_manager.get('Paths', 'manifest_dir', fallback='') or os.path.normpath(
+        output_shard_dir if output_format == 'shards' else output_wav_dir) + '_manifest'
+    run_hash = config_hash(config_manager, wav_files)
+    if num_shards > 1:
+        logger.info(f"Creating shard {shard_index}/{num_shards}: {len(indices)} of {num_synthetic_files} files")
+    if args.resume:
+        def output_exists(name):
+            if output_format == 'shards':
+                return os.path.exists(os.path.join(output_shard_dir, name))
+            output_dir = output_wav_dir if name.endswith('.wav') else output_textgrid_dir
+            return os.path.exists(os.path.join(output_dir, name))
+        completed = completed_indices(manifest_dir, run_hash, output_exists)
+        indices = [index for index in indices if index not in completed]
+        logger.info(f"Resuming run {run_hash}: {len(indices)} files left to create")
+    manifest = RunManifest(manifest_dir, f"{name_prefix}main", run_hash)
+
     # Log audio effects configuration
     audio_effects = config_manager.get_audio_effects()
     if audio_effects:
@@ -65,33 +272,87 @@ def main():
     else:
         logger.info("Audio effects disabled")
 
-    # Process input files and create synthetic files one at a time
-    for i in range(num_synthetic_files):
-        try:
-            # Randomly select an input file
-            wav_file = synthesis_engine.select_random_file(wav_files)
-            wav_path = os.path.join(input_wav_dir, wav_file)
-            textgrid_path = os.path.join(input_textgrid_dir, wav_file.replace('.wav', '.TextGrid'))
+    metrics = RunMetrics(config_manager.get_bool('Logging', 'collect_metrics', fallback=False))
+    start_time = time.perf_counter()
 
-            # Read input files
-            audio_data, sample_rate = audio_processor.read_wav(wav_path)
-            textgrid_data = textgrid_handler.read_textgrid(textgrid_path)
+    # Build the segment bank once, so no input file is decoded per output file
+    segment_bank = None
+    if config_manager.get_bool('Synthesis', 'use_segment_bank', fallback=False):
+        segment_bank = SegmentBank.load_or_build(
+            config_manager.get('Paths', 'segment_bank_dir'), wav_files, input_wav_dir, input_textgrid_dir,
+            AudioProcessor(config_manager, metrics),
+            TextGridHandler(metrics, config_manager.get('Paths', 'textgrid_cache_dir', fallback='') or None), config_manager.get_vocalization_labels(), logger,
+            textgrid_files)
 
-            # Perform synthesis for a single file
-            synthetic_audio, synthetic_textgrid = synthesis_engine.synthesize_single(audio_data, textgrid_data, sample_rate)
+    # Initialize components
+    dataset = SyntheticDataset(config_manager, logger, segment_bank=segment_bank, wav_files=wav_files, metrics=metrics,
+                               stream_outputs=stream_outputs(config_manager), textgrid_files=textgrid_files)
+    shard_writer = create_shard_writer(config_manager, f"part-{name_prefix}main")
 
-            # Save output files
-            output_prefix = config_manager.get('Output', 'file_prefix')
-            output_wav_path = os.path.join(output_wav_dir, f"{output_prefix}{i+1}.wav")
-            output_textgrid_path = os.path.join(output_textgrid_dir, f"{output_prefix}{i+1}.TextGrid")
+    # Create synthetic files, one output index per task. Every index is seeded
+    # independently, so the output set does not depend on the worker count.
+    thread_count = config_manager.get_int('Performance', 'thread_count')
+    use_pipeline = config_manager.get_bool('Performance', 'pipeline', fallback=False)
+    num_created = 0
+    if thread_count > 1:
+        logger.info(f"Synthesizing with {thread_count} worker processes")
+        with ProcessPoolExecutor(max_workers=thread_count, initializer=_init_worker,
+                                 initargs=(config_manager, logger.log_file, wav_files, textgrid_files, segment_bank is not None,
+                                           manifest_dir, run_hash, name_prefix)) as executor:
+            worker_cache_stats = {}
+            worker_memory = {}
+            if use_pipeline:
+                # Each worker pipelines its own strided share of the indices
+                futures = [executor.submit(_run_pipeline_in_worker, indices[worker_id::thread_count], num_synthetic_files)
+                           for worker_id in range(thread_count)]
+                results = [future.result() for future in futures]
+            else:
+                results = executor.map(_create_in_worker, indices)
+            for position, (created, worker_pid, cache_stats, measurements, memory) in enumerate(results):
+                metrics.merge(measurements)
+                if use_pipeline:
+                    # Pipelined workers log their own progress and report a count
+                    num_created += created
+                elif created:
+                    num_created += 1
+                    logger.info(f"Created synthetic file {indices[position]+1}/{num_synthetic_files}")
+                if cache_stats is not None:
+                    worker_cache_stats[worker_pid] = cache_stats
+                worker_memory[worker_pid] = memory
+        memory_reports = list(worker_memory.values())
+        if worker_cache_stats:
+            totals = {key: sum(stats[key] for stats in worker_cache_stats.values()) for key in ['hits', 'disk_hits', 'misses', 'evictions']}
+            logger.info(f"Effect cache: {format_stats(totals)}")
+    else:
+        budget = create_memory_budget(config_manager, dataset)
+        if use_pipeline:
+            num_created = run_pipeline(indices, num_synthetic_files, config_manager, logger, dataset, shard_writer, manifest,
+                                       budget)
+        else:
+            for i in indices:
+                if create_synthetic_file(i, config_manager, logger, dataset, shard_writer, manifest, budget):
+                    num_created += 1
+                    logger.info(f"Created synthetic file {i+1}/{num_synthetic_files}")
+        if dataset.synthesis_engine.effect_cache is not None:
+            dataset.synthesis_engine.effect_cache.flush()
+            logger.info(f"Effect cache: {format_stats(dataset.synthesis_engine.effect_cache.stats())}")
+        memory_reports = [budget.report()]
+    logger.info(f"Memory: {format_report(memory_reports)}")
 
-            audio_processor.write_wav(output_wav_path, synthetic_audio, config_manager.get_int('AudioProperties', 'sample_rate'))
-            textgrid_handler.write_textgrid(output_textgrid_path, synthetic_textgrid)
+    manifest.close()
+    logger.info(f"Recorded created files in the manifests in {manifest_dir}")
 
-            logger.info(f"Created synthetic file {i+1}/{num_synthetic_files}")
+    if shard_writer is not None:
+        shard_writer.close()
+        consolidate_index(shard_writer.shard_dir)
+        logger.info(f"Wrote shards and index to {shard_writer.shard_dir}")
 
-        except Exception as e:
-            logger.error(f"Error creating synthetic file {i+1}: {e}")
+    if metrics.enabled:
+        metrics_path = os.path.splitext(logger.log_file)[0] + '_metrics.json'
+        summary = metrics.write_summary(metrics_path, time.perf_counter() - start_time, num_created, memory_reports)
+        logger.info(f"{summary['clips_per_second']} clips/s; time per stage: " +
+                    ', '.join(f"{name} {stage['total_seconds']:.2f}s" for name, stage in summary['stages'].items()))
+        logger.info(f"Wrote run metrics to {metrics_path}")
 
     logger.info("Vocalization synthesis complete")
 
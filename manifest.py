@@ -0,0 +1,140 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+from utils import ensure_dir
+
+MANIFEST_PREFIX = 'manifest-'
+MERGED_FILE = 'manifest.jsonl'
+
+# Settings that change how a run executes or where it writes, but not what a clip contains
+_UNHASHED_SECTIONS = {'Study', 'Paths', 'Logging', 'Performance'}
+_UNHASHED_OPTIONS = {('Synthesis', 'num_synthetic_files')}
+# Raised when the same settings start to produce different clips, so older runs are not resumed
+SYNTHESIS_VERSION = 2
+
+class RunManifest:
+    """Append-only record of the clips a run has written.
+
+    Each writer (one per worker process) appends one JSON line per clip to its own
+    ``manifest-<name>.jsonl`` in ``manifest_dir``. A line holds the clip index, its seed,
+    the config hash, the source segments that were placed and the SHA-256 of every output,
+    and it is written only after the outputs are complete, so a listed clip never needs
+    to be created again. Since every clip is seeded from the run seed and its index
+    alone, the line is enough to reproduce or verify the clip.
+    """
+
+    def __init__(self, manifest_dir, name, config_hash):
+        self.manifest_dir = manifest_dir
+        self.path = os.path.join(manifest_dir, f"{MANIFEST_PREFIX}{name}.jsonl")
+        self.config_hash = config_hash
+        self.file = None
+        ensure_dir(manifest_dir)
+
+    def record(self, metadata, outputs):
+        """Record a written clip given its metadata from SyntheticDataset and {output name: sha256}."""
+        if self.file is None:
+            self.file = open(self.path, 'a')
+        record = {'index': metadata['index'], 'seed': metadata['seed'], 'config_hash': self.config_hash,
+                  'source': metadata['source'], 'segments': metadata.get('segments'), 'outputs': outputs}
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def config_hash(config_manager, wav_files):
+    """Hash the settings and input file names that determine the contents of every clip.
+
+    Paths, logging and performance settings and the number of clips are left out, so a
+    run can be resumed, extended or split across machines with different paths.
+    """
+    settings = {section: dict(sorted(options.items())) for section, options in sorted(config_manager.as_dict().items())
+                if section not in _UNHASHED_SECTIONS}
+    for section, key in _UNHASHED_OPTIONS:
+        settings.get(section, {}).pop(key, None)
+    payload = json.dumps({'settings': settings, 'inputs': sorted(wav_files), 'version': SYNTHESIS_VERSION}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def file_checksum(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def manifest_files(manifest_dir):
+    """The per-writer manifests of a directory, plus its merged manifest if there is one."""
+    paths = sorted(glob.glob(os.path.join(manifest_dir, f"{MANIFEST_PREFIX}*.jsonl")))
+    merged_path = os.path.join(manifest_dir, MERGED_FILE)
+    return paths + [merged_path] if os.path.exists(merged_path) else paths
+
+def load_records(manifest_dirs, config_hash=None):
+    """Return {index: record} over the manifests of manifest_dirs.
+
+    With config_hash set, records of runs with other settings are ignored. A line cut
+    short by an interrupted run is skipped.
+    """
+    records = {}
+    for manifest_dir in manifest_dirs:
+        for path in manifest_files(manifest_dir):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if config_hash is None or record['config_hash'] == config_hash:
+                        records[record['index']] = record
+    return records
+
+def completed_indices(manifest_dir, config_hash, output_exists=None):
+    """Indices already written with the given settings, for resuming a run.
+
+    output_exists(name), when given, is checked for every recorded output, so clips whose
+    files were deleted since are created again.
+    """
+    if not os.path.isdir(manifest_dir):
+        return set()
+    return {index for index, record in load_records([manifest_dir], config_hash).items()
+            if output_exists is None or all(output_exists(name) for name in record['outputs'])}
+
+def merge_manifests(manifest_dirs, output_path, num_clips=None):
+    """Merge the manifests of one or more runs (e.g. the shards of a split run) into one file.
+
+    Records are written sorted by index. All records must share one config hash, since
+    clips made with different settings do not belong to one data set. Returns the number
+    of merged records and the indices below num_clips that are missing.
+    """
+    records = load_records(manifest_dirs)
+    hashes = {record['config_hash'] for record in records.values()}
+    if len(hashes) > 1:
+        raise ValueError(f"Manifests were written with different settings (config hashes {', '.join(sorted(hashes))})")
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        for index in sorted(records):
+            f.write(json.dumps(records[index]) + '\n')
+    os.replace(temp_path, output_path)
+    missing = [index for index in range(num_clips) if index not in records] if num_clips is not None else []
+    return len(records), missing
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the run manifests of one or more manifest directories.")
+    parser.add_argument('manifest_dirs', nargs='+')
+    parser.add_argument('--output', required=True, help="path of the merged manifest")
+    parser.add_argument('--num-clips', type=int, help="report indices below this number that no manifest lists")
+    args = parser.parse_args()
+    num_records, missing = merge_manifests(args.manifest_dirs, args.output, args.num_clips)
+    print(f"Merged {num_records} records into {args.output}")
+    if missing:
+        print(f"Missing {len(missing)} indices: {', '.join(str(index) for index in missing[:20])}"
+              f"{' ...' if len(missing) > 20 else ''}")
@@ -0,0 +1,109 @@
+import resource
+import sys
+import threading
+
+class MemoryBudget:
+    """Byte budget over the large buffers one process holds while creating clips.
+
+    Callers account decoded source audio of clips being synthesized ('sources') and
+    synthesized clips waiting to be written ('outputs') with ``add`` and ``release``.
+    The caches passed in (objects with ``current_bytes`` and ``evict(num_bytes)``, such
+    as EffectCache) count towards the budget too. When usage exceeds the budget,
+    ``has_room`` evicts cached data first, and only if that is not enough does it
+    report that no new clip should start. Callers then hold back new clips until
+    written clips are released. A limit of 0 disables the budget, but usage and its
+    peak are still tracked.
+
+    Caches are evicted by ``has_room``, so call it from the thread that uses them.
+    """
+
+    def __init__(self, limit_bytes=0, caches=()):
+        self.limit_bytes = limit_bytes
+        self.caches = [cache for cache in caches if cache is not None]
+        self.held = {}
+        self.peak_bytes = 0
+        self.peak_usage = {}
+        self.evicted_bytes = 0
+        self.waits = 0
+        self.condition = threading.Condition()
+
+    def usage(self):
+        """Bytes held per kind, with the caches under 'caches'."""
+        with self.condition:
+            usage = dict(self.held)
+        usage['caches'] = sum(cache.current_bytes for cache in self.caches)
+        return usage
+
+    def add(self, kind, num_bytes):
+        with self.condition:
+            self.held[kind] = self.held.get(kind, 0) + num_bytes
+        self._update_peak()
+
+    def release(self, kind, num_bytes):
+        with self.condition:
+            self.held[kind] -= num_bytes
+            self.condition.notify_all()
+
+    def has_room(self):
+        """Whether a new clip may start, after evicting cached data to get under the budget."""
+        self._update_peak()
+        if not self.limit_bytes:
+            return True
+        excess = sum(self.usage().values()) - self.limit_bytes
+        for cache in self.caches:
+            if excess <= 0:
+                break
+            freed = cache.evict(excess)
+            self.evicted_bytes += freed
+            excess -= freed
+        return excess <= 0
+
+    def wait_for_room(self, waiting_on='outputs'):
+        """Block until has_room() or no bytes of kind waiting_on are left to be released.
+
+        waiting_on must be released by other threads, or this would wait forever; with
+        nothing of it held, the caller proceeds over the budget rather than stall.
+        """
+        while not self.has_room():
+            with self.condition:
+                if not self.held.get(waiting_on):
+                    return
+                self.waits += 1
+                self.condition.wait()
+
+    def report(self):
+        """Peak accounted usage and its breakdown, evictions, waits and the peak RSS of this process."""
+        return {'limit_bytes': self.limit_bytes, 'peak_bytes': self.peak_bytes, 'peak_usage': dict(self.peak_usage),
+                'evicted_bytes': self.evicted_bytes, 'waits': self.waits, 'peak_rss_bytes': peak_rss_bytes()}
+
+    def _update_peak(self):
+        usage = self.usage()
+        total = sum(usage.values())
+        if total > self.peak_bytes:
+            self.peak_bytes = total
+            self.peak_usage = usage
+
+def nbytes(value):
+    """Bytes of the arrays in value, looking into dicts, lists and tuples and at ``nbytes`` attributes."""
+    if isinstance(value, dict):
+        return sum(nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(item) for item in value)
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return 0
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def format_report(reports):
+    """Summarize the reports of one or more processes of a run."""
+    peak = sum(report['peak_bytes'] for report in reports)
+    rss = sum(report['peak_rss_bytes'] for report in reports)
+    limit = sum(report['limit_bytes'] for report in reports)
+    budget = f"budget {limit / 2 ** 20:.0f} MB" if limit else "no budget"
+    return (f"peak accounted {peak / 2 ** 20:.1f} MB ({budget}), peak RSS {rss / 2 ** 20:.1f} MB, "
+            f"{sum(report['evicted_bytes'] for report in reports) / 2 ** 20:.1f} MB evicted from caches, "
+            f"{sum(report['waits'] for report in reports)} waits for memory")
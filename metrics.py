@@ -0,0 +1,127 @@
+import cProfile
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+import numpy as np
+
+# Shared no-op context returned by stage() when metrics are disabled
+_DISABLED_STAGE = nullcontext()
+
+class RunMetrics:
+    """Per-stage timings and counters for one run.
+
+    ``with metrics.stage('read'):`` records the duration of the block, and ``count()``,
+    ``add_bytes_read()``, ``add_bytes_written()`` and ``count_labels()`` update counters.
+    A disabled instance returns a shared no-op context from ``stage()`` and ignores
+    counters, so instrumented code costs one method call per stage when metrics are off.
+    Worker processes hand their measurements to the parent with ``drain()`` and the parent
+    adds them with ``merge()``. Updates are guarded by a lock, since the pipeline's reader
+    and writer threads record into the same instance.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.durations = defaultdict(list)
+        self.counters = defaultdict(int)
+        self.labels = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _DISABLED_STAGE
+        return _Stage(self, name)
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += value
+
+    def add_bytes_read(self, num_bytes):
+        self.count('bytes_read', num_bytes)
+
+    def add_bytes_written(self, num_bytes):
+        self.count('bytes_written', num_bytes)
+
+    def count_labels(self, label_names, label_codes):
+        """Count placed segments per label, given the label code of every placement."""
+        if self.enabled:
+            counts = np.bincount(label_codes, minlength=len(label_names))
+            with self.lock:
+                for code, count in enumerate(counts):
+                    if count:
+                        self.labels[label_names[code]] += int(count)
+
+    def drain(self):
+        """Return the measurements recorded so far and reset them."""
+        with self.lock:
+            measurements = {'durations': dict(self.durations), 'counters': dict(self.counters), 'labels': dict(self.labels)}
+            self.durations = defaultdict(list)
+            self.counters = defaultdict(int)
+            self.labels = defaultdict(int)
+        return measurements
+
+    def merge(self, measurements):
+        with self.lock:
+            for name, durations in measurements['durations'].items():
+                self.durations[name].extend(durations)
+            for name, value in measurements['counters'].items():
+                self.counters[name] += value
+            for label, count in measurements['labels'].items():
+                self.labels[label] += count
+
+    def add_duration(self, name, seconds):
+        with self.lock:
+            self.durations[name].append(seconds)
+
+    def summary(self, wall_seconds, num_clips):
+        stages = {}
+        for name, durations in self.durations.items():
+            durations = np.asarray(durations)
+            p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+            stages[name] = {'count': len(durations), 'total_seconds': round(float(durations.sum()), 6),
+                            'mean_ms': round(1000 * float(durations.mean()), 3), 'p50_ms': round(1000 * p50, 3),
+                            'p90_ms': round(1000 * p90, 3), 'p99_ms': round(1000 * p99, 3),
+                            'max_ms': round(1000 * float(durations.max()), 3)}
+        return {
+            'clips': num_clips,
+            'wall_seconds': round(wall_seconds, 3),
+            'clips_per_second': round(num_clips / wall_seconds, 3) if wall_seconds > 0 else None,
+            'bytes_read': self.counters.get('bytes_read', 0),
+            'bytes_written': self.counters.get('bytes_written', 0),
+            'segments_per_label': dict(sorted(self.labels.items())),
+            'counters': {name: value for name, value in self.counters.items() if name not in ('bytes_read', 'bytes_written')},
+            'stages': stages,
+        }
+
+    def write_summary(self, file_path, wall_seconds, num_clips, memory=None):
+        """Write the summary as JSON, with the MemoryBudget reports of the run's processes under 'memory'."""
+        summary = self.summary(wall_seconds, num_clips)
+        if memory is not None:
+            summary['memory'] = memory
+        with open(file_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+class _Stage:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_duration(self.name, time.perf_counter() - self.start)
+
+def profile_call(profile_path, func, *args, **kwargs):
+    """Run func under cProfile and save the stats to profile_path (open with pstats or snakeviz)."""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(profile_path)
@@ -0,0 +1,146 @@
+import json
+import os
+import numpy as np
+from utils import ensure_dir, get_files_with_extension
+
+# Spectral slope of generated noise: power falls off as 1 / f ** exponent
+NOISE_COLORS = {'white': 0.0, 'pink': 1.0, 'brown': 2.0}
+
+class NoiseBank:
+    """Background noise in one memory-mapped mono float32 array, drawn from in random windows.
+
+    The bank holds either real noise recordings (every channel of every file in
+    ``noise_dir``, resampled to the target rate and appended) or colored noise generated
+    once from the run seed. Windows wrap around the end of the bank, so clips longer than
+    the bank still get noise. ``manifest.json`` records what the bank was built from.
+    """
+
+    SAMPLES_FILE = 'noise.f32'
+    MANIFEST_FILE = 'manifest.json'
+
+    def __init__(self, bank_dir, samples, sample_rate):
+        self.bank_dir = bank_dir
+        self.samples = samples
+        self.sample_rate = sample_rate
+
+    def __len__(self):
+        return len(self.samples)
+
+    def window(self, start, length):
+        """Return length samples starting at start, wrapping around the end of the bank."""
+        start %= len(self.samples)
+        if start + length <= len(self.samples):
+            return self.samples[start:start + length]
+        return np.take(self.samples, np.arange(start, start + length), mode='wrap')
+
+    def clip_noise(self, rng, num_samples, channels, snr_db_range):
+        """Draw the noise of one clip: an independent window per channel and an SNR in snr_db_range."""
+        starts = rng.integers(0, len(self.samples), channels).tolist()
+        snr_db = float(rng.uniform(*snr_db_range))
+        return ClipNoise(self, starts, num_samples, snr_db)
+
+    @classmethod
+    def load(cls, bank_dir):
+        with open(os.path.join(bank_dir, cls.MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        samples = np.memmap(os.path.join(bank_dir, cls.SAMPLES_FILE), dtype=np.float32, mode='r')
+        return cls(bank_dir, samples, manifest['sample_rate'])
+
+    @classmethod
+    def build(cls, bank_dir, manifest, audio_processor, logger):
+        """Write the recordings or generated noise that manifest describes to bank_dir."""
+        ensure_dir(bank_dir)
+        total_samples = 0
+        with open(os.path.join(bank_dir, cls.SAMPLES_FILE), 'wb') as samples_file:
+            if manifest['noise_dir']:
+                for noise_file, _, _ in manifest['files']:
+                    audio_data, _ = audio_processor.read_wav(os.path.join(manifest['noise_dir'], noise_file))
+                    for channel in audio_data.reshape(len(audio_data), -1).T:
+                        samples_file.write(np.ascontiguousarray(channel, dtype=np.float32).tobytes())
+                        total_samples += len(channel)
+            else:
+                # Generated in blocks of a minute, so building a long bank needs little memory
+                rng = np.random.default_rng(manifest['seed'])
+                block_samples = 60 * manifest['sample_rate']
+                remaining = int(manifest['seconds'] * manifest['sample_rate'])
+                while remaining > 0:
+                    block = colored_noise(rng, min(block_samples, remaining), NOISE_COLORS[manifest['color']])
+                    samples_file.write(block.tobytes())
+                    total_samples += len(block)
+                    remaining -= len(block)
+        if not total_samples:
+            raise ValueError(f"No background noise found for the noise bank in {bank_dir}")
+        with open(os.path.join(bank_dir, cls.MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f)
+        logger.info(f"Built noise bank with {total_samples / manifest['sample_rate']:.1f} s of noise in {bank_dir}")
+        return cls.load(bank_dir)
+
+    @classmethod
+    def load_or_build(cls, bank_dir, background_noise, sample_rate, seed, audio_processor, logger):
+        """Load the bank in bank_dir, rebuilding it if its noise source or settings have changed."""
+        noise_dir = background_noise['noise_dir']
+        manifest = {'sample_rate': sample_rate, 'noise_dir': noise_dir}
+        if noise_dir:
+            manifest['files'] = []
+            for noise_file in sorted(get_files_with_extension(noise_dir, '.wav')):
+                stat = os.stat(os.path.join(noise_dir, noise_file))
+                manifest['files'].append([noise_file, stat.st_size, stat.st_mtime_ns])
+        else:
+            manifest.update(color=background_noise['color'], seconds=background_noise['seconds'], seed=seed)
+
+        manifest_path = os.path.join(bank_dir, cls.MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                if json.load(f) == manifest:
+                    return cls.load(bank_dir)
+        return cls.build(bank_dir, manifest, audio_processor, logger)
+
+class ClipNoise:
+    """The background noise windows and SNR of one clip."""
+
+    def __init__(self, noise_bank, starts, num_samples, snr_db):
+        self.noise_bank = noise_bank
+        self.starts = starts
+        self.num_samples = num_samples
+        self.snr_db = snr_db
+
+    def block(self, position, length):
+        """Noise for samples [position, position + length) of the clip, shaped like the clip."""
+        if len(self.starts) == 1:
+            return self.noise_bank.window(self.starts[0] + position, length)
+        return np.stack([self.noise_bank.window(start + position, length) for start in self.starts], axis=1)
+
+def colored_noise(rng, num_samples, exponent):
+    """Unit-RMS float32 noise whose power spectrum falls off as 1 / f ** exponent."""
+    # Imported here, so runs without generated background noise never load scipy.fft
+    from scipy import fft
+    spectrum = fft.rfft(rng.standard_normal(num_samples))
+    frequencies = fft.rfftfreq(num_samples)
+    frequencies[0] = frequencies[1] if num_samples > 1 else 1.0
+    spectrum *= frequencies ** (-exponent / 2)
+    spectrum[0] = 0
+    noise = fft.irfft(spectrum, n=num_samples)
+    rms = np.sqrt(np.mean(noise ** 2))
+    return (noise / rms if rms > 0 else noise).astype(np.float32)
+
+def snr_scale(signal_power, noise_power, snr_db):
+    """Gain that puts noise of noise_power snr_db below signal_power; 0 where the noise is silent."""
+    signal_power = np.asarray(signal_power, dtype=np.float64)
+    noise_power = np.asarray(noise_power, dtype=np.float64)
+    target = noise_power * 10 ** (np.asarray(snr_db, dtype=np.float64) / 10)
+    return np.sqrt(np.divide(signal_power, target, out=np.zeros_like(target), where=target > 0))
+
+def mix_at_snr(clips, noise, snr_db):
+    """Add noise to a batch of clips in place, each at its own SNR.
+
+    clips and noise are (batch, samples[, channels]) arrays and snr_db holds one value per
+    clip. Signal and noise power of the whole batch are computed with one reduction each.
+    """
+    flat_clips = clips.reshape(len(clips), -1)
+    flat_noise = noise.reshape(len(noise), -1)
+    num_values = max(flat_clips.shape[1], 1)
+    signal_power = np.einsum('ij,ij->i', flat_clips, flat_clips, dtype=np.float64) / num_values
+    noise_power = np.einsum('ij,ij->i', flat_noise, flat_noise, dtype=np.float64) / num_values
+    scale = snr_scale(signal_power, noise_power, snr_db)
+    flat_clips += flat_noise * scale[:, None].astype(flat_clips.dtype)
+    return clips
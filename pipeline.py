@@ -0,0 +1,120 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from memory_budget import nbytes
+
+# Marks the end of the write queue
+_DONE = object()
+
+class Pipeline:
+    """Overlap input reads, synthesis and output writes for a sequence of clip indices.
+
+    ``prepare(index)`` (reading inputs) runs ahead in ``reader_threads`` threads, at most
+    ``prefetch_depth`` clips ahead of synthesis. ``process(prepared)`` runs in the calling
+    thread in index order and returns a tuple that starts with the audio, such as (audio,
+    intervals, metadata); audio is None for clips without usable segments.
+    ``write(index, *result)`` runs in one writer thread fed by a queue of
+    ``write_queue_size`` clips, so synthesis blocks rather than piling up outputs when
+    writing falls behind. Clips are synthesized and written in index order, so the
+    output does not depend on the number of threads.
+
+    With a ``MemoryBudget``, prepared inputs are accounted as 'sources' until processed
+    and results as 'outputs' until written. Over the budget, no further reads start
+    until written clips free memory.
+    """
+
+    def __init__(self, prepare, process, write, logger, metrics, reader_threads=2, prefetch_depth=4, write_queue_size=4,
+                 budget=None):
+        self.prepare = prepare
+        self.process = process
+        self.write = write
+        self.logger = logger
+        self.metrics = metrics
+        self.reader_threads = reader_threads
+        self.prefetch_depth = max(prefetch_depth, reader_threads)
+        self.write_queue_size = write_queue_size
+        self.budget = budget
+        self.num_written = 0
+
+    def run(self, indices):
+        """Create the clips of indices and return how many were written."""
+        write_queue = queue.Queue(maxsize=self.write_queue_size)
+        writer = threading.Thread(target=self._write_loop, args=(write_queue,), name='clip-writer', daemon=True)
+        writer.start()
+        indices = iter(indices)
+        try:
+            with ThreadPoolExecutor(max_workers=self.reader_threads, thread_name_prefix='clip-reader') as readers:
+                pending = deque()
+                self._prefetch(readers, pending, indices)
+                while pending:
+                    index, future = pending.popleft()
+                    self._prefetch(readers, pending, indices)
+                    try:
+                        with self.metrics.stage('read_wait'):
+                            prepared, prepared_bytes = future.result()
+                    except Exception as e:
+                        self.logger.error(f"Error creating synthetic file {index+1}: {e}")
+                        continue
+                    try:
+                        result = self.process(prepared)
+                    except Exception as e:
+                        self.logger.error(f"Error creating synthetic file {index+1}: {e}")
+                        continue
+                    finally:
+                        # The future holds the inputs too; drop both so they are freed now
+                        prepared = future = None
+                        if self.budget is not None:
+                            self.budget.release('sources', prepared_bytes)
+                    if result[0] is None:
+                        self.logger.warning(f"Skipped synthetic file {index+1}: no usable segments")
+                        continue
+                    result_bytes = 0
+                    if self.budget is not None:
+                        result_bytes = nbytes(result)
+                        self.budget.add('outputs', result_bytes)
+                    with self.metrics.stage('write_wait'):
+                        write_queue.put((index, result, result_bytes))
+                    # The writer owns the result now, and frees it once written
+                    result = None
+        finally:
+            write_queue.put(_DONE)
+            writer.join()
+        return self.num_written
+
+    def _prefetch(self, readers, pending, indices):
+        while len(pending) < self.prefetch_depth:
+            # Over the memory budget, clips already read go first; with none left, wait for writes
+            if self.budget is not None and not self.budget.has_room():
+                if pending:
+                    return
+                with self.metrics.stage('memory_wait'):
+                    self.budget.wait_for_room()
+            index = next(indices, None)
+            if index is None:
+                return
+            pending.append((index, readers.submit(self._prepare, index)))
+
+    def _prepare(self, index):
+        prepared = self.prepare(index)
+        if self.budget is None:
+            return prepared, 0
+        prepared_bytes = nbytes(prepared)
+        self.budget.add('sources', prepared_bytes)
+        return prepared, prepared_bytes
+
+    def _write_loop(self, write_queue):
+        while True:
+            item = write_queue.get()
+            if item is _DONE:
+                return
+            index, result, result_bytes = item
+            try:
+                self.write(index, *result)
+                self.num_written += 1
+            except Exception as e:
+                self.logger.error(f"Error writing synthetic file {index+1}: {e}")
+            finally:
+                item = result = None
+                if self.budget is not None:
+                    self.budget.release('outputs', result_bytes)
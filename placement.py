@@ -0,0 +1,260 @@
+import numpy as np
+from noise_bank import snr_scale
+
+PLACEMENT_DTYPE = np.dtype([('segment_id', np.int64), ('dest_offset', np.int64), ('gain', np.float32), ('group', np.int32)])
+GROUP_DTYPE = np.dtype([('start', np.int64), ('end', np.int64)])
+
+class PlacementPlan:
+    """Where every segment of a synthetic clip goes, separated from rendering the audio.
+
+    ``placements`` holds one (segment_id, dest_offset, gain, group) row per placed segment,
+    with dest_offset in output samples. ``groups`` holds the (start, end) sample range of
+    each overlap group, which becomes one interval of the output TextGrid. A plan holds
+    no audio, so it can be saved, audited and rendered again without re-running the RNG.
+    ``effect_seed`` seeds random effects such as noise, if any are enabled, and
+    ``background_seed`` seeds the clip's background noise window and SNR.
+    """
+
+    def __init__(self, placements, groups, num_samples, channels, sample_rate, effect_seed=None, background_seed=None):
+        self.placements = placements
+        self.groups = groups
+        self.num_samples = num_samples
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.effect_seed = effect_seed
+        self.background_seed = background_seed
+
+    def __len__(self):
+        return len(self.placements)
+
+    def intervals(self, label='OV', placement_labels=None):
+        """Return one (start, end, label) interval per overlap group, in seconds.
+
+        Groups are labeled ``label``; with placement_labels (the label of every placement)
+        given, a group of a single segment is labeled with that segment's label instead.
+        """
+        labels = [label] * len(self.groups)
+        if placement_labels is not None:
+            group_sizes = np.bincount(self.placements['group'], minlength=len(self.groups))
+            for position, group in enumerate(self.placements['group'].tolist()):
+                if group_sizes[group] == 1:
+                    labels[group] = placement_labels[position]
+        return [(int(start) / self.sample_rate, int(end) / self.sample_rate, group_label)
+                for (start, end), group_label in zip(self.groups.tolist(), labels)]
+
+    def source_intervals(self, lengths, placement_labels):
+        """Return per-source tiers: tier k holds the k-th segment of every group as (start, end, label).
+
+        lengths holds the length of every placed segment, after effects. Intervals are cut
+        at the end of the clip.
+        """
+        tiers = []
+        rank_in_group = {}
+        group_ends = self.groups['end'][self.placements['group']]
+        for position, (group, start) in enumerate(zip(self.placements['group'].tolist(), self.placements['dest_offset'].tolist())):
+            rank = rank_in_group.get(group, 0)
+            rank_in_group[group] = rank + 1
+            end = min(start + int(lengths[position]), int(group_ends[position]))
+            if end <= start:
+                continue
+            while len(tiers) <= rank:
+                tiers.append([])
+            tiers[rank].append((start / self.sample_rate, end / self.sample_rate, placement_labels[position]))
+        return tiers
+
+    def render(self, get_audio, out=None, dtype=np.float64):
+        """Mix every placement into one output buffer.
+
+        ``get_audio(segment_id)`` returns the samples of a segment. Each segment is scaled
+        in a shared scratch buffer and added in place, so no per-group buffers are made.
+        """
+        shape = (self.num_samples,) if self.channels == 1 else (self.num_samples, self.channels)
+        if out is None:
+            out = np.zeros(shape, dtype=dtype)
+        scratch = None
+        for segment_id, dest_offset, gain, group in self.placements:
+            segment_audio = get_audio(int(segment_id))
+            length = min(len(segment_audio), int(self.groups[group]['end']) - int(dest_offset))
+            if length <= 0:
+                continue
+            if scratch is None or len(scratch) < length:
+                scratch = np.empty((length,) + shape[1:], dtype=out.dtype)
+            np.multiply(segment_audio[:length], gain, out=scratch[:length])
+            out[dest_offset:dest_offset + length] += scratch[:length]
+        return out
+
+    def render_chunks(self, get_audio, chunk_samples, dtype=np.float64):
+        """Yield the mix in consecutive blocks of at most chunk_samples samples.
+
+        The blocks are equal to ``render`` cut into pieces: every sample sums the same
+        placements in the same order. Only one block is held at a time.
+        """
+        segment_ids = self.placements['segment_id']
+        starts = self.placements['dest_offset']
+        lengths = np.array([len(get_audio(int(segment_id))) for segment_id in segment_ids], dtype=np.int64)
+        ends = np.minimum(starts + lengths, self.groups['end'][self.placements['group']])
+        tail = () if self.channels == 1 else (self.channels,)
+        scratch = None
+        for chunk_start in range(0, self.num_samples, chunk_samples):
+            chunk_end = min(chunk_start + chunk_samples, self.num_samples)
+            out = np.zeros((chunk_end - chunk_start,) + tail, dtype=dtype)
+            overlapping = (starts < chunk_end) & (ends > chunk_start) & (ends > starts)
+            for position in np.nonzero(overlapping)[0].tolist():
+                first, last = max(chunk_start, int(starts[position])), min(chunk_end, int(ends[position]))
+                length = last - first
+                if scratch is None or len(scratch) < length:
+                    scratch = np.empty((length,) + tail, dtype=dtype)
+                segment_audio = get_audio(int(segment_ids[position]))
+                offset = first - int(starts[position])
+                np.multiply(segment_audio[offset:offset + length], self.placements['gain'][position], out=scratch[:length])
+                out[first - chunk_start:last - chunk_start] += scratch[:length]
+            yield out
+
+    def save(self, file_path):
+        np.savez(file_path, placements=self.placements, groups=self.groups, num_samples=self.num_samples,
+                 channels=self.channels, sample_rate=self.sample_rate,
+                 effect_seed=-1 if self.effect_seed is None else self.effect_seed,
+                 background_seed=-1 if self.background_seed is None else self.background_seed)
+
+    @classmethod
+    def load(cls, file_path):
+        with np.load(file_path) as data:
+            effect_seed = int(data['effect_seed']) if 'effect_seed' in data else -1
+            background_seed = int(data['background_seed']) if 'background_seed' in data else -1
+            return cls(data['placements'], data['groups'], int(data['num_samples']), int(data['channels']),
+                       int(data['sample_rate']), None if effect_seed < 0 else effect_seed,
+                       None if background_seed < 0 else background_seed)
+
+    def to_dict(self):
+        return {
+            'num_samples': self.num_samples,
+            'channels': self.channels,
+            'sample_rate': self.sample_rate,
+            'effect_seed': self.effect_seed,
+            'background_seed': self.background_seed,
+            'groups': self.groups.tolist(),
+            'placements': [[int(s), int(d), float(g), int(gr)] for s, d, g, gr in self.placements],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        groups = np.array([tuple(group) for group in data['groups']], dtype=GROUP_DTYPE)
+        placements = np.array([tuple(p) for p in data['placements']], dtype=PLACEMENT_DTYPE)
+        return cls(placements, groups, data['num_samples'], data['channels'], data['sample_rate'],
+                   data.get('effect_seed'), data.get('background_seed'))
+
+def overlap_offsets(lengths, group_of, min_overlap, draws):
+    """Offsets of segments relative to the longest segment (the anchor) of their overlap group.
+
+    group_of holds the group of every segment, with each group's segments contiguous. A
+    segment of length L overlaps the anchor by at least ``ceil(min_overlap * L)`` samples
+    for every offset in [required - L, anchor_length - required]. Offsets are drawn
+    uniformly from that range with ``draws`` (one value in [0, 1) per segment), so every
+    segment meets the target without rejection. The anchor, the first longest segment of a
+    group, sits at offset 0.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    group_first = np.flatnonzero(np.r_[True, group_of[1:] != group_of[:-1]])
+    group_index = np.repeat(np.arange(len(group_first)), np.diff(np.r_[group_first, len(lengths)]))
+    anchor_lengths = np.maximum.reduceat(lengths, group_first)[group_index]
+    positions = np.arange(len(lengths))
+    anchors = np.minimum.reduceat(np.where(lengths == anchor_lengths, positions, len(lengths)), group_first)
+
+    required = np.minimum(np.ceil(min_overlap * lengths).astype(np.int64), lengths)
+    lowest = required - lengths
+    highest = anchor_lengths - required
+    offsets = lowest + (np.asarray(draws) * (highest - lowest + 1)).astype(np.int64)
+    offsets[anchors] = 0
+    return offsets
+
+def layout_groups(relative_offsets, lengths, group_of, silence_samples, num_samples):
+    """Lay overlap groups out one after another, separated by silence_samples.
+
+    relative_offsets are segment offsets within their group, as from ``overlap_offsets``,
+    and group_of numbers the groups from 0 in order. A group spans its segments from the
+    earliest start to the latest end. Returns the absolute offset of every segment and the
+    (start, end) of the groups that start within the clip, cut at num_samples; segments
+    of later groups are left for the caller to drop.
+    """
+    group_first = np.flatnonzero(np.r_[True, group_of[1:] != group_of[:-1]])
+    group_lowest = np.minimum.reduceat(relative_offsets, group_first)
+    widths = np.maximum.reduceat(relative_offsets + lengths, group_first) - group_lowest
+    starts = np.concatenate(([0], np.cumsum(widths + silence_samples)[:-1])).astype(np.int64)
+    dest_offsets = starts[group_of] - group_lowest[group_of] + relative_offsets
+
+    num_groups = int(np.searchsorted(starts, num_samples))
+    groups = np.empty(num_groups, dtype=GROUP_DTYPE)
+    groups['start'] = starts[:num_groups]
+    groups['end'] = np.minimum(starts + widths, num_samples)[:num_groups]
+    return dest_offsets, groups
+
+class StreamedClip:
+    """A synthesized clip that is rendered block by block while it is written.
+
+    Used for outputs too long to hold in memory. With ``noise`` (a ``ClipNoise``) set, a
+    first pass over the blocks measures signal and noise power for the noise gain. With
+    ``normalize`` set, another pass tracks the running peak, and the final pass yields the
+    blocks divided by it, so the result equals the normalized output of
+    ``PlacementPlan.render``.
+    """
+
+    def __init__(self, plan, get_audio, chunk_samples, dtype=np.float64, normalize=False, noise=None):
+        self.plan = plan
+        self.get_audio = get_audio
+        self.chunk_samples = chunk_samples
+        self.dtype = np.dtype(dtype)
+        self.normalize = normalize
+        self.noise = noise
+        self.channels = plan.channels
+
+    @property
+    def shape(self):
+        return (self.plan.num_samples,) if self.channels == 1 else (self.plan.num_samples, self.channels)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.plan.num_samples
+
+    @property
+    def nbytes(self):
+        """Memory held until the clip is written: the segments it mixes and one rendered block."""
+        segment_ids = np.unique(self.plan.placements['segment_id']).tolist()
+        block_bytes = min(self.chunk_samples, self.plan.num_samples) * self.channels * self.dtype.itemsize
+        return sum(self.get_audio(segment_id).nbytes for segment_id in segment_ids) + block_bytes
+
+    def noise_gain(self):
+        signal_energy = noise_energy = 0.0
+        position = 0
+        for block in self.plan.render_chunks(self.get_audio, self.chunk_samples, self.dtype):
+            noise = self.noise.block(position, len(block))
+            signal_energy += np.einsum('i,i->', block.ravel(), block.ravel(), dtype=np.float64)
+            noise_energy += np.einsum('i,i->', noise.ravel(), noise.ravel(), dtype=np.float64)
+            position += len(block)
+        return self.dtype.type(snr_scale(signal_energy, noise_energy, self.noise.snr_db))
+
+    def peak(self, noise_gain=None):
+        peak = self.dtype.type(0)
+        for block in self._mixed_blocks(noise_gain):
+            if len(block):
+                peak = max(peak, np.max(np.abs(block)))
+        return peak
+
+    def blocks(self):
+        noise_gain = self.noise_gain() if self.noise is not None else None
+        peak = self.peak(noise_gain) if self.normalize else None
+        for block in self._mixed_blocks(noise_gain):
+            # A silent mix is written as is, like the batch path does, rather than as NaN
+            if peak:
+                np.divide(block, peak, out=block)
+            yield block
+
+    def _mixed_blocks(self, noise_gain):
+        position = 0
+        for block in self.plan.render_chunks(self.get_audio, self.chunk_samples, self.dtype):
+            if noise_gain is not None:
+                block += self.noise.block(position, len(block)) * noise_gain
+            position += len(block)
+            yield block
@@ -0,0 +1,95 @@
+import math
+from functools import lru_cache
+import numpy as np
+
+@lru_cache(maxsize=None)
+def design_filter(orig_sr, target_sr):
+    """Return (up, down, taps) for a rational-ratio polyphase resampler.
+
+    The anti-aliasing filter is the Kaiser-windowed FIR that scipy's ``resample_poly``
+    designs by default; it is designed once per (orig_sr, target_sr) pair.
+    """
+    divisor = math.gcd(int(orig_sr), int(target_sr))
+    up, down = int(target_sr) // divisor, int(orig_sr) // divisor
+    if up == down:
+        return up, down, None
+    # scipy.signal takes a second to import, so runs that never resample skip it
+    from scipy import signal
+    max_rate = max(up, down)
+    taps = signal.firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=('kaiser', 5.0))
+    taps.setflags(write=False)
+    return up, down, taps
+
+def output_length(num_samples, orig_sr, target_sr):
+    up, down, _ = design_filter(orig_sr, target_sr)
+    return -(-num_samples * up // down)
+
+def filter_context(orig_sr, target_sr):
+    """Input samples on each side that affect an output sample, rounded up to a multiple of down."""
+    up, down, taps = design_filter(orig_sr, target_sr)
+    if taps is None:
+        return 0
+    return down * (-(-(len(taps) // (2 * up) + 2) // down))
+
+def resample(audio_data, orig_sr, target_sr):
+    """Resample along the first axis with a cached polyphase filter.
+
+    float32 input is filtered with float32 taps, so the output stays float32.
+    """
+    if orig_sr == target_sr:
+        return audio_data
+    up, down, taps = design_filter(orig_sr, target_sr)
+    from scipy import signal
+    return signal.resample_poly(audio_data, up, down, axis=0, window=_taps_for(taps, audio_data.dtype))
+
+def resample_blocks(blocks, orig_sr, target_sr, chunk_size=1 << 20):
+    """Resample a stream of input blocks, yielding output blocks.
+
+    The concatenated output equals ``resample`` applied to the concatenated input. Each
+    chunk is filtered together with enough neighbouring input to cover the filter
+    length, and the output belonging to that context is trimmed off again.
+    """
+    up, down, taps = design_filter(orig_sr, target_sr)
+    if up == down:
+        yield from blocks
+        return
+
+    # Input samples of context on each side, a multiple of down so trims are exact
+    context = filter_context(orig_sr, target_sr)
+    chunk_size = max(down, chunk_size - chunk_size % down)
+
+    history = None
+    pending = []
+    pending_length = 0
+    for block in blocks:
+        pending.append(block)
+        pending_length += len(block)
+        if pending_length < chunk_size + context:
+            continue
+        buffer = np.concatenate(pending, axis=0)
+        position = 0
+        while len(buffer) - position >= chunk_size + context:
+            yield _resample_chunk(history, buffer[position:position + chunk_size + context], chunk_size, up, down, taps)
+            history = buffer[position + chunk_size - context:position + chunk_size]
+            position += chunk_size
+        pending = [buffer[position:]]
+        pending_length = len(pending[0])
+
+    if pending_length:
+        rest = np.concatenate(pending, axis=0)
+        yield _resample_chunk(history, rest, None, up, down, taps)
+
+def _resample_chunk(history, chunk, core_length, up, down, taps):
+    if history is None:
+        padded, trim = chunk, 0
+    else:
+        padded, trim = np.concatenate((history, chunk), axis=0), len(history) * up // down
+    from scipy import signal
+    out = signal.resample_poly(padded, up, down, axis=0, window=_taps_for(taps, padded.dtype))
+    if core_length is None:
+        return out[trim:]
+    return out[trim:trim + core_length * up // down]
+
+def _taps_for(taps, dtype):
+    # A few thousand taps at most, so converting per call is cheap
+    return taps.astype(np.float32) if dtype == np.float32 else taps
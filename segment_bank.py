@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import numpy as np
+from catalog import textgrid_file
+from utils import ensure_dir
+
+class SegmentBank:
+    """Every labeled vocalization of the input corpus in one memory-mapped sample array.
+
+    Segments are stored back to back in ``samples.f32`` at the target sample rate. The
+    index (``index.npz``) holds the offset, length, label and source recording of each
+    segment, along with the segment's interval in the source recording, and
+    ``manifest.json`` records the inputs the bank was built from.
+    """
+
+    SAMPLES_FILE = 'samples.f32'
+    INDEX_FILE = 'index.npz'
+    MANIFEST_FILE = 'manifest.json'
+
+    def __init__(self, bank_dir, samples, offsets, lengths, label_codes, source_ids, label_names, source_files, sample_rate,
+                 source_starts=None, source_ends=None):
+        self.bank_dir = bank_dir
+        self.samples = samples
+        self.offsets = offsets
+        self.lengths = lengths
+        self.label_codes = label_codes
+        self.source_ids = source_ids
+        self.label_names = label_names
+        self.source_files = source_files
+        self.sample_rate = sample_rate
+        self.source_starts = source_starts
+        self.source_ends = source_ends
+        self.channels = samples.shape[1]
+        self.fingerprint = _fingerprint(bank_dir)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get(self, segment_id):
+        """Return a read-only view of a segment's samples."""
+        start = self.offsets[segment_id]
+        audio = self.samples[start:start + self.lengths[segment_id]]
+        return audio[:, 0] if self.channels == 1 else audio
+
+    def cache_key(self, segment_id):
+        """Key identifying a segment across runs, or None if the bank has no manifest."""
+        return (self.fingerprint, segment_id) if self.fingerprint else None
+
+    def label(self, segment_id):
+        return self.label_names[self.label_codes[segment_id]]
+
+    def source(self, segment_id):
+        return self.source_files[self.source_ids[segment_id]]
+
+    def origin(self, segment_id):
+        """Return (source recording, label, start, end) of a segment, with times in seconds.
+
+        Banks built before source times were recorded give None for start and end.
+        """
+        if self.source_starts is None:
+            return self.source(segment_id), self.label(segment_id), None, None
+        return (self.source(segment_id), self.label(segment_id), float(self.source_starts[segment_id]),
+                float(self.source_ends[segment_id]))
+
+    @classmethod
+    def load(cls, bank_dir):
+        with np.load(os.path.join(bank_dir, cls.INDEX_FILE)) as index:
+            offsets = index['offsets']
+            lengths = index['lengths']
+            label_codes = index['label_codes']
+            source_ids = index['source_ids']
+            label_names = [str(label) for label in index['label_names']]
+            source_files = [str(source) for source in index['source_files']]
+            sample_rate = int(index['sample_rate'])
+            channels = int(index['channels'])
+            total_samples = int(index['total_samples'])
+            source_starts = index['source_starts'] if 'source_starts' in index else None
+            source_ends = index['source_ends'] if 'source_ends' in index else None
+        if total_samples:
+            samples = np.memmap(os.path.join(bank_dir, cls.SAMPLES_FILE), dtype=np.float32, mode='r',
+                                shape=(total_samples, channels))
+        else:
+            samples = np.zeros((0, channels), dtype=np.float32)
+        return cls(bank_dir, samples, offsets, lengths, label_codes, source_ids, label_names, source_files, sample_rate,
+                   source_starts, source_ends)
+
+    @classmethod
+    def build(cls, bank_dir, wav_files, input_wav_dir, input_textgrid_dir, audio_processor, textgrid_handler, vocalization_labels, logger,
+              textgrid_files=None):
+        """Decode every input pair once and append its labeled intervals to the bank.
+
+        textgrid_files maps recordings to their TextGrids, as ``CorpusCatalog.textgrid_files()`` does.
+        """
+        ensure_dir(bank_dir)
+        vocalization_labels = {k.lower() for k in vocalization_labels}
+        offsets, lengths, label_codes, source_ids = [], [], [], []
+        source_starts, source_ends = [], []
+        label_names, label_lookup = [], {}
+        channels = None
+        total_samples = 0
+
+        with open(os.path.join(bank_dir, cls.SAMPLES_FILE), 'wb') as samples_file:
+            for source_id, wav_file in enumerate(wav_files):
+                wav_path = os.path.join(input_wav_dir, wav_file)
+                textgrid_path = os.path.join(input_textgrid_dir, textgrid_file(wav_file, textgrid_files))
+                annotations = textgrid_handler.read_textgrid(textgrid_path)
+                audio_data, sample_rate = audio_processor.read_labeled_audio(wav_path, annotations, vocalization_labels)
+
+                if channels is None:
+                    channels = audio_data.shape[1] if audio_data.ndim > 1 else 1
+
+                start_samples = (annotations.starts * sample_rate).astype(np.int64).tolist()
+                end_samples = (annotations.ends * sample_rate).astype(np.int64).tolist()
+                for interval, (label, start_sample, end_sample) in enumerate(zip(annotations.labels(), start_samples, end_samples)):
+                    if label.lower() not in vocalization_labels:
+                        continue
+                    segment_audio = audio_data[start_sample:end_sample]
+                    if len(segment_audio) == 0:
+                        continue
+                    segment_audio = _match_channels(segment_audio.reshape(len(segment_audio), -1), channels)
+                    if label not in label_lookup:
+                        label_lookup[label] = len(label_names)
+                        label_names.append(label)
+                    samples_file.write(np.ascontiguousarray(segment_audio, dtype=np.float32).tobytes())
+                    offsets.append(total_samples)
+                    lengths.append(len(segment_audio))
+                    label_codes.append(label_lookup[label])
+                    source_ids.append(source_id)
+                    source_starts.append(annotations.starts[interval])
+                    source_ends.append(annotations.ends[interval])
+                    total_samples += len(segment_audio)
+
+                logger.debug(f"Added {wav_file} to segment bank ({len(offsets)} segments so far)")
+
+        np.savez(
+            os.path.join(bank_dir, cls.INDEX_FILE),
+            offsets=np.asarray(offsets, dtype=np.int64),
+            lengths=np.asarray(lengths, dtype=np.int64),
+            label_codes=np.asarray(label_codes, dtype=np.int32),
+            source_ids=np.asarray(source_ids, dtype=np.int32),
+            label_names=np.asarray(label_names, dtype=str),
+            source_files=np.asarray(wav_files, dtype=str),
+            source_starts=np.asarray(source_starts, dtype=np.float64),
+            source_ends=np.asarray(source_ends, dtype=np.float64),
+            sample_rate=audio_processor.sample_rate,
+            channels=channels or 1,
+            total_samples=total_samples,
+        )
+        with open(os.path.join(bank_dir, cls.MANIFEST_FILE), 'w') as f:
+            json.dump(_source_manifest(wav_files, input_wav_dir, input_textgrid_dir, textgrid_files, audio_processor.sample_rate,
+                                       vocalization_labels), f)
+
+        logger.info(f"Built segment bank with {len(offsets)} segments ({total_samples} samples) from {len(wav_files)} recordings")
+        return cls.load(bank_dir)
+
+    @classmethod
+    def load_or_build(cls, bank_dir, wav_files, input_wav_dir, input_textgrid_dir, audio_processor, textgrid_handler, vocalization_labels, logger,
+                      textgrid_files=None):
+        """Load the bank in bank_dir, rebuilding it if the inputs have changed since it was built."""
+        manifest_path = os.path.join(bank_dir, cls.MANIFEST_FILE)
+        expected = _source_manifest(wav_files, input_wav_dir, input_textgrid_dir, textgrid_files, audio_processor.sample_rate,
+                                    {k.lower() for k in vocalization_labels})
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                if json.load(f) == expected:
+                    logger.info(f"Using existing segment bank in {bank_dir}")
+                    return cls.load(bank_dir)
+        return cls.build(bank_dir, wav_files, input_wav_dir, input_textgrid_dir, audio_processor, textgrid_handler,
+                         vocalization_labels, logger, textgrid_files)
+
+def _fingerprint(bank_dir):
+    # Identifies the bank contents, for caches that outlive a single run
+    manifest_path = os.path.join(bank_dir, SegmentBank.MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def _match_channels(audio_data, channels):
+    if audio_data.shape[1] == channels:
+        return audio_data
+    if audio_data.shape[1] == 1:
+        return np.repeat(audio_data, channels, axis=1)
+    return np.repeat(audio_data.mean(axis=1, keepdims=True), channels, axis=1)
+
+def _source_manifest(wav_files, input_wav_dir, input_textgrid_dir, textgrid_files, sample_rate, vocalization_labels):
+    sources = []
+    for wav_file in wav_files:
+        wav_stat = os.stat(os.path.join(input_wav_dir, wav_file))
+        textgrid_stat = os.stat(os.path.join(input_textgrid_dir, textgrid_file(wav_file, textgrid_files)))
+        sources.append([wav_file, wav_stat.st_size, wav_stat.st_mtime_ns, textgrid_stat.st_size, textgrid_stat.st_mtime_ns])
+    return {'sample_rate': sample_rate, 'labels': sorted(vocalization_labels), 'sources': sources}
@@ -0,0 +1,182 @@
+import bisect
+import numpy as np
+
+class SegmentIndex:
+    """Segments grouped by label and duration bucket for constant-time constrained draws.
+
+    Segment ids are sorted by (label, length). Each label owns a contiguous run of that
+    order, and a per-label bucket table maps a duration bucket to the first position of
+    that bucket, so the run of segments inside a duration range is found with two table
+    lookups plus a search inside the two edge buckets. Label weights (the per-label
+    probabilities from ``[VocalizationLabels]``) are folded into precomputed cumulative
+    weights over labels.
+    """
+
+    def __init__(self, lengths, label_codes, label_names, sample_rate, label_weights=None,
+                 min_length_ms=None, max_length_ms=None, bucket_ms=10):
+        lengths = np.asarray(lengths, dtype=np.int64)
+        label_codes = np.asarray(label_codes, dtype=np.int64)
+        self.lengths = lengths
+        self.label_codes = label_codes
+        self.label_names = list(label_names)
+        self.sample_rate = sample_rate
+        self.bucket_samples = max(1, int(bucket_ms * sample_rate / 1000))
+
+        # Apply the configured segment length limits once, at build time
+        keep = np.ones(len(lengths), dtype=bool)
+        if min_length_ms is not None:
+            keep &= lengths >= self._ms_to_samples(min_length_ms)
+        if max_length_ms is not None:
+            keep &= lengths <= self._ms_to_samples(max_length_ms)
+        candidates = np.nonzero(keep)[0]
+
+        order = np.lexsort((lengths[candidates], label_codes[candidates]))
+        self.ids = candidates[order]
+        self.sorted_lengths = lengths[self.ids]
+        sorted_codes = label_codes[self.ids]
+
+        self.label_bounds = []
+        self.bucket_starts = []
+        for code in range(len(self.label_names)):
+            start = int(np.searchsorted(sorted_codes, code, side='left'))
+            end = int(np.searchsorted(sorted_codes, code, side='right'))
+            self.label_bounds.append((start, end))
+            buckets = self.sorted_lengths[start:end] // self.bucket_samples
+            num_buckets = int(buckets[-1]) + 1 if end > start else 0
+            self.bucket_starts.append(start + np.searchsorted(buckets, np.arange(num_buckets + 1), side='left'))
+
+        if label_weights is None:
+            label_weights = {}
+        self.label_weights = np.array([float(label_weights.get(name.lower(), 1.0 if not label_weights else 0.0))
+                                       for name in self.label_names])
+        counts = np.array([end - start for start, end in self.label_bounds], dtype=np.float64)
+        self.cumulative_weights = np.cumsum(self.label_weights * counts).tolist()
+        # The same weights per sorted position, for drawing many segments at once
+        position_weights = self.label_weights[sorted_codes] if len(self.ids) else np.zeros(0)
+        self.position_cumulative = np.cumsum(position_weights)
+        self.num_drawable = int(np.count_nonzero(position_weights > 0))
+
+    @classmethod
+    def from_segments(cls, segments, sample_rate, label_weights=None, min_length_ms=None, max_length_ms=None):
+        """Index a list of (audio, label) tuples such as the output of extract_segments."""
+        label_names, label_lookup, label_codes = [], {}, []
+        for _, label in segments:
+            if label not in label_lookup:
+                label_lookup[label] = len(label_names)
+                label_names.append(label)
+            label_codes.append(label_lookup[label])
+        return cls([len(audio) for audio, _ in segments], label_codes, label_names, sample_rate,
+                   label_weights, min_length_ms, max_length_ms)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def count(self, label=None, min_length_ms=None, max_length_ms=None):
+        """Number of indexed segments matching the given label and duration range."""
+        return sum(end - start for _, start, end in self._runs(label, min_length_ms, max_length_ms))
+
+    def sample(self, rng, k, label=None, min_length_ms=None, max_length_ms=None):
+        """Draw up to k distinct segment ids, weighted by label probability.
+
+        ``rng`` is a ``random.Random``. Without a label or duration constraint the draw
+        uses the precomputed cumulative label weights; constrained draws only look up the
+        run boundaries of each matching label.
+        """
+        if label is None and min_length_ms is None and max_length_ms is None:
+            runs = [(code, start, end) for code, (start, end) in enumerate(self.label_bounds)]
+            cumulative = self.cumulative_weights
+        else:
+            runs = self._runs(label, min_length_ms, max_length_ms)
+            cumulative = np.cumsum([self.label_weights[code] * (end - start) for code, start, end in runs]).tolist()
+
+        available = sum(end - start for code, start, end in runs if self.label_weights[code] > 0)
+        k = min(k, available)
+        if k <= 0:
+            return []
+
+        total = cumulative[-1]
+        chosen = []
+        while len(chosen) < k:
+            # Pick a label run by weight, then a uniform position inside it
+            run = min(bisect.bisect_right(cumulative, rng.random() * total), len(runs) - 1)
+            _, start, end = runs[run]
+            if end == start:
+                continue
+            segment_id = int(self.ids[start + int(rng.random() * (end - start))])
+            if segment_id not in chosen:
+                chosen.append(segment_id)
+            elif available <= 2 * k:
+                # Nearly the whole pool is requested; finish without rejection sampling
+                return chosen + self._sample_remaining(rng, k - len(chosen), runs, chosen)
+        return chosen
+
+    def sample_groups(self, rng, group_sizes):
+        """Draw segment ids for several groups at once, distinct within each group.
+
+        ``rng`` is a ``numpy.random.Generator``. Segments are weighted by label probability
+        as in ``sample``, and group g gets min(group_sizes[g], drawable segments) ids. All
+        groups are drawn together, and only ids repeated within a group are drawn again.
+        Returns the ids of every group, concatenated in group order, and the group sizes.
+        """
+        sizes = np.minimum(np.asarray(group_sizes, dtype=np.int64), self.num_drawable)
+        group_of = np.repeat(np.arange(len(sizes)), sizes)
+        positions = self._draw_positions(rng, len(group_of))
+        while True:
+            order = np.lexsort((positions, group_of))
+            repeated = np.zeros(len(order), dtype=bool)
+            repeated[1:] = (group_of[order][1:] == group_of[order][:-1]) & (positions[order][1:] == positions[order][:-1])
+            if not repeated.any():
+                break
+            redraw = order[repeated]
+            positions[redraw] = self._draw_positions(rng, len(redraw))
+        return self.ids[positions].astype(np.int64), sizes
+
+    def _draw_positions(self, rng, n):
+        if not n:
+            return np.zeros(0, dtype=np.int64)
+        # Zero-weight positions add nothing to the cumulative sum, so they are never drawn
+        total = self.position_cumulative[-1]
+        return np.minimum(np.searchsorted(self.position_cumulative, rng.random(n) * total, side='right'), len(self.ids) - 1)
+
+    def _sample_remaining(self, rng, k, runs, chosen):
+        remaining = [(int(self.ids[position]), self.label_weights[code])
+                     for code, start, end in runs for position in range(start, end)
+                     if self.label_weights[code] > 0 and int(self.ids[position]) not in chosen]
+        drawn = []
+        for _ in range(k):
+            cumulative = np.cumsum([weight for _, weight in remaining]).tolist()
+            pick = min(bisect.bisect_right(cumulative, rng.random() * cumulative[-1]), len(remaining) - 1)
+            drawn.append(remaining.pop(pick)[0])
+        return drawn
+
+    def _runs(self, label, min_length_ms, max_length_ms):
+        if label is None:
+            codes = range(len(self.label_names))
+        else:
+            codes = [code for code, name in enumerate(self.label_names) if name.lower() == label.lower()]
+        min_length = self._ms_to_samples(min_length_ms) if min_length_ms is not None else None
+        max_length = self._ms_to_samples(max_length_ms) if max_length_ms is not None else None
+
+        runs = []
+        for code in codes:
+            start, end = self.label_bounds[code]
+            low = self._position(code, min_length, 'left') if min_length is not None else start
+            high = self._position(code, max_length, 'right') if max_length is not None else end
+            runs.append((code, low, max(low, high)))
+        return runs
+
+    def _position(self, code, length, side):
+        start, end = self.label_bounds[code]
+        table = self.bucket_starts[code]
+        if start == end:
+            return start
+        bucket = length // self.bucket_samples
+        if bucket < 0:
+            return start
+        if bucket >= len(table) - 1:
+            return end
+        low, high = int(table[bucket]), int(table[bucket + 1])
+        return low + int(np.searchsorted(self.sorted_lengths[low:high], length, side=side))
+
+    def _ms_to_samples(self, duration_ms):
+        return int(duration_ms * self.sample_rate / 1000)
@@ -0,0 +1,311 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from utils import ensure_dir
+
+SHARD_DTYPES = {'float64': np.float64, 'float32': np.float32, 'int16': np.int16}
+METADATA_FILE = 'shards.json'
+INDEX_FILE = 'index.npz'
+
+class ShardWriter:
+    """Append synthetic clips to large fixed-dtype shard files.
+
+    Samples go into ``<name>-NNNNN.bin`` as raw interleaved samples. Every appended clip
+    adds one JSON line to the shard's ``.jsonl`` file with its output index, sample offset,
+    length, SHA-256 of the stored samples, TextGrid intervals, TextGrid duration and any
+    further TextGrid tiers. The line is written only after the samples are flushed,
+    so a shard never indexes missing audio. Several writers (one per worker process) can
+    share a shard directory as long as their names differ.
+
+    Clips stored in the processing dtype are exported to the same WAV files as a direct
+    run writes; ``subtype`` is the WAV sample format they are exported with.
+    """
+
+    def __init__(self, shard_dir, name, sample_rate, dtype='float32', shard_size_mb=1024, subtype='PCM_16'):
+        if dtype not in SHARD_DTYPES:
+            raise ValueError(f"Unsupported shard dtype '{dtype}'; expected one of {', '.join(SHARD_DTYPES)}")
+        self.shard_dir = shard_dir
+        self.name = name
+        self.sample_rate = sample_rate
+        self.dtype_name = dtype
+        self.dtype = np.dtype(SHARD_DTYPES[dtype])
+        self.subtype = subtype
+        self.shard_size_bytes = shard_size_mb * 1024 * 1024
+        self.channels = None
+        self.shard_number = -1
+        self.samples_file = None
+        self.index_file = None
+        self.shard_file = None
+        self.position = 0
+        ensure_dir(shard_dir)
+
+    def append(self, index, audio_data, intervals, duration=None, extra_tiers=()):
+        """Append a clip to the current shard, returning (bytes written, SHA-256 of the stored samples).
+
+        duration is that of the clip's TextGrid (by default the clip length), and extra_tiers
+        are (tier name, intervals) written after the intervals' 'vocalizations' tier.
+        """
+        audio_data = audio_data.reshape(len(audio_data), -1)
+        if self.channels is None:
+            # The channel count is fixed by the first clip written to the directory
+            write_metadata(self.shard_dir, self.sample_rate, audio_data.shape[1], self.dtype_name, self.subtype)
+            self.channels = audio_data.shape[1]
+        if audio_data.shape[1] != self.channels:
+            raise ValueError(f"Clip {index} has {audio_data.shape[1]} channels, shards hold {self.channels}")
+        max_shard_samples = max(1, self.shard_size_bytes // (self.dtype.itemsize * self.channels))
+        if self.samples_file is None or self.position + len(audio_data) > max_shard_samples:
+            self._open_next_shard()
+
+        if self.dtype == np.int16:
+            audio_data = np.round(np.clip(audio_data, -1.0, 1.0) * 32767).astype(np.int16)
+        else:
+            audio_data = np.ascontiguousarray(audio_data, dtype=self.dtype)
+        samples = memoryview(audio_data).cast('B')
+        self.samples_file.write(samples)
+        self.samples_file.flush()
+        checksum = hashlib.sha256(samples).hexdigest()
+
+        record = {'index': index, 'offset': self.position, 'length': len(audio_data), 'sha256': checksum,
+                  'intervals': _interval_list(intervals),
+                  'duration': float(duration) if duration is not None else len(audio_data) / self.sample_rate,
+                  'tiers': [[tier_name, _interval_list(tier_intervals)] for tier_name, tier_intervals in extra_tiers],
+                  'written': time.time_ns()}
+        self.index_file.write(json.dumps(record) + '\n')
+        self.index_file.flush()
+        self.position += len(audio_data)
+        return audio_data.nbytes, checksum
+
+    def close(self):
+        if self.samples_file is not None:
+            self.samples_file.close()
+            self.index_file.close()
+            self.samples_file = self.index_file = None
+
+    def _open_next_shard(self):
+        self.close()
+        self.shard_number += 1
+        shard_path = os.path.join(self.shard_dir, f"{self.name}-{self.shard_number:05d}")
+        self.shard_file = os.path.basename(shard_path) + '.bin'
+        self.samples_file = open(shard_path + '.bin', 'ab')
+        self.index_file = open(shard_path + '.jsonl', 'a')
+        self.position = self.samples_file.tell() // (self.dtype.itemsize * self.channels)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ShardReader:
+    """Random access to the clips of a shard directory through memory-mapped shards.
+
+    ``reader[i]`` returns (audio, intervals) for output index i, where audio is a
+    read-only view into the shard file. ``tiers(i)`` and ``duration(i)`` give all TextGrid
+    tiers of the clip and the TextGrid duration.
+    """
+
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        metadata = read_metadata(shard_dir)
+        self.sample_rate = metadata['sample_rate']
+        self.channels = metadata['channels']
+        self.dtype = np.dtype(SHARD_DTYPES[metadata['dtype']])
+        self.subtype = metadata.get('subtype', 'PCM_16')
+
+        index_path = os.path.join(shard_dir, INDEX_FILE)
+        if not os.path.exists(index_path) or _index_is_stale(shard_dir, index_path):
+            consolidate_index(shard_dir)
+        with np.load(index_path) as index:
+            self.shard_files = [str(name) for name in index['shard_files']]
+            self.clip_indices = index['clip_indices']
+            self.shard_ids = index['shard_ids']
+            self.offsets = index['offsets']
+            self.lengths = index['lengths']
+            self.interval_bounds = index['interval_bounds']
+            self.interval_starts = index['interval_starts']
+            self.interval_ends = index['interval_ends']
+            self.interval_labels = index['interval_labels']
+            self.label_names = [str(label) for label in index['label_names']]
+            self.durations = index['durations']
+            self.tier_bounds = index['tier_bounds']
+            self.tier_names = [str(name) for name in index['tier_names']]
+            self.tier_interval_bounds = index['tier_interval_bounds']
+            self.tier_interval_starts = index['tier_interval_starts']
+            self.tier_interval_ends = index['tier_interval_ends']
+            self.tier_interval_labels = index['tier_interval_labels']
+        self.positions = {int(clip_index): position for position, clip_index in enumerate(self.clip_indices)}
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.clip_indices)
+
+    def __contains__(self, index):
+        return index in self.positions
+
+    def indices(self):
+        return self.clip_indices.tolist()
+
+    def __getitem__(self, index):
+        position = self.positions[index]
+        shard = self._shard(int(self.shard_ids[position]))
+        offset = int(self.offsets[position])
+        audio_data = shard[offset:offset + int(self.lengths[position])]
+        if self.channels == 1:
+            audio_data = audio_data[:, 0]
+        first, last = self.interval_bounds[position], self.interval_bounds[position + 1]
+        return audio_data, self._intervals(self.interval_starts, self.interval_ends, self.interval_labels, first, last)
+
+    def duration(self, index):
+        return float(self.durations[self.positions[index]])
+
+    def tiers(self, index):
+        """(tier name, intervals) of every TextGrid tier of clip index, 'vocalizations' first."""
+        position = self.positions[index]
+        first, last = self.interval_bounds[position], self.interval_bounds[position + 1]
+        tiers = [('vocalizations', self._intervals(self.interval_starts, self.interval_ends, self.interval_labels, first, last))]
+        for tier in range(self.tier_bounds[position], self.tier_bounds[position + 1]):
+            first, last = self.tier_interval_bounds[tier], self.tier_interval_bounds[tier + 1]
+            tiers.append((self.tier_names[tier], self._intervals(self.tier_interval_starts, self.tier_interval_ends,
+                                                                 self.tier_interval_labels, first, last)))
+        return tiers
+
+    def _intervals(self, starts, ends, labels, first, last):
+        return [(float(start), float(end), self.label_names[label]) for start, end, label in
+                zip(starts[first:last], ends[first:last], labels[first:last])]
+
+    def _shard(self, shard_id):
+        if shard_id not in self._shards:
+            path = os.path.join(self.shard_dir, self.shard_files[shard_id])
+            self._shards[shard_id] = np.memmap(path, dtype=self.dtype, mode='r').reshape(-1, self.channels)
+        return self._shards[shard_id]
+
+def write_metadata(shard_dir, sample_rate, channels, dtype, subtype='PCM_16'):
+    metadata = {'sample_rate': sample_rate, 'channels': channels, 'dtype': dtype, 'subtype': subtype}
+    path = os.path.join(shard_dir, METADATA_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            if json.load(f) != metadata:
+                raise ValueError(f"Shard directory '{shard_dir}' already holds shards with different settings")
+        return
+    # Workers may race to create the file; write it atomically
+    temp_path = f"{path}.{os.getpid()}"
+    with open(temp_path, 'w') as f:
+        json.dump(metadata, f)
+    os.replace(temp_path, path)
+
+def consolidate_index(shard_dir):
+    """Merge the per-shard .jsonl indexes into one compact index.npz, sorted by clip index.
+
+    A clip written more than once, e.g. by a rerun into the same directory, is indexed by
+    its most recent record only.
+    """
+    records = []
+    shard_files = []
+    for jsonl_path in sorted(glob.glob(os.path.join(shard_dir, '*.jsonl'))):
+        shard_id = len(shard_files)
+        shard_files.append(os.path.basename(jsonl_path)[:-len('.jsonl')] + '.bin')
+        with open(jsonl_path) as f:
+            for line in f:
+                if line.strip():
+                    records.append((shard_id, json.loads(line)))
+    # Sorting is stable, so records of one index written at the same time keep their file order
+    records.sort(key=lambda record: (record[1]['index'], record[1].get('written', 0)))
+    records = [record for position, record in enumerate(records)
+               if position + 1 == len(records) or records[position + 1][1]['index'] != record[1]['index']]
+
+    label_names, label_lookup = [], {}
+
+    def add_intervals(intervals, starts, ends, labels):
+        for start, end, label in intervals:
+            if label not in label_lookup:
+                label_lookup[label] = len(label_names)
+                label_names.append(label)
+            starts.append(start)
+            ends.append(end)
+            labels.append(label_lookup[label])
+
+    interval_starts, interval_ends, interval_labels, interval_bounds = [], [], [], [0]
+    tier_names, tier_bounds = [], [0]
+    tier_interval_starts, tier_interval_ends, tier_interval_labels, tier_interval_bounds = [], [], [], [0]
+    for _, record in records:
+        add_intervals(record['intervals'], interval_starts, interval_ends, interval_labels)
+        interval_bounds.append(len(interval_starts))
+        for tier_name, intervals in record.get('tiers', []):
+            tier_names.append(tier_name)
+            add_intervals(intervals, tier_interval_starts, tier_interval_ends, tier_interval_labels)
+            tier_interval_bounds.append(len(tier_interval_starts))
+        tier_bounds.append(len(tier_names))
+    # Shards written before durations were recorded hold clips as long as their TextGrids
+    sample_rate = read_metadata(shard_dir)['sample_rate'] if records else 1
+
+    np.savez(
+        os.path.join(shard_dir, INDEX_FILE),
+        shard_files=np.asarray(shard_files, dtype=str),
+        clip_indices=np.asarray([record['index'] for _, record in records], dtype=np.int64),
+        shard_ids=np.asarray([shard_id for shard_id, _ in records], dtype=np.int32),
+        offsets=np.asarray([record['offset'] for _, record in records], dtype=np.int64),
+        lengths=np.asarray([record['length'] for _, record in records], dtype=np.int64),
+        interval_bounds=np.asarray(interval_bounds, dtype=np.int64),
+        interval_starts=np.asarray(interval_starts, dtype=np.float64),
+        interval_ends=np.asarray(interval_ends, dtype=np.float64),
+        interval_labels=np.asarray(interval_labels, dtype=np.int32),
+        label_names=np.asarray(label_names, dtype=str),
+        durations=np.asarray([record.get('duration', record['length'] / sample_rate) for _, record in records],
+                             dtype=np.float64),
+        tier_bounds=np.asarray(tier_bounds, dtype=np.int64),
+        tier_names=np.asarray(tier_names, dtype=str),
+        tier_interval_bounds=np.asarray(tier_interval_bounds, dtype=np.int64),
+        tier_interval_starts=np.asarray(tier_interval_starts, dtype=np.float64),
+        tier_interval_ends=np.asarray(tier_interval_ends, dtype=np.float64),
+        tier_interval_labels=np.asarray(tier_interval_labels, dtype=np.int32),
+    )
+
+def read_metadata(shard_dir):
+    with open(os.path.join(shard_dir, METADATA_FILE)) as f:
+        return json.load(f)
+
+def _interval_list(intervals):
+    return [[float(start), float(end), label] for start, end, label in intervals]
+
+def _index_is_stale(shard_dir, index_path):
+    with np.load(index_path) as index:
+        # Indexes written before durations and tiers were recorded
+        if 'durations' not in index.files:
+            return True
+    index_mtime = os.path.getmtime(index_path)
+    return any(os.path.getmtime(path) > index_mtime for path in glob.glob(os.path.join(shard_dir, '*.jsonl')))
+
+def export_shards(shard_dir, output_wav_dir, output_textgrid_dir, file_prefix, indices=None, subtype=None):
+    """Convert shard clips back to one WAV and one TextGrid per clip, e.g. for Praat.
+
+    WAV files use the ``output_subtype`` the shards were written with, unless subtype is given.
+    """
+    import soundfile as sf
+    from textgrid_handler import TextGridHandler
+
+    reader = ShardReader(shard_dir)
+    textgrid_handler = TextGridHandler()
+    ensure_dir(output_wav_dir)
+    ensure_dir(output_textgrid_dir)
+    for index in (reader.indices() if indices is None else indices):
+        audio_data, _ = reader[index]
+        sf.write(os.path.join(output_wav_dir, f"{file_prefix}{index+1}.wav"), audio_data, reader.sample_rate,
+                 subtype=subtype or reader.subtype)
+        textgrid_handler.write_tiers(os.path.join(output_textgrid_dir, f"{file_prefix}{index+1}.TextGrid"), reader.tiers(index),
+                                     reader.duration(index))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export clips from a shard directory as WAV and TextGrid files.")
+    parser.add_argument('shard_dir')
+    parser.add_argument('output_wav_dir')
+    parser.add_argument('output_textgrid_dir')
+    parser.add_argument('--prefix', default='synthetic_')
+    parser.add_argument('--indices', type=int, nargs='*', help="zero-based clip indices to export (default: all)")
+    parser.add_argument('--subtype', choices=['PCM_16', 'PCM_24', 'PCM_32', 'FLOAT'],
+                        help="WAV sample format (default: the output_subtype the shards were written with)")
+    args = parser.parse_args()
+    export_shards(args.shard_dir, args.output_wav_dir, args.output_textgrid_dir, args.prefix, args.indices, args.subtype)
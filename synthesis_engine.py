@@ -1,126 +1,396 @@
 import numpy as np
 import random
+from segment_index import SegmentIndex
+from placement import PLACEMENT_DTYPE, PlacementPlan, StreamedClip, layout_groups, overlap_offsets
+from effects import EffectChain
+from effect_cache import EffectCache
+from noise_bank import NoiseBank, mix_at_snr
+from textgrid_handler import TextGridHandler
 
 class SynthesisEngine:
-    def __init__(self, config_manager, logger, audio_processor):
+    def __init__(self, config_manager, logger, audio_processor, metrics=None):
         self.config = config_manager
         self.logger = logger
         self.audio_processor = audio_processor
+        self.metrics = metrics if metrics is not None else audio_processor.metrics
         self.random = random.Random(self.config.get_int('Synthesis', 'random_seed'))
         self.sample_rate = self.config.get_int('AudioProperties', 'sample_rate')
+        self.file_length_seconds = self.config.get_float('Synthesis', 'file_length_seconds')
+        self.dtype = audio_processor.dtype
+        self.stream_chunk_samples = int(self.config.get_float('Output', 'stream_chunk_seconds', fallback=0) * self.sample_rate)
         self.audio_effects = self.config.get_audio_effects()
-        self.logger.debug(f"Initialized SynthesisEngine with vocalization labels: {self.config.get_vocalization_labels()}")
+        self.effect_chain = EffectChain(self.audio_effects, self.sample_rate)
+        self.effect_cache = None
+        effect_cache_mb = self.config.get_int('Performance', 'effect_cache_mb', fallback=256)
+        if self.effect_chain.is_deterministic and effect_cache_mb > 0:
+            self.effect_cache = EffectCache(effect_cache_mb * 1024 * 1024,
+                                            self.config.get('Performance', 'effect_cache_dir', fallback='') or None,
+                                            self.config.get_int('Performance', 'effect_cache_disk_mb', fallback=1024) * 1024 * 1024)
+        # Background noise is drawn from a bank built once, rather than generated per clip
+        self.background_noise = self.config.get_background_noise()
+        self.noise_bank = None
+        if self.background_noise is not None:
+            self.noise_bank = NoiseBank.load_or_build(self.config.get('Paths', 'noise_bank_dir'), self.background_noise,
+                                                      self.sample_rate, self.config.get_int('Synthesis', 'random_seed'),
+                                                      audio_processor, logger)
+        self.min_segment_length_ms = self.config.get_int('AudioProperties', 'min_segment_length_ms')
+        self.max_segment_length_ms = self.config.get_int('AudioProperties', 'max_segment_length_ms')
+        # Settings used for every clip are read once
+        self.vocalization_labels = self.config.get_vocalization_labels()
+        self.normalize_output = self.config.get_bool('Synthesis', 'normalize_output')
+        self.amplitude_scaling = self.config.get_float('Synthesis', 'amplitude_scaling')
+        self.min_overlap = self.config.get_float('Synthesis', 'min_overlap_percentage') / 100
+        self.max_overlaps = self.config.get_int('Synthesis', 'max_overlaps')
+        self.silence_samples = int(self.config.get_int('Synthesis', 'silence_duration_ms') * self.sample_rate / 1000)
+        self._bank_index = None
+        self._indexed_bank = None
+        # Plan, segment index and segment origins of the last clip, described by placement_origins()
+        # and source_tiers()
+        self.last_plan = None
+        self.last_segment_index = None
+        self.last_segment_origin = None
+        self.logger.debug(f"Initialized SynthesisEngine with vocalization labels: {self.vocalization_labels}")
+
+    def reseed(self, seed):
+        self.random = random.Random(seed)
 
     def select_random_file(self, file_list):
         return self.random.choice(file_list)
 
-    def synthesize_single(self, audio_data, textgrid_data, original_sample_rate):
+    def synthesize_single(self, audio_data, annotations, original_sample_rate):
         try:
-            file_length_seconds = self.config.get_float('Synthesis', 'file_length_seconds')
-            min_overlap_percentage = self.config.get_float('Synthesis', 'min_overlap_percentage') / 100
-            max_overlaps = self.config.get_int('Synthesis', 'max_overlaps')
-            amplitude_scaling = self.config.get_float('Synthesis', 'amplitude_scaling')
-            normalize_output = self.config.get_bool('Synthesis', 'normalize_output')
-            silence_duration_ms = self.config.get_int('Synthesis', 'silence_duration_ms')
-            
-            vocalization_labels = self.config.get_vocalization_labels()
+            synthetic_audio, synthetic_intervals = self.generate_single(audio_data, annotations, original_sample_rate)
+            if synthetic_audio is None:
+                return None, None
+            return synthetic_audio, TextGridHandler.create_synthetic_textgrid(synthetic_intervals, self.file_length_seconds)
 
-            # Extract vocalization segments
-            segments = self.extract_segments(textgrid_data, vocalization_labels, audio_data, original_sample_rate)
+        except Exception as e:
+            self.logger.error(f"Error in synthesize_single: {str(e)}")
+            import traceback
+            self.logger.error(traceback.format_exc())
+            return None, None
 
-            if not segments:
-                self.logger.warning("No valid segments found. Skipping this file.")
+    def synthesize_from_bank(self, segment_bank):
+        try:
+            synthetic_audio, synthetic_intervals = self.generate_from_bank(segment_bank)
+            if synthetic_audio is None:
                 return None, None
-
-            # Determine if the audio is stereo or mono
-            is_stereo = len(audio_data.shape) > 1 and audio_data.shape[1] == 2
-            
-            # Create synthetic audio
-            if is_stereo:
-                synthetic_audio = np.zeros((int(file_length_seconds * self.sample_rate), 2))
-            else:
-                synthetic_audio = np.zeros(int(file_length_seconds * self.sample_rate))
-
-            synthetic_intervals = []
-
-            current_position = 0
-            while current_position < len(synthetic_audio):
-                # Decide number of overlaps for this section
-                num_overlaps = self.random.randint(1, max_overlaps)
-                
-                # Select segments to overlap
-                selected_segments = self.select_segments(segments, num_overlaps)
-                
-                # Calculate overlap region
-                overlap_start = current_position
-                overlap_end = min(current_position + max(len(seg) for seg, _ in selected_segments), len(synthetic_audio))
-                
-                # Mix segments
-                mixed_audio = self.mix_segments(selected_segments, overlap_end - overlap_start, amplitude_scaling)
-                
-                # Apply audio effects if enabled
-                if self.audio_effects:
-                    mixed_audio = self.apply_audio_effects(mixed_audio)
-                
-                # Add mixed audio to synthetic audio
-                if is_stereo:
-                    synthetic_audio[overlap_start:overlap_end] += mixed_audio
-                else:
-                    synthetic_audio[overlap_start:overlap_end] += mixed_audio.reshape(-1)
-                
-                # Add interval to synthetic TextGrid
-                synthetic_intervals.append((overlap_start / self.sample_rate, overlap_end / self.sample_rate, 'OV'))
-                
-                # Move current position
-                current_position = overlap_end + int(silence_duration_ms * self.sample_rate / 1000)
-
-            # Normalize if required
-            if normalize_output:
-                if is_stereo:
-                    synthetic_audio = self.audio_processor.normalize_audio(synthetic_audio)
-                else:
-                    synthetic_audio = self.audio_processor.normalize_audio(synthetic_audio.reshape(-1))
-
-            # Create synthetic TextGrid
-            synthetic_textgrid = self.create_synthetic_textgrid(synthetic_intervals, file_length_seconds)
-
-            return synthetic_audio, synthetic_textgrid
+            return synthetic_audio, TextGridHandler.create_synthetic_textgrid(synthetic_intervals, self.file_length_seconds)
 
         except Exception as e:
-            self.logger.error(f"Error in synthesize_single: {str(e)}")
+            self.logger.error(f"Error in synthesize_from_bank: {str(e)}")
             import traceback
             self.logger.error(traceback.format_exc())
             return None, None
 
-    def extract_segments(self, textgrid_data, vocalization_labels, audio_data, original_sample_rate):
+    def generate_single(self, audio_data, annotations, original_sample_rate, stream=False):
+        """Synthesize one clip from a single recording, returning (audio, intervals).
+
+        With stream set, audio is a StreamedClip that is rendered while it is written.
+        """
+        # Extract vocalization segments
+        origins = []
+        segments = self.extract_segments(annotations, self.vocalization_labels, audio_data, original_sample_rate, origins)
+
+        if not segments:
+            self.logger.warning("No valid segments found. Skipping this file.")
+            return None, None
+
+        # Label probabilities were already applied by extract_segments
+        segment_index = SegmentIndex.from_segments(segments, self.sample_rate,
+                                                   min_length_ms=self.min_segment_length_ms,
+                                                   max_length_ms=self.max_segment_length_ms)
+        if not len(segment_index):
+            self.logger.warning("No segments within the configured length limits. Skipping this file.")
+            return None, None
+
+        # Determine if the audio is stereo or mono
+        is_stereo = len(audio_data.shape) > 1 and audio_data.shape[1] == 2
+
+        self.last_segment_origin = lambda segment_id: (None, segments[segment_id][1]) + origins[segment_id]
+        return self.synthesize_from_segments(segment_index, segments.__getitem__, is_stereo, stream=stream)
+
+    def generate_from_bank(self, segment_bank, stream=False):
+        """Synthesize one clip from the segments of a SegmentBank, returning (audio, intervals)."""
+        segment_index = self.get_bank_index(segment_bank)
+
+        if not len(segment_index):
+            self.logger.warning("No valid segments in the segment bank. Skipping this file.")
+            return None, None
+
+        def get_segment(segment_id):
+            return segment_bank.get(segment_id), segment_bank.label(segment_id)
+
+        self.last_segment_origin = segment_bank.origin
+        return self.synthesize_from_segments(segment_index, get_segment, segment_bank.channels == 2, segment_bank.cache_key,
+                                             stream)
+
+    def get_bank_index(self, segment_bank):
+        # The index over a bank is built once and reused for every clip drawn from it
+        if self._indexed_bank is not segment_bank:
+            self._bank_index = SegmentIndex(segment_bank.lengths, segment_bank.label_codes, segment_bank.label_names,
+                                            segment_bank.sample_rate, self.vocalization_labels,
+                                            self.min_segment_length_ms, self.max_segment_length_ms)
+            self._indexed_bank = segment_bank
+        return self._bank_index
+
+    def synthesize_from_segments(self, segment_index, get_segment, is_stereo, cache_key=None, stream=False):
+
+        # Plan every placement first, then render them into one output buffer
+        with self.metrics.stage('plan'):
+            plan = self.plan_placements(segment_index, int(self.file_length_seconds * self.sample_rate), 2 if is_stereo else 1)
+        self.metrics.count_labels(segment_index.label_names, segment_index.label_codes[plan.placements['segment_id']])
+        self.last_plan = plan
+        self.last_segment_index = segment_index
+        intervals = plan.intervals(placement_labels=self.placement_labels(plan, segment_index))
+        if stream and self.stream_chunk_samples:
+            # Only effect-processed segments are held; the mix is rendered block by block when written
+            return (StreamedClip(plan, self.segment_lookup(plan, get_segment, cache_key), self.stream_chunk_samples, self.dtype,
+                                 self.normalize_output, self.clip_noise(plan)), intervals)
+        synthetic_audio = self.render_plan(plan, get_segment, cache_key=cache_key)
+        if self.noise_bank is not None:
+            self.add_background_noise([plan], synthetic_audio[None])
+
+        # Normalize if required; the mix buffer is ours, so it is divided in place
+        if self.normalize_output:
+            synthetic_audio = self.audio_processor.normalize_audio(synthetic_audio, in_place=True)
+
+        return synthetic_audio, intervals
+
+    def placement_origins(self):
+        """Describe every placement of the last synthesized clip, for run manifests.
+
+        Returns one [source, label, source_start, source_end, offset, gain] list per
+        placement, with times in seconds. source is None for clips synthesized from a
+        single recording, which the caller knows.
+        """
+        placements = self.last_plan.placements
+        return [list(self.last_segment_origin(segment_id)) + [round(dest_offset / self.sample_rate, 6), round(gain, 6)]
+                for segment_id, dest_offset, gain in zip(placements['segment_id'].tolist(), placements['dest_offset'].tolist(),
+                                                         placements['gain'].tolist())]
+
+    def source_tiers(self):
+        """Exact (start, end, label) intervals of every segment of the last synthesized clip.
+
+        Tier k holds the k-th segment of every overlap group, so segments that overlap are
+        on different tiers.
+        """
+        plan, segment_index = self.last_plan, self.last_segment_index
+        return plan.source_intervals(self.segment_lengths(segment_index, plan.placements['segment_id']),
+                                     self.placement_labels(plan, segment_index))
+
+    @staticmethod
+    def placement_labels(plan, segment_index):
+        return [segment_index.label_names[code] for code in segment_index.label_codes[plan.placements['segment_id']].tolist()]
+
+    def plan_placements(self, segment_index, num_samples, channels):
+        return self.plan_batch(segment_index, 1, num_samples, channels)[0]
+
+    def plan_batch(self, segment_index, batch_size, num_samples, channels):
+        # Every draw of the batch comes from one generator, seeded from the engine's random state
+        rng = np.random.default_rng(self.random.getrandbits(64))
+        clip_draws = self.draw_groups(segment_index, rng, batch_size, num_samples)
+        clip_sizes = [len(ids) for ids, _ in clip_draws]
+        segment_ids = np.concatenate([ids for ids, _ in clip_draws])
+        lengths = self.segment_lengths(segment_index, segment_ids)
+        # Groups are numbered across the batch, so offsets are solved for every clip at once
+        group_bases = np.cumsum([0] + [int(group_of[-1]) + 1 for _, group_of in clip_draws])
+        batch_groups = np.concatenate([group_of + base for (_, group_of), base in zip(clip_draws, group_bases)])
+
+        # Offsets within each group and gains are drawn for every placement of the batch at once
+        relative_offsets = overlap_offsets(lengths, batch_groups, self.min_overlap, rng.random(len(segment_ids)))
+        gains = self.amplitude_scaling * rng.uniform(0.8, 1.0, len(segment_ids))
+
+        # Effects that add noise get their own seed, so a saved plan re-renders identically
+        effect_seeds = [None] * batch_size
+        if self.effect_chain.noise_snr_db is not None:
+            effect_seeds = rng.integers(0, 2 ** 63, batch_size).tolist()
+        background_seeds = [None] * batch_size
+        if self.noise_bank is not None:
+            background_seeds = rng.integers(0, 2 ** 63, batch_size).tolist()
+
+        plans = []
+        for clip, clip_slice in enumerate(np.split(np.arange(len(segment_ids)), np.cumsum(clip_sizes)[:-1])):
+            group_of = clip_draws[clip][1]
+            dest_offsets, groups = layout_groups(relative_offsets[clip_slice], lengths[clip_slice], group_of,
+                                                 self.silence_samples, num_samples)
+            # Groups pushed past the end of the clip by wider groups before them are dropped
+            kept = group_of < len(groups)
+            placements = np.empty(int(kept.sum()), dtype=PLACEMENT_DTYPE)
+            placements['segment_id'] = segment_ids[clip_slice][kept]
+            placements['dest_offset'] = dest_offsets[kept]
+            placements['gain'] = gains[clip_slice][kept]
+            placements['group'] = group_of[kept]
+            plans.append(PlacementPlan(placements, groups, num_samples, channels, self.sample_rate,
+                                       effect_seeds[clip], background_seeds[clip]))
+        return plans
+
+    def draw_groups(self, segment_index, rng, batch_size, num_samples):
+        """Draw the overlap groups of batch_size clips, returning the segment ids and group numbers of each clip.
+
+        Groups are drawn until they cover the clip; only segment lengths are looked up. A
+        group is at least as long as its longest segment, so this draws enough of them.
+        Group sizes and segments are drawn for all clips at once, in rounds of as many
+        groups as the mean segment length suggests a clip needs; clips not yet covered
+        draw another round, and the groups a clip does not need are dropped.
+        """
+        if not segment_index.num_drawable:
+            raise ValueError("No segments with a non-zero label probability to draw from")
+        mean_width = self.segment_lengths(segment_index, segment_index.ids).mean() + self.silence_samples
+        groups_per_round = int(num_samples / mean_width) + 1 if mean_width > 0 else 1
+
+        clip_groups = [[] for _ in range(batch_size)]
+        positions = np.zeros(batch_size, dtype=np.int64)
+        active = np.arange(batch_size)
+        while len(active):
+            group_sizes = rng.integers(1, self.max_overlaps, size=len(active) * groups_per_round, endpoint=True)
+            segment_ids, group_sizes = segment_index.sample_groups(rng, group_sizes)
+            group_bounds = np.concatenate(([0], np.cumsum(group_sizes)))
+            widths = (np.maximum.reduceat(self.segment_lengths(segment_index, segment_ids), group_bounds[:-1])
+                      + self.silence_samples).reshape(len(active), groups_per_round)
+            if (widths <= 0).any():
+                # Segments stretched to nothing with no silence between groups would never fill the clip
+                raise ValueError("Drew an overlap group of zero length; check time_stretch_factor and silence_duration_ms")
+
+            # A clip keeps the groups that start before its end
+            ends = positions[active, None] + np.cumsum(widths, axis=1)
+            num_kept = np.count_nonzero(ends - widths < num_samples, axis=1)
+            for row, clip in enumerate(active.tolist()):
+                first = row * groups_per_round
+                clip_groups[clip].extend(np.split(segment_ids[group_bounds[first]:group_bounds[first + num_kept[row]]],
+                                                  group_bounds[first + 1:first + num_kept[row]] - group_bounds[first]))
+            positions[active] = ends[:, -1]
+            active = active[ends[:, -1] < num_samples]
+
+        return [(np.concatenate(groups), np.repeat(np.arange(len(groups), dtype=np.int32), [len(ids) for ids in groups]))
+                for groups in clip_groups]
+
+    def synthesize_batch(self, segment_bank, batch_size, dtype=np.float32):
+        """Synthesize batch_size clips from a segment bank in one call.
+
+        Returns a (batch, samples[, channels]) array and the list of TextGrid intervals of
+        each clip.
+        """
+        num_samples = int(self.file_length_seconds * self.sample_rate)
+
+        segment_index = self.get_bank_index(segment_bank)
+        if not len(segment_index):
+            raise ValueError("No valid segments in the segment bank")
+
+        with self.metrics.stage('plan'):
+            plans = self.plan_batch(segment_index, batch_size, num_samples, segment_bank.channels)
+        for plan in plans:
+            self.metrics.count_labels(segment_index.label_names, segment_index.label_codes[plan.placements['segment_id']])
+        shape = (batch_size, num_samples) if segment_bank.channels == 1 else (batch_size, num_samples, segment_bank.channels)
+        batch_audio = np.zeros(shape, dtype=dtype)
+        for clip, plan in enumerate(plans):
+            self.render_plan(plan, lambda segment_id: (segment_bank.get(segment_id), None), out=batch_audio[clip],
+                             cache_key=segment_bank.cache_key)
+        if self.noise_bank is not None:
+            self.add_background_noise(plans, batch_audio)
+
+        # Peak-normalize every clip with one reduction over the batch
+        if self.normalize_output:
+            with self.metrics.stage('normalize'):
+                peaks = np.abs(batch_audio.reshape(batch_size, -1)).max(axis=1)
+                peaks[peaks == 0] = 1
+                batch_audio /= peaks.reshape((batch_size,) + (1,) * (batch_audio.ndim - 1)).astype(dtype)
+
+        return batch_audio, [plan.intervals(placement_labels=self.placement_labels(plan, segment_index)) for plan in plans]
+
+    def clip_noise(self, plan):
+        """Draw the background noise of a clip from its plan's seed, or None without a noise bank."""
+        if self.noise_bank is None:
+            return None
+        return self.noise_bank.clip_noise(np.random.default_rng(plan.background_seed), plan.num_samples, plan.channels,
+                                          self.background_noise['snr_db'])
+
+    def add_background_noise(self, plans, batch_audio):
+        """Mix the background noise of every plan into the matching row of batch_audio, in place."""
+        with self.metrics.stage('background'):
+            clip_noises = [self.clip_noise(plan) for plan in plans]
+            noise = np.stack([clip_noise.block(0, plan.num_samples) for clip_noise, plan in zip(clip_noises, plans)])
+            mix_at_snr(batch_audio, noise, [clip_noise.snr_db for clip_noise in clip_noises])
+
+    def segment_lengths(self, segment_index, segment_ids):
+        # Placement works with segment lengths after effects such as time stretching
+        lengths = segment_index.lengths[segment_ids]
+        return self.effect_chain.output_length(lengths) if self.effect_chain else lengths
+
+    def render_plan(self, plan, get_segment, out=None, cache_key=None):
+        get_audio = self.segment_lookup(plan, get_segment, cache_key)
+        with self.metrics.stage('mix'):
+            return plan.render(get_audio, out=out, dtype=self.dtype)
+
+    def segment_lookup(self, plan, get_segment, cache_key=None):
+        """Return get_audio(segment_id) for the segments of a plan, with effects applied."""
+        if not self.effect_chain:
+            return lambda segment_id: get_segment(segment_id)[0]
+
+        with self.metrics.stage('effects'):
+            segment_ids = np.unique(plan.placements['segment_id']).tolist()
+            processed = self.transform_segments(segment_ids, get_segment, cache_key)
+            rng = np.random.default_rng(plan.effect_seed) if plan.effect_seed is not None else None
+            processed = self.effect_chain.add_noise_batch(processed, rng)
+        return dict(zip(segment_ids, processed)).__getitem__
+
+    def transform_segments(self, segment_ids, get_segment, cache_key=None):
+        # Cached segments are reused; the rest go through the effect chain in one batch
+        if self.effect_cache is None or cache_key is None:
+            return self.effect_chain.transform_batch([get_segment(segment_id)[0] for segment_id in segment_ids])
+
+        chain_key = self.effect_chain.cache_key()
+        keys = [cache_key(segment_id) for segment_id in segment_ids]
+        processed = [self.effect_cache.get(key + chain_key) if key is not None else None for key in keys]
+        missing = [position for position, audio_data in enumerate(processed) if audio_data is None]
+        if missing:
+            transformed = self.effect_chain.transform_batch([get_segment(segment_ids[position])[0] for position in missing])
+            for position, audio_data in zip(missing, transformed):
+                processed[position] = audio_data
+                if keys[position] is not None:
+                    self.effect_cache.put(keys[position] + chain_key, audio_data)
+        return processed
+
+    def extract_segments(self, annotations, vocalization_labels, audio_data, original_sample_rate, origins=None):
+        # origins, when given, receives the (start, end) seconds of every returned segment
         segments = []
         try:
-            # Get the first (and only) tier
-            tier_name = list(textgrid_data.tierDict.keys())[0]
-            tier = textgrid_data.tierDict[tier_name]
-            
-            self.logger.debug(f"Processing tier: {tier_name}")
-            self.logger.debug(f"Vocalization labels from config: {vocalization_labels}")
+            # Per-interval debug messages are only formatted when they will be shown
+            debug = self.logger.debug_enabled
+            if debug:
+                self.logger.debug(f"Processing tier: {annotations.tier_name}")
+                self.logger.debug(f"Vocalization labels from config: {vocalization_labels}")
             
             # Convert vocalization_labels keys to lowercase for case-insensitive comparison
             vocalization_labels = {k.lower(): v for k, v in vocalization_labels.items()}
+
+            # Resample the whole recording once rather than every segment separately
+            if original_sample_rate != self.sample_rate:
+                with self.metrics.stage('resample'):
+                    audio_data = self.audio_processor.resample(audio_data, original_sample_rate, self.sample_rate)
             
-            for interval in tier.entryList:
-                self.logger.debug(f"Processing interval: {interval.start} - {interval.end}, label: {interval.label}")
-                if interval.label.lower() in vocalization_labels:
-                    if self.random.random() < vocalization_labels[interval.label.lower()]:
-                        start_sample = int(interval.start * original_sample_rate)
-                        end_sample = int(interval.end * original_sample_rate)
-                        segment_audio = audio_data[start_sample:end_sample]
-                        
-                        # Resample if necessary
-                        if original_sample_rate != self.sample_rate:
-                            segment_audio = self.audio_processor.resample(segment_audio, original_sample_rate, self.sample_rate)
-                        
-                        segments.append((segment_audio, interval.label))
-                        self.logger.debug(f"Added segment with label: {interval.label}")
-                else:
-                    self.logger.warning(f"Unrecognized label '{interval.label}' in TextGrid. Skipping this interval.")
+            with self.metrics.stage('extract'):
+                # Labels are matched once per distinct label rather than once per interval
+                probabilities = np.array([vocalization_labels.get(label.lower(), -1.0) for label in annotations.label_names])
+                interval_probabilities = probabilities[annotations.label_codes]
+                for code in np.unique(annotations.label_codes[interval_probabilities < 0]):
+                    self.logger.warning(f"Unrecognized label '{annotations.label_names[code]}' in TextGrid. Skipping "
+                                        f"{np.count_nonzero(annotations.label_codes == code)} intervals.")
+
+                # One draw per recognized interval, in file order
+                recognized = np.nonzero(interval_probabilities >= 0)[0]
+                draws = np.array([self.random.random() for _ in range(len(recognized))])
+                selected = recognized[draws < interval_probabilities[recognized]]
+                start_samples = (annotations.starts[selected] * self.sample_rate).astype(np.int64)
+                end_samples = (annotations.ends[selected] * self.sample_rate).astype(np.int64)
+                for interval, start_sample, end_sample in zip(selected.tolist(), start_samples.tolist(), end_samples.tolist()):
+                    label = annotations.label_names[annotations.label_codes[interval]]
+                    segments.append((audio_data[start_sample:end_sample], label))
+                    if origins is not None:
+                        origins.append((float(annotations.starts[interval]), float(annotations.ends[interval])))
+                    if debug:
+                        self.logger.debug(f"Added segment with label: {label} "
+                                          f"({annotations.starts[interval]} - {annotations.ends[interval]})")
             
             if not segments:
                 self.logger.warning("No valid segments found in the TextGrid file.")
@@ -130,49 +400,3 @@ class SynthesisEngine:
             import traceback
             self.logger.error(traceback.format_exc())
         return segments
-
-    def select_segments(self, segments, num_overlaps):
-        return self.random.sample(segments, min(num_overlaps, len(segments)))
-
-    def mix_segments(self, segments, mix_length, amplitude_scaling):
-        # Determine if the audio is stereo or mono
-        is_stereo = len(segments[0][0].shape) > 1 and segments[0][0].shape[1] == 2
-        
-        if is_stereo:
-            mixed_audio = np.zeros((mix_length, 2))
-        else:
-            mixed_audio = np.zeros(mix_length)
-        
-        for segment_audio, label in segments:
-            start = self.random.randint(0, max(0, mix_length - len(segment_audio)))
-            end = min(start + len(segment_audio), mix_length)
-            
-            if is_stereo:
-                mixed_audio[start:end] += segment_audio[:end-start] * amplitude_scaling * self.random.uniform(0.8, 1.0)
-            else:
-                mixed_audio[start:end] += segment_audio[:end-start, np.newaxis] * amplitude_scaling * self.random.uniform(0.8, 1.0)
-        
-        return mixed_audio
-
-    def create_synthetic_textgrid(self, intervals, duration):
-        from praatio import textgrid
-        tg = textgrid.Textgrid()
-        
-        if not intervals:
-            # If no intervals, create a single interval covering the entire duration
-            intervals = [(0, duration, 'silence')]
-        
-        # Ensure the intervals cover the entire duration
-        if intervals[0][0] > 0:
-            intervals.insert(0, (0, intervals[0][0], 'silence'))
-        if intervals[-1][1] < duration:
-            intervals.append((intervals[-1][1], duration, 'silence'))
-        
-        tier = textgrid.IntervalTier('vocalizations', intervals)
-        tg.addTier(tier)
-        return tg
-
-    def apply_audio_effects(self, audio):
-        # Implementation of audio effects application
-        # This should be customized based on your specific audio effect requirements
-        return audio
\ No newline at end of file
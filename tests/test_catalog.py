@@ -0,0 +1,61 @@
+import configparser
+import os
+import shutil
+from catalog import CorpusCatalog
+from config import ConfigManager
+from dataset import SyntheticDataset
+from logger import Logger
+from segment_bank import SegmentBank
+from textgrid_handler import TextGridHandler
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# A directory name containing '.wav' before the extension of the files inside it
+NESTED_DIR = os.path.join('site.wav.d', 'day1')
+
+def nested_corpus(tmp_path):
+    """Copy the sample inputs into a nested directory of both input directories."""
+    input_wav_dir, input_textgrid_dir = tmp_path / 'wav', tmp_path / 'textgrid'
+    os.makedirs(input_wav_dir / NESTED_DIR)
+    os.makedirs(input_textgrid_dir / NESTED_DIR)
+    for name in sorted(os.listdir(os.path.join(REPO_DIR, 'input_wav'))):
+        stem = os.path.splitext(name)[0]
+        shutil.copy(os.path.join(REPO_DIR, 'input_wav', name), input_wav_dir / NESTED_DIR / f"calls_{stem}.wav")
+        shutil.copy(os.path.join(REPO_DIR, 'input_textgrid', f"{stem}.TextGrid"),
+                    input_textgrid_dir / NESTED_DIR / f"calls_{stem}.TextGrid")
+    return str(input_wav_dir), str(input_textgrid_dir)
+
+def write_config(tmp_path, input_wav_dir, input_textgrid_dir):
+    config = configparser.ConfigParser()
+    config.read(os.path.join(REPO_DIR, 'config.ini'))
+    config['Paths'].update({'input_wav_dir': input_wav_dir, 'input_textgrid_dir': input_textgrid_dir,
+                            'output_wav_dir': str(tmp_path / 'out_wav'), 'output_textgrid_dir': str(tmp_path / 'out_textgrid'),
+                            'log_dir': str(tmp_path / 'logs'), 'segment_bank_dir': str(tmp_path / 'bank')})
+    for directory in ('logs', 'out_wav', 'out_textgrid'):
+        os.makedirs(tmp_path / directory, exist_ok=True)
+    config_path = tmp_path / 'config.ini'
+    with open(config_path, 'w') as f:
+        config.write(f)
+    return ConfigManager(str(config_path)).snapshot()
+
+def test_recordings_are_read_with_the_textgrid_the_catalog_paired(tmp_path):
+    input_wav_dir, input_textgrid_dir = nested_corpus(tmp_path)
+    config_manager = write_config(tmp_path, input_wav_dir, input_textgrid_dir)
+    logger = Logger(0, config_manager.get('Paths', 'log_dir'))
+    catalog = CorpusCatalog.build(input_wav_dir, input_textgrid_dir, TextGridHandler(), logger)
+
+    wav_files = catalog.wav_files()
+    textgrid_files = catalog.textgrid_files()
+    assert len(wav_files) == len(os.listdir(os.path.join(input_wav_dir, NESTED_DIR)))
+    for wav_file in wav_files:
+        assert textgrid_files[wav_file] == os.path.splitext(wav_file)[0] + '.TextGrid'
+
+    dataset = SyntheticDataset(config_manager, logger, wav_files=wav_files, textgrid_files=textgrid_files)
+    prepared = dataset.prepare(1)
+    assert prepared['source'] in wav_files
+    assert len(prepared['annotations'])
+
+    bank = SegmentBank.load_or_build(config_manager.get('Paths', 'segment_bank_dir'), wav_files, input_wav_dir,
+                                     input_textgrid_dir, dataset.audio_processor, dataset.textgrid_handler,
+                                     config_manager.get_vocalization_labels(), logger, textgrid_files)
+    assert len(bank.lengths)
+    assert set(bank.source_files) == set(wav_files)
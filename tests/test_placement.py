@@ -0,0 +1,56 @@
+import math
+import numpy as np
+import pytest
+from placement import GROUP_DTYPE, PLACEMENT_DTYPE, PlacementPlan, overlap_offsets
+
+def random_plan(channels, num_samples=20000, seed=0):
+    """A plan of overlapping groups whose last group is cut at the end of the clip, with its segments."""
+    rng = np.random.default_rng(seed)
+    tail = () if channels == 1 else (channels,)
+    segments = [rng.uniform(-1, 1, size=(int(length),) + tail) for length in rng.integers(50, 3000, size=12)]
+    placements, groups = [], []
+    start = 0
+    while start < num_samples:
+        members = rng.choice(len(segments), size=int(rng.integers(1, 4)), replace=False)
+        offsets = start + rng.integers(0, 500, size=len(members))
+        end = max(int(offset) + len(segments[member]) for offset, member in zip(offsets, members))
+        for member, offset in zip(members, offsets):
+            placements.append((int(member), int(offset), float(rng.uniform(0.1, 1.0)), len(groups)))
+        groups.append((start, min(end, num_samples)))
+        start = end + int(rng.integers(0, 400))
+    plan = PlacementPlan(np.array(placements, dtype=PLACEMENT_DTYPE), np.array(groups, dtype=GROUP_DTYPE),
+                         num_samples, channels, 44100)
+    return plan, segments
+
+@pytest.mark.parametrize('channels', [1, 2])
+@pytest.mark.parametrize('chunk_samples', [1, 997, 4096, 20000, 50000])
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_render_chunks_equals_render(channels, chunk_samples, dtype):
+    plan, segments = random_plan(channels)
+    get_audio = segments.__getitem__
+    rendered = plan.render(get_audio, dtype=dtype)
+    chunks = list(plan.render_chunks(get_audio, chunk_samples, dtype=dtype))
+    assert all(len(chunk) <= chunk_samples for chunk in chunks)
+    streamed = np.concatenate(chunks, axis=0)
+    assert streamed.dtype == rendered.dtype
+    # Every sample sums the same placements in the same order, so the mix is bit-identical
+    np.testing.assert_array_equal(streamed, rendered)
+
+@pytest.mark.parametrize('min_overlap', [0.0, 0.2, 0.5, 1.0])
+def test_overlap_offsets_meet_the_minimum_overlap(min_overlap):
+    rng = np.random.default_rng(4)
+    group_of = np.repeat(np.arange(1000), rng.integers(1, 5, size=1000))
+    lengths = rng.integers(1, 5000, size=len(group_of))
+    # Include the extremes of the draw range
+    draws = rng.random(len(lengths))
+    draws[:100] = 0.0
+    draws[100:200] = np.nextafter(1.0, 0.0)
+    offsets = overlap_offsets(lengths, group_of, min_overlap, draws)
+
+    for group in np.unique(group_of):
+        members = np.flatnonzero(group_of == group)
+        anchor = members[np.argmax(lengths[members])]
+        assert offsets[anchor] == 0
+        for member in members:
+            overlap = min(offsets[member] + lengths[member], lengths[anchor]) - max(offsets[member], 0)
+            assert overlap >= math.ceil(min_overlap * lengths[member])
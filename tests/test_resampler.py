@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from scipy import signal
+from resampler import output_length, resample, resample_blocks
+
+RATES = [(44100, 48000), (48000, 16000), (22050, 44100), (96000, 44100)]
+
+def recording(num_samples, channels, dtype=np.float64):
+    audio_data = np.random.default_rng(num_samples).uniform(-1, 1, size=(num_samples, channels))
+    return audio_data.astype(dtype)
+
+@pytest.mark.parametrize('orig_sr, target_sr', RATES)
+@pytest.mark.parametrize('channels', [1, 2])
+def test_resample_matches_resample_poly(orig_sr, target_sr, channels):
+    audio_data = recording(30011, channels)
+    divisor = np.gcd(orig_sr, target_sr)
+    expected = signal.resample_poly(audio_data, target_sr // divisor, orig_sr // divisor, axis=0)
+    resampled = resample(audio_data, orig_sr, target_sr)
+    assert len(resampled) == output_length(len(audio_data), orig_sr, target_sr)
+    np.testing.assert_allclose(resampled, expected, rtol=0, atol=1e-12)
+
+@pytest.mark.parametrize('orig_sr, target_sr', RATES)
+@pytest.mark.parametrize('block_size, chunk_size', [(1000, 4096), (7919, 2000), (50000, 1 << 20)])
+def test_resample_blocks_matches_one_shot(orig_sr, target_sr, block_size, chunk_size):
+    audio_data = recording(40009, 2)
+    blocks = (audio_data[start:start + block_size] for start in range(0, len(audio_data), block_size))
+    streamed = np.concatenate(list(resample_blocks(blocks, orig_sr, target_sr, chunk_size)), axis=0)
+    expected = resample(audio_data, orig_sr, target_sr)
+    assert streamed.shape == expected.shape
+    np.testing.assert_allclose(streamed, expected, rtol=0, atol=1e-12)
+
+def test_float32_stays_float32():
+    audio_data = recording(10007, 1, np.float32)
+    assert resample(audio_data, 44100, 48000).dtype == np.float32
+    streamed = np.concatenate(list(resample_blocks([audio_data[:5000], audio_data[5000:]], 44100, 48000, 2048)))
+    assert streamed.dtype == np.float32
+
+def test_same_rate_is_passed_through():
+    audio_data = recording(100, 1)
+    assert resample(audio_data, 48000, 48000) is audio_data
+    blocks = [audio_data[:50], audio_data[50:]]
+    streamed = list(resample_blocks(blocks, 48000, 48000))
+    assert len(streamed) == len(blocks) and all(out is block for out, block in zip(streamed, blocks))
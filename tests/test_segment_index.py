@@ -0,0 +1,75 @@
+import random
+import numpy as np
+import pytest
+from segment_index import SegmentIndex
+
+# At 1000 Hz a length in samples is also its duration in ms
+SAMPLE_RATE = 1000
+LABEL_NAMES = ['PC', 'NC', 'MC', 'N']
+
+@pytest.fixture
+def segments():
+    rng = np.random.default_rng(0)
+    return rng.integers(10, 3000, size=500), rng.integers(0, len(LABEL_NAMES), size=500)
+
+def matching(lengths, label_codes, label=None, min_length_ms=None, max_length_ms=None, excluded=()):
+    keep = np.isin(label_codes, [code for code, name in enumerate(LABEL_NAMES) if name not in excluded])
+    if label is not None:
+        keep &= label_codes == LABEL_NAMES.index(label)
+    if min_length_ms is not None:
+        keep &= lengths >= min_length_ms
+    if max_length_ms is not None:
+        keep &= lengths <= max_length_ms
+    return set(np.flatnonzero(keep).tolist())
+
+@pytest.mark.parametrize('label, min_length_ms, max_length_ms', [
+    (None, None, None),
+    ('NC', None, None),
+    (None, 500, 1500),
+    ('MC', 995, 1005),
+    ('pc', 0, 40),
+    ('N', 2999, None),
+])
+def test_sample_respects_label_and_duration(segments, label, min_length_ms, max_length_ms):
+    lengths, label_codes = segments
+    index = SegmentIndex(lengths, label_codes, LABEL_NAMES, SAMPLE_RATE)
+    expected = matching(lengths, label_codes, label and label.upper(), min_length_ms, max_length_ms)
+    assert index.count(label, min_length_ms, max_length_ms) == len(expected)
+
+    rng = random.Random(1)
+    for k in (1, 5, len(expected), len(expected) + 10):
+        chosen = index.sample(rng, k, label, min_length_ms, max_length_ms)
+        assert len(chosen) == min(k, len(expected))
+        assert len(set(chosen)) == len(chosen)
+        assert set(chosen) <= expected
+
+def test_sample_skips_labels_of_zero_probability(segments):
+    lengths, label_codes = segments
+    index = SegmentIndex(lengths, label_codes, LABEL_NAMES, SAMPLE_RATE, label_weights={'pc': 1.0, 'nc': 0.5})
+    expected = matching(lengths, label_codes, excluded=('MC', 'N'))
+    # Unconstrained draws use the precomputed weights, constrained ones the matching runs
+    assert set(index.sample(random.Random(2), len(lengths))) == expected
+    assert set(index.sample(random.Random(2), len(lengths), min_length_ms=0)) == expected
+
+def test_length_limits_are_applied_at_build_time(segments):
+    lengths, label_codes = segments
+    index = SegmentIndex(lengths, label_codes, LABEL_NAMES, SAMPLE_RATE, min_length_ms=100, max_length_ms=2000)
+    expected = matching(lengths, label_codes, min_length_ms=100, max_length_ms=2000)
+    assert len(index) == len(expected)
+    assert set(index.sample(random.Random(3), len(lengths))) == expected
+
+def test_sample_groups_draws_distinct_segments_per_group(segments):
+    lengths, label_codes = segments
+    index = SegmentIndex(lengths, label_codes, LABEL_NAMES, SAMPLE_RATE, label_weights={'pc': 1.0, 'nc': 0.5})
+    expected = matching(lengths, label_codes, excluded=('MC', 'N'))
+    group_sizes = np.random.default_rng(5).integers(1, 4, size=2000)
+    group_sizes[:3] = len(lengths)
+
+    segment_ids, sizes = index.sample_groups(np.random.default_rng(6), group_sizes)
+    np.testing.assert_array_equal(sizes, np.minimum(group_sizes, len(expected)))
+    assert len(segment_ids) == sizes.sum()
+    for group in np.split(segment_ids, np.cumsum(sizes)[:-1]):
+        assert len(set(group.tolist())) == len(group)
+        assert set(group.tolist()) <= expected
+    # A group asking for more than can be drawn gets every drawable segment
+    assert set(segment_ids[:sizes[0]].tolist()) == expected
@@ -0,0 +1,90 @@
+import configparser
+import os
+import pytest
+from config import ConfigManager
+from dataset import SyntheticDataset
+from logger import Logger
+from main import create_shard_writer, create_synthetic_file
+from shards import ShardReader, consolidate_index, export_shards
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The source of index 0 has no segments within the configured lengths
+INDICES = [1, 2, 3]
+
+def run(tmp_path, name, output_format, processing_dtype, output_subtype):
+    """Create the clips of INDICES as main does, with the repository's config.ini and sample inputs."""
+    config = configparser.ConfigParser()
+    config.read(os.path.join(REPO_DIR, 'config.ini'))
+    run_dir = tmp_path / name
+    paths = {'input_wav_dir': os.path.join(REPO_DIR, 'input_wav'),
+             'input_textgrid_dir': os.path.join(REPO_DIR, 'input_textgrid'),
+             'output_wav_dir': str(run_dir / 'wav'), 'output_textgrid_dir': str(run_dir / 'textgrid'),
+             'output_shard_dir': str(run_dir / 'shards'), 'log_dir': str(run_dir / 'logs')}
+    config['Paths'].update(paths)
+    config['Synthesis']['file_length_seconds'] = '5'
+    config['AudioProperties']['processing_dtype'] = processing_dtype
+    config['Output']['output_format'] = output_format
+    config['Output']['output_subtype'] = output_subtype
+    # Shards default to the processing dtype
+    config.remove_option('Output', 'shard_dtype')
+    config['Performance']['thread_count'] = '1'
+    config_path = run_dir / 'config.ini'
+    for directory in ('log_dir', 'output_wav_dir', 'output_textgrid_dir'):
+        os.makedirs(paths[directory], exist_ok=True)
+    with open(config_path, 'w') as f:
+        config.write(f)
+
+    config_manager = ConfigManager(str(config_path)).snapshot()
+    logger = Logger(0, paths['log_dir'])
+    wav_files = sorted(name for name in os.listdir(paths['input_wav_dir']) if name.endswith('.wav'))
+    dataset = SyntheticDataset(config_manager, logger, wav_files=wav_files)
+    shard_writer = create_shard_writer(config_manager, 'part-main')
+    for index in INDICES:
+        assert create_synthetic_file(index, config_manager, logger, dataset, shard_writer)
+    if shard_writer is not None:
+        shard_writer.close()
+        consolidate_index(paths['output_shard_dir'])
+    return paths
+
+def read_output(file_path):
+    with open(file_path, 'rb') as f:
+        data = bytearray(f.read())
+    # libsndfile stamps the write time into the PEAK chunk of float WAVs
+    peak = data.find(b'PEAK', 12)
+    if data.startswith(b'RIFF') and peak >= 0:
+        data[peak + 12:peak + 16] = bytes(4)
+    return bytes(data)
+
+def assert_same_outputs(direct, sharded):
+    for directory in ('output_wav_dir', 'output_textgrid_dir'):
+        names = sorted(os.listdir(direct[directory]))
+        assert len(names) == len(INDICES)
+        assert sorted(os.listdir(sharded[directory])) == names
+        for name in names:
+            assert read_output(os.path.join(direct[directory], name)) == \
+                read_output(os.path.join(sharded[directory], name)), name
+
+@pytest.mark.parametrize('processing_dtype, output_subtype', [
+    ('float64', 'PCM_16'),
+    ('float64', 'PCM_24'),
+    ('float32', 'FLOAT'),
+])
+def test_exported_shards_match_direct_output(tmp_path, processing_dtype, output_subtype):
+    direct = run(tmp_path, 'direct', 'files', processing_dtype, output_subtype)
+    sharded = run(tmp_path, 'sharded', 'shards', processing_dtype, output_subtype)
+    export_shards(sharded['output_shard_dir'], sharded['output_wav_dir'], sharded['output_textgrid_dir'], 'synthetic_')
+
+    assert_same_outputs(direct, sharded)
+
+def test_rerun_into_shard_dir_indexes_each_clip_once(tmp_path):
+    direct = run(tmp_path, 'direct', 'files', 'float64', 'PCM_16')
+    run(tmp_path, 'sharded', 'shards', 'float64', 'PCM_16')
+    sharded = run(tmp_path, 'sharded', 'shards', 'float64', 'PCM_16')
+
+    reader = ShardReader(sharded['output_shard_dir'])
+    assert len(reader) == len(INDICES)
+    assert reader.indices() == INDICES
+
+    export_shards(sharded['output_shard_dir'], sharded['output_wav_dir'], sharded['output_textgrid_dir'], 'synthetic_')
+    assert_same_outputs(direct, sharded)
@@ -0,0 +1,60 @@
+import pytest
+from praatio import textgrid
+from textgrid_handler import TextGridHandler, parse_textgrid
+
+# Labels with quotes, surrounding whitespace and non-ASCII characters, between unlabeled gaps
+INTERVALS = [(0.25, 0.5, 'PC'), (0.75, 1.125, 'say "hi"'), (1.125, 2.0, ' NC '), (2.5, 3.1, 'Hühner'), (3.1, 3.3, '""')]
+BYTE_ORDER_MARKS = {'utf-16-le': b'\xff\xfe', 'utf-16-be': b'\xfe\xff'}
+
+def write_textgrid(file_path, text_format, encoding):
+    tg = textgrid.Textgrid()
+    tg.addTier(textgrid.PointTier('calls', [(0.3, 'a'), (2.7, 'b "x"')], 0, 4.0))
+    tg.addTier(textgrid.IntervalTier('vocalizations', INTERVALS, 0, 4.0))
+    tg.addTier(textgrid.IntervalTier('other', [(1.0, 2.0, 'MC')], 0, 4.0))
+    tg.save(str(file_path), format=text_format, includeBlankSpaces=True)
+    if encoding != 'utf-8':
+        # Praat writes UTF-16 with a byte order mark when labels are not plain ASCII
+        text = file_path.read_text(encoding='utf-8')
+        file_path.write_bytes(BYTE_ORDER_MARKS[encoding] + text.encode(encoding))
+
+@pytest.mark.parametrize('text_format', ['short_textgrid', 'long_textgrid'])
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-16-le', 'utf-16-be'])
+def test_read_textgrid_matches_praatio(tmp_path, text_format, encoding):
+    file_path = tmp_path / 'test.TextGrid'
+    write_textgrid(file_path, text_format, encoding)
+
+    expected = textgrid.openTextgrid(str(file_path), includeEmptyIntervals=True)
+    tier = expected.tierDict['vocalizations']
+    annotations = TextGridHandler().read_textgrid(str(file_path))
+    assert annotations.tier_name == tier.name
+    assert (annotations.xmin, annotations.xmax) == (tier.minTimestamp, tier.maxTimestamp)
+    assert annotations.intervals() == [(entry.start, entry.end, entry.label) for entry in tier.entryList]
+    # Blank intervals are kept, with an empty label
+    assert '' in annotations.labels()
+
+def test_parse_textgrid_skips_point_tiers_in_short_format():
+    text = '\n'.join(['File type = "ooTextFile"', 'Object class = "TextGrid"', '', '0', '2', '<exists>', '2',
+                      '"TextTier"', '"points"', '0', '2', '2', '0.5', '"1.5"', '1', '"x"',
+                      '"IntervalTier"', '"vocalizations"', '0', '2', '2', '0', '1', '"PC"', '1', '2', '""'])
+    annotations = parse_textgrid(text)
+    assert annotations.tier_name == 'vocalizations'
+    assert annotations.intervals() == [(0.0, 1.0, 'PC'), (1.0, 2.0, '')]
+
+def test_parse_textgrid_rejects_other_files():
+    with pytest.raises(ValueError):
+        parse_textgrid('not a TextGrid')
+
+def test_cache_entry_is_overwritten_when_textgrid_changes(tmp_path):
+    file_path = tmp_path / 'test.TextGrid'
+    cache_dir = tmp_path / 'cache'
+    write_textgrid(file_path, 'short_textgrid', 'utf-8')
+    handler = TextGridHandler(cache_dir=str(cache_dir))
+    assert handler.read_textgrid(str(file_path)).intervals() == handler.read_textgrid(str(file_path)).intervals()
+
+    tg = textgrid.Textgrid()
+    tg.addTier(textgrid.IntervalTier('vocalizations', [(0.5, 1.0, 'PC')], 0, 2.0))
+    tg.save(str(file_path), format='short_textgrid', includeBlankSpaces=True)
+    annotations = handler.read_textgrid(str(file_path))
+    assert annotations.intervals() == [(0.0, 0.5, ''), (0.5, 1.0, 'PC'), (1.0, 2.0, '')]
+    assert TextGridHandler(cache_dir=str(cache_dir)).read_textgrid(str(file_path)).intervals() == annotations.intervals()
+    assert len(list(cache_dir.iterdir())) == 1
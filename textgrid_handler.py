@@ -1,33 +1,235 @@
-from praatio import textgrid
+import hashlib
+import os
+import pickle
+import re
+import numpy as np
+from metrics import RunMetrics
+from utils import ensure_dir
+
+# Values of a short TextGrid in file order: quoted strings ("" escapes a quote), numbers
+# and <flags>
+_TOKEN_PATTERN = re.compile(r'"(?:[^"]|"")*"|<[a-z]+>|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
+# Long TextGrids are split into tiers, and the intervals of a tier are matched in one pass
+_LONG_FORMAT_PATTERN = re.compile(r'^[ \t]*xmin[ \t]*=', re.MULTILINE)
+_LONG_TIER_PATTERN = re.compile(r'item[ \t]*\[\d+\][ \t]*:')
+_LONG_TIER_FIELD_PATTERN = re.compile(r'(class|name|xmin|xmax)[ \t]*=[ \t]*("(?:[^"]|"")*"|\S+)')
+_LONG_INTERVAL_PATTERN = re.compile(r'xmin[ \t]*=[ \t]*(\S+)\s+xmax[ \t]*=[ \t]*(\S+)\s+text[ \t]*=[ \t]*("(?:[^"]|"")*")')
+
+class Annotations:
+    """The intervals of one TextGrid interval tier as NumPy arrays.
+
+    ``starts`` and ``ends`` hold the interval bounds in seconds and ``label_codes`` indexes
+    ``label_names``. Empty intervals are kept, with label "".
+    """
+
+    def __init__(self, starts, ends, label_codes, label_names, tier_name='', xmin=0.0, xmax=None):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        self.label_codes = np.asarray(label_codes, dtype=np.int32)
+        self.label_names = list(label_names)
+        self.tier_name = tier_name
+        self.xmin = xmin
+        self.xmax = xmax if xmax is not None else (float(self.ends[-1]) if len(self.ends) else 0.0)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def labels(self):
+        return [self.label_names[code] for code in self.label_codes]
+
+    def intervals(self):
+        """Return the intervals as a list of (start, end, label) tuples."""
+        return list(zip(self.starts.tolist(), self.ends.tolist(), self.labels()))
 
 class TextGridHandler:
+    """Reads and writes TextGrids.
+
+    ``read_textgrid`` parses the first interval tier of a long or short format TextGrid
+    into ``Annotations``. With ``cache_dir`` set, parsed annotations are kept there and
+    reused while the TextGrid's modification time and size match the ones stored with them.
+    """
+
+    def __init__(self, metrics=None, cache_dir=None):
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.cache_dir = cache_dir
+        if cache_dir:
+            ensure_dir(cache_dir)
+
     def read_textgrid(self, file_path):
-        return textgrid.openTextgrid(file_path, includeEmptyIntervals=True)
+        stat = os.stat(file_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        if self.cache_dir:
+            cache_path = self._cache_path(file_path)
+            if os.path.exists(cache_path):
+                with self.metrics.stage('parse'):
+                    with open(cache_path, 'rb') as f:
+                        cached_version, annotations = pickle.load(f)
+                if cached_version == version:
+                    return annotations
+
+        self.metrics.add_bytes_read(stat.st_size)
+        with self.metrics.stage('parse'):
+            with open(file_path, 'rb') as f:
+                annotations = parse_textgrid(_decode(f.read()))
+        if self.cache_dir:
+            # Several workers may parse the same file; publish the entry atomically
+            temp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                pickle.dump((version, annotations), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, cache_path)
+        return annotations
+
+    def _cache_path(self, file_path):
+        # One entry per file, overwritten when the file changes
+        key = os.path.abspath(file_path)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pkl')
 
     def write_textgrid(self, file_path, tg_data):
-        tg_data.save(file_path, format="short_textgrid", includeBlankSpaces=True)
+        with self.metrics.stage('write'):
+            tg_data.save(file_path, format="short_textgrid", includeBlankSpaces=True)
+        self.metrics.add_bytes_written(os.path.getsize(file_path))
+
+    def write_intervals(self, file_path, intervals, duration, tier_name='vocalizations'):
+        """Write sorted, non-overlapping (start, end, label) intervals as a one-tier short TextGrid.
+
+        The layout matches ``create_synthetic_textgrid`` saved with ``write_textgrid``:
+        the spans before the first and after the last interval are labeled 'silence' and
+        gaps between intervals are filled with empty intervals.
+        """
+        self.write_tiers(file_path, [(tier_name, intervals)], duration)
 
-    def create_synthetic_textgrid(self, intervals, duration):
+    def write_tiers(self, file_path, tiers, duration):
+        """Write (tier name, intervals) tiers as a short TextGrid, each laid out as in ``write_intervals``."""
+        with self.metrics.stage('write'):
+            lines = ['File type = "ooTextFile"', 'Object class = "TextGrid"', '',
+                     _format_time(0), _format_time(duration), '<exists>', str(len(tiers))]
+            for tier_name, intervals in tiers:
+                entries = _tier_entries(intervals, duration)
+                lines.extend(('"IntervalTier"', '"%s"' % tier_name.replace('"', '""'), _format_time(0),
+                              _format_time(duration), str(len(entries))))
+                for start, end, label in entries:
+                    lines.extend((_format_time(start), _format_time(end), '"%s"' % label.replace('"', '""')))
+            text = '\n'.join(lines) + '\n'
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+        self.metrics.add_bytes_written(len(text.encode('utf-8')))
+
+    @staticmethod
+    def create_synthetic_textgrid(intervals, duration):
+        """Build a praatio TextGrid with one 'vocalizations' tier holding intervals.
+
+        The spans before the first and after the last interval are labeled 'silence'.
+        """
+        # praatio is only needed for these objects; TextGrids are read and written without it
+        from praatio import textgrid
         tg = textgrid.Textgrid()
-        tier = textgrid.IntervalTier('vocalizations', [])
-        
-        for start, end, label in intervals:
-            tier.addInterval(textgrid.Interval(start, end, label))
-        
-        # Add a final interval to cover any remaining time
-        if intervals:
-            last_end = max(end for _, end, _ in intervals)
-            if last_end < duration:
-                tier.addInterval(textgrid.Interval(last_end, duration, ''))
-        else:
-            tier.addInterval(textgrid.Interval(0, duration, ''))
-        
+
+        if not intervals:
+            # If no intervals, create a single interval covering the entire duration
+            intervals = [(0, duration, 'silence')]
+
+        # Ensure the intervals cover the entire duration
+        intervals = list(intervals)
+        if intervals[0][0] > 0:
+            intervals.insert(0, (0, intervals[0][0], 'silence'))
+        if intervals[-1][1] < duration:
+            intervals.append((intervals[-1][1], duration, 'silence'))
+
+        tier = textgrid.IntervalTier('vocalizations', intervals)
         tg.addTier(tier)
         return tg
 
-    def extract_vocalization_segments(self, tg_data, labels):
-        segments = []
-        for interval in tg_data.tierDict['vocalizations'].entryList:
-            if interval.label in labels:
-                segments.append((interval.start, interval.end, interval.label))
-        return segments
\ No newline at end of file
+    def extract_vocalization_segments(self, annotations, labels):
+        return [(start, end, label) for start, end, label in annotations.intervals() if label in labels]
+
+def parse_textgrid(text):
+    """Parse the first interval tier of a long or short format TextGrid into Annotations."""
+    if not text.lstrip().startswith('File type = "ooTextFile') or '"TextGrid"' not in text[:200]:
+        raise ValueError("Not a text TextGrid file")
+    header_end = text.find('"IntervalTier"')
+    if _LONG_FORMAT_PATTERN.search(text, 0, header_end if header_end >= 0 else len(text)):
+        return _parse_long(text)
+    return _parse_short(text)
+
+def _parse_long(text):
+    for tier_text in _LONG_TIER_PATTERN.split(text)[1:]:
+        # The tier's own fields come before its first interval
+        fields = {}
+        for match in _LONG_TIER_FIELD_PATTERN.finditer(tier_text):
+            fields.setdefault(match.group(1), match.group(2))
+            if len(fields) == 4:
+                break
+        if _unquote(fields['class']) != 'IntervalTier':
+            continue
+        intervals = _LONG_INTERVAL_PATTERN.findall(tier_text)
+        return _annotations([start for start, _, _ in intervals], [end for _, end, _ in intervals],
+                            [label for _, _, label in intervals], _unquote(fields['name']),
+                            float(fields['xmin']), float(fields['xmax']))
+    raise ValueError("TextGrid has no interval tier")
+
+def _parse_short(text):
+    tokens = _TOKEN_PATTERN.findall(text)
+    if len(tokens) < 6 or tokens[4] != '<exists>':
+        raise ValueError("TextGrid has no tiers")
+
+    # Header: file type, object class, xmin, xmax, <exists>, number of tiers
+    position = 6
+    for _ in range(int(tokens[5])):
+        tier_class, tier_name = _unquote(tokens[position]), _unquote(tokens[position + 1])
+        xmin, xmax, size = float(tokens[position + 2]), float(tokens[position + 3]), int(tokens[position + 4])
+        position += 5
+        if tier_class != 'IntervalTier':
+            # Point tiers hold (time, mark) pairs
+            position += 2 * size
+            continue
+        entries = tokens[position:position + 3 * size]
+        return _annotations(entries[0::3], entries[1::3], entries[2::3], tier_name, xmin, xmax)
+    raise ValueError("TextGrid has no interval tier")
+
+def _annotations(starts, ends, label_tokens, tier_name, xmin, xmax):
+    label_names, label_lookup = [], {}
+    label_codes = np.empty(len(label_tokens), dtype=np.int32)
+    for index, token in enumerate(label_tokens):
+        code = label_lookup.get(token)
+        if code is None:
+            # Labels are stripped of surrounding whitespace, as praatio does
+            label = _unquote(token).strip()
+            code = label_names.index(label) if label in label_names else len(label_names)
+            if code == len(label_names):
+                label_names.append(label)
+            label_lookup[token] = code
+        label_codes[index] = code
+    return Annotations(np.array(starts, dtype=np.float64), np.array(ends, dtype=np.float64),
+                       label_codes, label_names, tier_name, xmin, xmax)
+
+def _tier_entries(intervals, duration):
+    """Fill the gaps of sorted intervals: 'silence' at either end, empty intervals between."""
+    entries = []
+    position = 0
+    if not intervals:
+        entries.append((0, duration, 'silence'))
+    for index, (start, end, label) in enumerate(intervals):
+        if start > position:
+            entries.append((position, start, 'silence' if index == 0 else ''))
+        entries.append((start, end, label))
+        position = end
+    if entries[-1][1] < duration:
+        entries.append((entries[-1][1], duration, 'silence'))
+    return entries
+
+def _decode(data):
+    # Praat writes UTF-16 with a byte order mark when labels are not plain ASCII
+    if data.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return data.decode('utf-16')
+    return data.decode('utf-8-sig')
+
+def _unquote(token):
+    return token[1:-1].replace('""', '"')
+
+def _format_time(value):
+    # Same number formatting as praatio: integers without a decimal point, otherwise repr
+    value = float(value)
+    if abs(value - int(value)) <= 1e-14 * max(abs(value), abs(int(value))):
+        return "%d" % value
+    return repr(value)